@@ -0,0 +1,567 @@
+# ploev
+# Copyright (C) 2017 Alexey Londkevich <vyvojer@gmail.com>
+
+# ploev is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# ploev is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" asyncio classes for working with Odds Oracle and PQL
+
+Usage:
+    async def main():
+        odds_oracle = AsyncOddsOracle(concurrency=16)
+        await odds_oracle.connect()
+        pql = AsyncPql(odds_oracle)
+        equities = await asyncio.gather(*[pql.hero_equity(hero, [villain], board) for board in boards])
+        await odds_oracle.close()
+"""
+
+import asyncio
+import functools
+import time
+import xmlrpc.client
+from typing import Iterable, List
+
+from ploev.cache import Cache
+from ploev.ppt import EquityEstimate, OddsOracle, Pql, PqlResult
+from ploev.samples import sample_trials
+
+
+class _HttpConnection:
+    """ HTTP/1.1 connection to xmlrpc server
+
+    Attributes:
+        bytes_received (int): size of the last response body on the wire
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.keep_alive = True
+        self.bytes_received = 0
+
+    @classmethod
+    async def open(cls, host: str, port: int):
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    def is_usable(self) -> bool:
+        return self.keep_alive and not self.writer.is_closing() and not self.reader.at_eof()
+
+    async def post(self, host: str, path: str, body: bytes, encoding: str = None) -> bytes:
+        """ Sends POST request and returns decoded body of response
+
+        Args:
+            host (str): host:port of the server
+            path (str): path of the request
+            body (bytes): body of the request, already encoded if encoding is provided
+            encoding (str): Content-Encoding of the body, for example 'gzip'
+
+        Raises:
+            xmlrpc.client.ProtocolError: if status of response isn't 200
+            ConnectionError: if connection was closed before response
+        """
+        head = ('POST {path} HTTP/1.1\r\n'
+                'Host: {host}\r\n'
+                'User-Agent: ploev\r\n'
+                'Content-Type: text/xml\r\n'
+                'Accept-Encoding: gzip\r\n'
+                '{encoding}'
+                'Content-Length: {length}\r\n'
+                '\r\n').format(path=path, host=host, length=len(body),
+                                encoding='' if encoding is None else 'Content-Encoding: {}\r\n'.format(encoding))
+        self.bytes_received = 0
+        self.writer.write(head.encode('latin-1') + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError('Connection closed by server')
+        version, status, reason = (status_line.decode('latin-1').rstrip('\r\n').split(' ', 2) + [''])[:3]
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('connection', '').lower() == 'close' or version == 'HTTP/1.0':
+            self.keep_alive = False
+        if 'content-length' in headers:
+            response = await self.reader.readexactly(int(headers['content-length']))
+        elif headers.get('transfer-encoding', '').lower() == 'chunked':
+            response = await self._read_chunked()
+        else:
+            response = await self.reader.read()
+            self.keep_alive = False
+        self.bytes_received = len(response)
+        if int(status) != 200:
+            self.keep_alive = False
+            raise xmlrpc.client.ProtocolError(host + path, int(status), reason, headers)
+        if headers.get('content-encoding', '').lower() == 'gzip':
+            response = xmlrpc.client.gzip_decode(response)
+        return response
+
+    async def _read_chunked(self) -> bytes:
+        chunks = []
+        while True:
+            size = int((await self.reader.readline()).split(b';')[0], 16)
+            if size == 0:
+                # trailer
+                while (await self.reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                return b''.join(chunks)
+            chunks.append(await self.reader.readexactly(size))
+            await self.reader.readexactly(2)
+
+    def close(self):
+        self.writer.close()
+
+
+class AsyncOddsOracle(OddsOracle):
+    """Represent OddsOracle xmlrpc server for asyncio
+
+    pql() and equity() are coroutines. Not more than 'concurrency' queries are sent to the server simultaneously,
+    HTTP connections are kept alive and reused. timeout, gzip_threshold and transport_stats work as for OddsOracle.
+    The constructor doesn't connect to the server, await connect() to check it or to run it. There are no batches
+    (batch() raises TypeError), queries are sent simultaneously with asyncio.gather instead.
+
+    Attributes:
+        concurrency (int): max number of simultaneous queries
+    """
+
+    def __init__(self, host: str = None, port: str = None,
+                 trials: int = None, seconds: int = None, threads: int = None,
+                 syntax: str = None, game: str = None, cache: Cache = None,
+                 canonicalize: bool = True, merge_samples: bool = False, compact: bool = True,
+                 concurrency: int = 8, timeout: float = None, gzip_threshold: int = None):
+        """
+        Args:
+            host (str): host of xmlrpc server
+            port (str): port of xmlrpc server
+            trials (int): max trials for query
+            seconds (int): max seconds for query
+            threads (int): number of threads
+            syntax (str): query syntax
+            game (str): game query
+            cache (Cache): cache of results
+            canonicalize (bool): if True, queries are sent and cached in suit-isomorphic canonical form
+            merge_samples (bool): if True, cached results are refined by the missing trials, see OddsOracle
+            compact (bool): if True, ranges are compacted before sending, see OddsOracle
+            concurrency (int): max number of simultaneous queries
+            timeout (float): timeout of requests in seconds, None - no timeout
+            gzip_threshold (int): request bodies longer than gzip_threshold bytes are gzip-encoded, None - never
+        """
+        super().__init__(host=host, port=port, trials=trials, seconds=seconds, threads=threads,
+                         syntax=syntax, game=game, connect=False, cache=cache, canonicalize=canonicalize,
+                         merge_samples=merge_samples, compact=compact, timeout=timeout,
+                         gzip_threshold=gzip_threshold)
+        self.concurrency = concurrency
+        self._loop = None
+        self._semaphore = None
+        self._idle_connections = []
+        self._async_flights = {}
+
+    def _bind_to_loop(self):
+        """ Semaphore, connections and flights belong to event loop, so recreates them for a new loop """
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._idle_connections = []
+            self._async_flights = {}
+
+    async def connect(self):
+        """ Checks that OddsOracle server answers, tries to run it if it doesn't
+
+        The server is run in a thread of the default executor, so the event loop isn't blocked.
+
+        Raises:
+            ConnectionError: if can't connect to server
+        """
+        url = self._url()
+        try:
+            await self._probe()
+        except OSError:
+            self.logger.warning("Connection to {} failed".format(url))
+            self.logger.info("Trying to run OddsOracle server")
+            await asyncio.get_running_loop().run_in_executor(None, self.run_server)
+            try:
+                await self._probe()
+            except OSError as exception:
+                raise ConnectionError(
+                    "Connection to {} failed: \r\n{}. \r\nIs OddsOracle server running?".format(url, exception))
+        self.logger.info('Successfully connected to {}'.format(url))
+
+    async def _probe(self):
+        self._bind_to_loop()
+        body = xmlrpc.client.dumps(('', 10, 1, 1), 'PPTServer.executePQL', encoding='utf-8').encode('utf-8')
+        async with self._semaphore:
+            xmlrpc.client.loads(await self._post(body), use_builtin_types=True)
+
+    async def pql(self, pql: str, trials: int = None, seconds: int = None) -> PqlResult:
+        """
+        Invoke OddsOracle's executePQL
+
+        Args:
+            pql (str): PQL query
+            trials (int): max trials for the query, OddsOracle.trials if not provided
+            seconds (int): max seconds for the query, OddsOracle.seconds if not provided
+
+        Returns:
+            PqlResult: result of query
+
+        """
+        return await self._pql(pql, trials, seconds, self._caller())
+
+    async def _pql(self, pql: str, trials: int, seconds: int, caller: str) -> PqlResult:
+        query = self._canonical_pql(pql)
+        seconds = self.seconds if seconds is None else seconds
+        sampling = self._pql_sampling(query, trials, lambda missing: self._call('PPTServer.executePQL', query,
+                                                                                missing, seconds, self.threads))
+        key = self._pql_cache_key(query, trials, seconds, sampling)
+        trials = self.trials if trials is None else trials
+        return await self._cached_query('pql', pql, key, caller,
+                                        execute=lambda: self._call('PPTServer.executePQL', query, trials, seconds,
+                                                                   self.threads),
+                                        check=functools.partial(self._check_pql_result, pql),
+                                        parse=PqlResult, sampling=sampling)
+
+    async def equity(self, hands: tuple, board: str = '', dead: str = '') -> list:
+        """
+        Invoke OddsOracle's computeEquityAuto
+
+        Args:
+            hands(list): list of hands
+            board(str): board
+            dead(str): dead cards
+
+        Returns:
+            list: list of equities
+
+        """
+        return await self._equity(hands, board, dead, self._caller())
+
+    async def _equity(self, hands: tuple, board: str, dead: str, caller: str) -> list:
+        hands = tuple(hands)
+        c_hands, c_board, c_dead = self._canonical_equity(hands, board, dead)
+
+        def execute(trials=self.trials):
+            return self._call('PPTServer.computeEquityAuto', self.game, c_board, c_dead, self.syntax, list(c_hands),
+                              trials, self.seconds, self.threads)
+
+        sampling = self._equity_sampling(execute)
+        key = self._equity_cache_key((c_hands, c_board, c_dead), sampling)
+        return await self._cached_query('equity', self._equity_text(hands, board, dead), key, caller,
+                                        execute=execute,
+                                        check=functools.partial(self._check_equity_result, hands, board, dead),
+                                        parse=self._parse_equity_result, sampling=sampling)
+
+    async def map_pql(self, pqls: Iterable[str], trials: int = None, seconds: int = None) -> list:
+        """ Executes PQL queries simultaneously (not more than 'concurrency' at the same time)
+
+        Args:
+            pqls (Iterable[str]): PQL queries
+            trials (int): max trials for each query, OddsOracle.trials if not provided
+            seconds (int): max seconds for each query, OddsOracle.seconds if not provided
+
+        Returns:
+            list: PqlResult for every query in the same order
+        """
+        caller = self._caller()
+        return await asyncio.gather(*[self._pql(pql, trials, seconds, caller) for pql in pqls])
+
+    async def map_equity(self, queries: Iterable[tuple]) -> list:
+        """ Computes equities simultaneously (not more than 'concurrency' at the same time)
+
+        Args:
+            queries (Iterable[tuple]): arguments of equity: (hands, ), (hands, board) or (hands, board, dead)
+
+        Returns:
+            list: list of equities for every query in the same order
+        """
+        caller = self._caller()
+        return await asyncio.gather(*[self._equity(*(tuple(query) + ('', ''))[:3], caller)
+                                      for query in queries])
+
+    async def _cached_query(self, kind: str, text: str, key: str, caller: str, execute, check, parse,
+                            sampling=None):
+        """ Returns parsed result from the cache or from the server and records statistics
+
+        execute is a function returning awaitable result of the server. Concurrent identical queries aren't sent
+        to the server twice, merged samples are refined, see OddsOracle._cached_query.
+        """
+        result = self.cache.get(key)
+        hit = self._is_enough(result, sampling)
+        shared = False
+        server_seconds = 0.0
+        if not hit:
+            self._bind_to_loop()
+            flight = self._async_flights.get(key)
+            if flight is None:
+                flight = self._async_flights[key] = self._loop.create_future()
+                started = time.perf_counter()
+                try:
+                    if sampling is None:
+                        result = await execute()
+                        check(result)
+                    else:
+                        sample = await sampling.execute(sampling.trials - (0 if result is None
+                                                                           else sample_trials(result)))
+                        check(sample)
+                        result = sampling.merge(result, sample)
+                    server_seconds = time.perf_counter() - started
+                    self.cache.set(key, result)
+                except asyncio.CancelledError:
+                    # Waiting queries will send the query themselves
+                    del self._async_flights[key]
+                    flight.cancel()
+                    raise
+                except Exception as exception:
+                    del self._async_flights[key]
+                    flight.set_exception(exception)
+                    # Retrieves the exception, so it isn't logged if nobody waits for the flight
+                    flight.exception()
+                    self.query_stats.record(kind, caller, hit=False, server_seconds=time.perf_counter() - started,
+                                            error=True, query=text)
+                    raise
+                del self._async_flights[key]
+                flight.set_result(result)
+            else:
+                try:
+                    # shield: cancellation of a waiting query doesn't cancel the flight
+                    result = await asyncio.shield(flight)
+                except asyncio.CancelledError:
+                    if not flight.cancelled():
+                        raise
+                    return await self._cached_query(kind, text, key, caller, execute, check, parse, sampling)
+                except Exception:
+                    self.query_stats.record(kind, caller, hit=True, shared=True, error=True, query=text)
+                    raise
+                if not self._is_enough(result, sampling):
+                    # The flight was for fewer trials
+                    return await self._cached_query(kind, text, key, caller, execute, check, parse, sampling)
+                hit = shared = True
+        started = time.perf_counter()
+        parsed = parse(result)
+        self.query_stats.record(kind, caller, hit, server_seconds, len(result), time.perf_counter() - started,
+                                query=text, shared=shared)
+        return parsed
+
+    async def _call(self, method: str, *params):
+        """ Invoke method of the server, for example 'PPTServer.executePQL', and records the call """
+        self._bind_to_loop()
+        body = xmlrpc.client.dumps(params, method, encoding='utf-8').encode('utf-8')
+        async with self._semaphore:
+            started = time.perf_counter()
+            response = await self._post(body)
+            seconds = time.perf_counter() - started
+        try:
+            result = xmlrpc.client.loads(response, use_builtin_types=True)[0][0]
+        except xmlrpc.client.Fault as fault:
+            self._record(method, params, fault=fault, seconds=seconds)
+            raise
+        self._record(method, params, result, seconds=seconds)
+        return result
+
+    async def _post(self, body: bytes) -> bytes:
+        """ Sends body of xmlrpc request and returns body of response, the request is counted in transport_stats
+
+        If the server refuses a gzip-encoded request, the request is repeated without encoding and requests aren't
+        encoded any more (as by KeepAliveTransport).
+        """
+        encoding = None
+        if self.gzip_threshold is not None and len(body) > self.gzip_threshold:
+            encoding = 'gzip'
+        request = body if encoding is None else xmlrpc.client.gzip_encode(body)
+        started = time.perf_counter()
+        try:
+            response, bytes_received = await self._send_request(request, encoding)
+        except xmlrpc.client.ProtocolError:
+            self.transport_stats.record_request(len(request), 0, time.perf_counter() - started, True)
+            if encoding is None:
+                raise
+            self.logger.info('{} refused gzip-encoded request, requests will not be encoded'.format(self._url()))
+            self.gzip_threshold = None
+            return await self._post(body)
+        except Exception:
+            self.transport_stats.record_request(len(request), 0, time.perf_counter() - started, True)
+            raise
+        self.transport_stats.record_request(len(request), bytes_received, time.perf_counter() - started)
+        return response
+
+    async def _send_request(self, request: bytes, encoding: str) -> tuple:
+        """ Sends request by an idle or a new connection, returns body of response and its size on the wire """
+        host = '{}:{}'.format(self._host, self._port)
+        while self._idle_connections:
+            connection = self._idle_connections.pop()
+            if not connection.is_usable():
+                connection.close()
+                continue
+            try:
+                response = await asyncio.wait_for(connection.post(host, '/xmlrpc', request, encoding), self.timeout)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                # The server closed the kept alive connection, tries another one
+                connection.close()
+                continue
+            except BaseException:
+                # Cancelled or failed in the middle of the request, the connection can't be reused
+                connection.close()
+                raise
+            self._release(connection)
+            return response, connection.bytes_received
+        connection = await asyncio.wait_for(_HttpConnection.open(self._host, int(self._port)), self.timeout)
+        self.transport_stats.record_connection()
+        try:
+            response = await asyncio.wait_for(connection.post(host, '/xmlrpc', request, encoding), self.timeout)
+        except BaseException:
+            connection.close()
+            raise
+        self._release(connection)
+        return response, connection.bytes_received
+
+    def batch(self, max_size: int = 64):
+        """ AsyncOddsOracle has no batches, its queries are sent simultaneously with asyncio.gather
+
+        Raises:
+            TypeError: always
+        """
+        raise TypeError('AsyncOddsOracle has no batches, send queries simultaneously with asyncio.gather')
+
+    def _multicall(self, calls: list) -> list:
+        raise TypeError('AsyncOddsOracle has no multicall, send queries simultaneously with asyncio.gather')
+
+    def _call_many(self, calls: list) -> list:
+        raise TypeError('AsyncOddsOracle has no multicall, send queries simultaneously with asyncio.gather')
+
+    def _release(self, connection: _HttpConnection):
+        if connection.is_usable():
+            self._idle_connections.append(connection)
+        else:
+            connection.close()
+
+    async def close(self):
+        """ Closes idle connections """
+        connections, self._idle_connections = self._idle_connections, []
+        for connection in connections:
+            connection.close()
+
+
+class AsyncPql(Pql):
+    """ Class implements different usable PQL queries for asyncio """
+
+    def __init__(self, odds_oracle: AsyncOddsOracle):
+        """
+        Args:
+            odds_oracle (AsyncOddsOracle): AsyncOddsOracle
+        """
+        super().__init__(odds_oracle)
+
+    async def equity(self, players: Iterable, board='', dead='') -> list:
+        """ Return equities for each players.
+
+        Args:
+            players (list): list of players ranges
+            board (str): board
+            dead (str): dead cards
+
+        Returns:
+            list: list of equities
+
+        """
+        return await self.odds_oracle.equity(tuple(players), board, dead)
+
+    async def hero_equity(self, hero: str, villains: list, board: str = None, dead: str = None) -> float:
+        """ Return equity only for hero
+
+        Args:
+            hero (str): hero's hand
+            villains (list): list of villain's hand
+            board (str): board
+            dead (str): dead cards
+
+        Returns:
+            float: hero's equity
+        """
+        pql = self._hero_equity_pql(hero, villains, board, dead)
+        return self._hero_equity_result(await self.odds_oracle.pql(pql))
+
+    async def hero_equity_many(self, hero: str, villains: list, boards: Iterable[str], dead: str = None) -> list:
+        """ Return hero's equity on every board, queries are sent simultaneously
+
+        Args:
+            hero (str): hero's hand
+            villains (list): list of villain's hand
+            boards (Iterable[str]): boards
+            dead (str): dead cards
+
+        Returns:
+            list: hero's equity (float) for every board in the same order
+        """
+        pqls = [self._hero_equity_pql(hero, villains, board or None, dead) for board in boards]
+        return [self._hero_equity_result(pql_result) for pql_result in await self.odds_oracle.map_pql(pqls)]
+
+    async def adaptive_hero_equity(self, hero: str, villains: list, board: str = None, dead: str = None,
+                                   tolerance: float = 0.005, initial_trials: int = 10000,
+                                   max_trials: int = None) -> EquityEstimate:
+        """ Return hero's equity calculated with required precision, see Pql.adaptive_hero_equity """
+        pql = self._hero_equity_pql(hero, villains, board, dead)
+        return (await self._adaptive(pql, ['EQ'], tolerance, initial_trials, max_trials))[0]
+
+    async def adaptive_equity(self, players: Iterable, board: str = None, dead: str = None, tolerance: float = 0.005,
+                              initial_trials: int = 10000, max_trials: int = None) -> List[EquityEstimate]:
+        """ Return equities for each players calculated with required precision, see Pql.adaptive_equity """
+        return await self._adaptive(*self._adaptive_equity_pql(players, board, dead), tolerance, initial_trials,
+                                    max_trials)
+
+    async def _adaptive(self, pql: str, names: list, tolerance: float, initial_trials: int,
+                        max_trials: int = None) -> List[EquityEstimate]:
+        runs = self._adaptive_runs(names, tolerance, initial_trials, max_trials)
+        try:
+            trials = next(runs)
+            while True:
+                trials = runs.send(await self.odds_oracle.pql(pql, trials=trials))
+        except StopIteration as stop:
+            return stop.value
+
+    def planner(self):
+        """ AsyncPql has no planner, its queries are sent simultaneously with asyncio.gather
+
+        Raises:
+            TypeError: always
+        """
+        raise TypeError('AsyncPql has no planner, send queries simultaneously with asyncio.gather')
+
+    async def count_in_range(self, main_range: str, sub_ranges: list, board: str, players: Iterable[str] = None,
+                             dead: str = '') -> list:
+        """ Returns how often sub_ranges are in main_range
+
+        Args:
+            main_range (str): main range
+            sub_ranges (list): sub ranges
+            board (str): board
+            players (Iterable[str]): Iterable of ranges of other players in the hand
+            dead (str): dead cards
+
+        Returns:
+            list: list of percentages(float)
+
+        """
+        pql = self._count_in_range_pql(main_range, sub_ranges, board, players, dead)
+        return self._count_in_range_result(await self.odds_oracle.pql(pql))
+
+    async def equity_histogram(self, hero: str, villains: list, board: str = None, dead: str = None,
+                               buckets: int = 10) -> list:
+        """ Returns distribution of hero's equity on the street of the board, see Pql.equity_histogram """
+        pql = self._equity_histogram_pql(hero, villains, board, dead)
+        return self._equity_histogram_result(await self.odds_oracle.pql(pql), buckets, self._is_river(board))
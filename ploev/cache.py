@@ -0,0 +1,449 @@
+# ploev
+# Copyright (C) 2017 Alexey Londkevich <vyvojer@gmail.com>
+
+# ploev is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# ploev is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Caches for OddsOracle results """
+
+import hashlib
+import json
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Optional
+
+
+def make_key(*parts) -> str:
+    """ Returns cache key for the parts of a query
+
+    Args:
+        *parts: JSON serializable parts of a query (kind, game, syntax, trials, query...)
+
+    Returns:
+        str: hex digest identifying the query
+    """
+    serialized = json.dumps(parts, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+
+class Cache(ABC):
+    """ Abstract cache of raw OddsOracle results
+
+    Keys are strings returned by make_key, values are raw result strings of the server.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        """ Returns cached value or None """
+
+    @abstractmethod
+    def set(self, key: str, value: str):
+        """ Stores value """
+
+    @abstractmethod
+    def clear(self):
+        """ Removes all values """
+
+    @abstractmethod
+    def __len__(self):
+        pass
+
+    def reserve(self, size: int):
+        """ Makes room for size values stored together, so they aren't evicted before they are read
+
+        Caches bounded by bytes or slots don't change, only bounded by number of values do.
+
+        Args:
+            size (int): number of values
+        """
+
+
+class MemoryCache(Cache):
+    """ In-process LRU cache
+
+    Attributes:
+        maxsize (int): max number of stored results
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def reserve(self, size: int):
+        """ Grows maxsize to size if it's smaller """
+        with self._lock:
+            self.maxsize = max(self.maxsize, size)
+
+
+class SqliteCache(Cache):
+    """ Persistent cache in SQLite database
+
+    The database can be shared by several processes (notebook kernels, batch workers).
+    When total size of stored values exceeds max_size, least recently used values are evicted.
+
+    Hits don't write to the database, so readers of several processes don't wait for the write lock of each other.
+    Access time of a hit is updated only if it's older than a minute, the updates are written together by the next
+    set, or when there are many of them, or by close.
+
+    Attributes:
+        path (str): path of database file
+        max_size (int): max total size of stored values in bytes
+    """
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS results (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            accessed REAL NOT NULL
+        )
+    """
+    _INDEX = "CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)"
+    _META = "CREATE TABLE IF NOT EXISTS meta (id INTEGER PRIMARY KEY CHECK (id = 0), total INTEGER NOT NULL)"
+    # After eviction the cache is filled to this part of max_size
+    _EVICTION_RATIO = 0.9
+    # Precision of access times in seconds and max number of access times waiting to be written
+    _TOUCH_INTERVAL = 60.0
+    _TOUCH_BATCH = 256
+
+    def __init__(self, path: str = 'ploev_cache.sqlite', max_size: int = 256 * 1024 * 1024, timeout: float = 30):
+        """
+        Args:
+            path (str): path of database file
+            max_size (int): max total size of stored values in bytes
+            timeout (float): how long to wait for a lock of other process
+        """
+        self.path = os.path.abspath(path)
+        self.max_size = max_size
+        self.timeout = timeout
+        self._local = threading.local()
+        # key -> access time of hits not written to the database yet
+        self._touched = {}
+        self._touched_lock = threading.Lock()
+        connection = self._connection()
+        with connection:
+            connection.execute(self._SCHEMA)
+            connection.execute(self._INDEX)
+            connection.execute(self._META)
+            connection.execute("INSERT OR IGNORE INTO meta (id, total) VALUES (0, 0)")
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.timeout)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def get(self, key: str) -> Optional[str]:
+        connection = self._connection()
+        row = connection.execute("SELECT value, accessed FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, accessed = row
+        now = time.time()
+        if now - accessed >= self._TOUCH_INTERVAL:
+            with self._touched_lock:
+                self._touched[key] = now
+                batch_is_full = len(self._touched) >= self._TOUCH_BATCH
+            if batch_is_full:
+                with connection:
+                    self._write_touched(connection)
+        return value
+
+    def _write_touched(self, connection: sqlite3.Connection):
+        """ Writes access times of hits in the transaction of connection """
+        with self._touched_lock:
+            touched, self._touched = self._touched, {}
+        # Other processes could write later access times
+        connection.executemany("UPDATE results SET accessed = max(accessed, ?) WHERE key = ?",
+                               [(accessed, key) for key, accessed in touched.items()])
+
+    def set(self, key: str, value: str):
+        connection = self._connection()
+        size = len(value.encode('utf-8'))
+        with connection:
+            # BEGIN IMMEDIATE serializes writers of all processes, so 'total' stays consistent
+            connection.execute("BEGIN IMMEDIATE")
+            self._write_touched(connection)
+            row = connection.execute("SELECT size FROM results WHERE key = ?", (key,)).fetchone()
+            old_size = row[0] if row is not None else 0
+            connection.execute("INSERT OR REPLACE INTO results (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                               (key, value, size, time.time()))
+            connection.execute("UPDATE meta SET total = total + ? WHERE id = 0", (size - old_size,))
+            total = connection.execute("SELECT total FROM meta WHERE id = 0").fetchone()[0]
+            if total > self.max_size:
+                self._evict(connection, total)
+
+    def _evict(self, connection: sqlite3.Connection, total: int):
+        target = self.max_size * self._EVICTION_RATIO
+        evicted = []
+        evicted_size = 0
+        for key, size in connection.execute("SELECT key, size FROM results ORDER BY accessed"):
+            if total - evicted_size <= target:
+                break
+            evicted.append((key,))
+            evicted_size += size
+        connection.executemany("DELETE FROM results WHERE key = ?", evicted)
+        connection.execute("UPDATE meta SET total = total - ? WHERE id = 0", (evicted_size,))
+
+    def clear(self):
+        connection = self._connection()
+        with connection:
+            connection.execute("DELETE FROM results")
+            connection.execute("UPDATE meta SET total = 0 WHERE id = 0")
+
+    def size(self) -> int:
+        """ Returns total size of stored values in bytes """
+        return self._connection().execute("SELECT total FROM meta WHERE id = 0").fetchone()[0]
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def close(self):
+        """ Writes access times of hits and closes connection of the current thread """
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            with connection:
+                self._write_touched(connection)
+            connection.close()
+            self._local.connection = None
+
+
+class _FileLock:
+    """ Lock of processes (fcntl.flock or msvcrt.locking) and threads on a lock file """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._file = open(path, 'a+b')
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        try:
+            if os.name == 'nt':
+                import msvcrt
+                self._file.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        # LK_LOCK gives up after 10 seconds
+                        continue
+            else:
+                import fcntl
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            if os.name == 'nt':
+                import msvcrt
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        finally:
+            self._thread_lock.release()
+
+    def close(self):
+        self._file.close()
+
+
+class MmapCache(Cache):
+    """ Cache in a memory-mapped file shared by all processes of the machine
+
+    Workers of multiprocessing sweeps opening the same file see results of each other without the server.
+    The file is a hash table of slots of fixed size, so the size of the cache is bounded by slots * slot_size.
+    A key can be stored in one of 'ways' slots of its set, when they are all used, the slot is evicted by
+    CLOCK algorithm (an approximation of LRU). Values longer than a slot aren't cached.
+
+    Writers are serialized by a lock file, readers don't lock: every slot has a version, which is odd while
+    the slot is written, and a checksum, so a torn slot is a miss.
+
+    The cache can be passed to worker processes (it's pickled as its path).
+
+    Attributes:
+        path (str): path of the file
+        slots (int): number of slots
+        slot_size (int): size of a slot in bytes
+        ways (int): number of slots in a set
+    """
+    _MAGIC = b'PLOEVMC1'
+    # magic, slots, slot_size, ways
+    _HEADER = struct.Struct('<8sIII')
+    _HEADER_SIZE = 64
+    # version, referenced, digest, length, crc32 of the value (at offsets 0, 4, 8, 40, 44), the value follows
+    _SLOT = struct.Struct('<IB3x32sII')
+
+    def __init__(self, path: str = 'ploev_cache.mmap', slots: int = 8192, slot_size: int = 4096, ways: int = 8):
+        """
+        Args:
+            path (str): path of the file, geometry of an existing file is kept
+            slots (int): number of slots, a multiple of ways
+            slot_size (int): size of a slot in bytes, values are not longer than slot_size - 48 bytes
+            ways (int): number of slots, where a key can be stored
+        """
+        if slots % ways or slot_size <= self._SLOT.size:
+            raise ValueError('slots must be a multiple of ways and slot_size must be bigger than {}'.format(
+                self._SLOT.size))
+        self.path = os.path.abspath(path)
+        self._lock = _FileLock(self.path + '.lock')
+        with self._lock:
+            with open(self.path, 'a+b') as file:
+                file.seek(0)
+                header = file.read(self._HEADER.size)
+                if len(header) == self._HEADER.size and header.startswith(self._MAGIC):
+                    _, slots, slot_size, ways = self._HEADER.unpack(header)
+                else:
+                    file.truncate(0)
+                    file.write(self._HEADER.pack(self._MAGIC, slots, slot_size, ways).ljust(self._HEADER_SIZE, b'\0'))
+                    file.truncate(self._HEADER_SIZE + slots * slot_size)
+            self._file = open(self.path, 'r+b')
+            self._mmap = mmap.mmap(self._file.fileno(), self._HEADER_SIZE + slots * slot_size)
+        self.slots = slots
+        self.slot_size = slot_size
+        self.ways = ways
+        self._sets = slots // ways
+        # Clock hands of sets, they are positions of the next eviction only, so they are kept in the process
+        self._hands = bytearray(self._sets) if ways <= 256 else [0] * self._sets
+
+    def __getstate__(self):
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    @staticmethod
+    def _digest(key: str) -> bytes:
+        return hashlib.sha256(key.encode('utf-8')).digest()
+
+    def _set_offsets(self, digest: bytes) -> range:
+        first = int.from_bytes(digest[:8], 'little') % self._sets * self.ways
+        return range(self._HEADER_SIZE + first * self.slot_size,
+                     self._HEADER_SIZE + (first + self.ways) * self.slot_size, self.slot_size)
+
+    def get(self, key: str) -> Optional[str]:
+        digest = self._digest(key)
+        memory = self._mmap
+        for offset in self._set_offsets(digest):
+            version, _, slot_digest, length, crc = self._SLOT.unpack_from(memory, offset)
+            if slot_digest != digest:
+                continue
+            start = offset + self._SLOT.size
+            value = memory[start:start + length]
+            if version % 2 or self._SLOT.unpack_from(memory, offset)[0] != version or \
+                    zlib.crc32(value) != crc:
+                return None
+            memory[offset + 4] = 1
+            return value.decode('utf-8')
+        return None
+
+    def set(self, key: str, value: str):
+        data = value.encode('utf-8')
+        if len(data) > self.slot_size - self._SLOT.size:
+            return
+        digest = self._digest(key)
+        memory = self._mmap
+        with self._lock:
+            offset = self._find_slot(self._set_offsets(digest), digest)
+            version = self._begin_write(offset)
+            memory[offset + self._SLOT.size:offset + self._SLOT.size + len(data)] = data
+            self._SLOT.pack_into(memory, offset, version, 1, digest, len(data), zlib.crc32(data))
+            self._end_write(offset, version)
+
+    def _find_slot(self, offsets: range, digest: bytes) -> int:
+        """ Returns offset of the slot of the key, of an empty slot or of the evicted slot """
+        memory = self._mmap
+        empty = None
+        for offset in offsets:
+            slot_digest = memory[offset + 8:offset + 40]
+            if slot_digest == digest:
+                return offset
+            if empty is None and not any(slot_digest):
+                empty = offset
+        if empty is not None:
+            return empty
+        set_index = (offsets.start - self._HEADER_SIZE) // self.slot_size // self.ways
+        hand = self._hands[set_index]
+        while True:
+            offset = offsets[hand]
+            hand = (hand + 1) % self.ways
+            if memory[offset + 4]:
+                memory[offset + 4] = 0
+            else:
+                self._hands[set_index] = hand
+                return offset
+
+    def clear(self):
+        memory = self._mmap
+        empty = bytes(self._SLOT.size - 4)
+        with self._lock:
+            for offset in range(self._HEADER_SIZE, len(memory), self.slot_size):
+                version = self._begin_write(offset)
+                memory[offset + 4:offset + self._SLOT.size] = empty
+                self._end_write(offset, version)
+
+    def _begin_write(self, offset: int) -> int:
+        """ Makes version of the slot odd, so readers don't trust it, returns the odd version """
+        version = (self._SLOT.unpack_from(self._mmap, offset)[0] + 1) & 0xFFFFFFFF
+        struct.pack_into('<I', self._mmap, offset, version)
+        return version
+
+    def _end_write(self, offset: int, version: int):
+        struct.pack_into('<I', self._mmap, offset, (version + 1) & 0xFFFFFFFF)
+
+    def __len__(self):
+        memory = self._mmap
+        return sum(any(memory[offset + 8:offset + 40])
+                   for offset in range(self._HEADER_SIZE, len(memory), self.slot_size))
+
+    def close(self):
+        """ Closes the file, other processes keep their results """
+        self._mmap.close()
+        self._file.close()
+        self._lock.close()
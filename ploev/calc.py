@@ -16,9 +16,13 @@
 
 """ Classes implementing various calculations. """
 
+import asyncio
 import itertools
 from collections import namedtuple
-from ploev.ppt import Pql, OddsOracle, PqlCardInMoreThanOnePlaceError
+from ploev import exact, montecarlo
+from ploev.parallel import ShardedExecutor
+from ploev.ppt import EquityEstimate, Pql, OddsOracle, PqlCardInMoreThanOnePlaceError, PqlPlanner, round_equity
+from ploev.async_ppt import AsyncOddsOracle, AsyncPql
 from typing import Iterable, List
 
 SubRange = namedtuple("SubRange", "range fraction equity")
@@ -55,26 +59,57 @@ class Calc:
     Class to make various general calculations
     """
 
-    def __init__(self, odds_oracle: OddsOracle):
+    def __init__(self, odds_oracle: OddsOracle, exact: bool = False, monte_carlo: bool = False,
+                 workers: int = None):
         """
 
         Args:
             odds_oracle (OddsOracle): OddsOracle
+            exact (bool): if True, heads-up equities on the turn and the river are enumerated exactly without
+                OddsOracle (see ploev.exact), everything else is still calculated by OddsOracle
+            monte_carlo (bool): if True, equities are sampled locally (see ploev.montecarlo) with trials and seconds
+                of OddsOracle, the ones that can't be sampled are calculated by OddsOracle. Exact equities are
+                preferred if Calc is exact as well
+            workers (int): if set, exact and monte_carlo equities are computed by this number of processes (see
+                ploev.parallel), otherwise in the calling process
         """
         self.odds_oracle = odds_oracle
         self.pql = Pql(self.odds_oracle)
+        self.exact = exact
+        self.monte_carlo = monte_carlo
+        self.executor = ShardedExecutor(workers) if workers else None
 
-    def equity(self, players: list, board: str = None, dead: str = None, hero_only: bool = False):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """ Stops worker processes of Calc with workers, they are started again by the next local equity """
+        if self.executor is not None:
+            self.executor.shutdown()
+
+    def equity(self, players: list, board: str = None, dead: str = None, hero_only: bool = False,
+               tolerance: float = None):
         """ Calculates equities
 
         For intensive computations set 'hero_only' to True if you need only hero (first player in list) equity. It's faster.
         If hero_only is True return float (hero_equity), otherwise returns list of equities.
 
+        If 'tolerance' is set, trials are added until standard error of equities is not bigger than tolerance and
+        EquityEstimate (equity, stderr, trials) is returned instead of float.
+
+        If Calc is exact and equity can be enumerated, exact equity is returned (EquityEstimate has zero stderr and
+        number of enumerated deals as trials). If Calc is monte_carlo and equity can be sampled, sampled equity is
+        returned. Floats are rounded as equities of OddsOracle (see ppt.round_equity) whatever calculates them.
+
         Args:
             players (list): players ranges. If hero_only is True calculates equity only for first player
             board (str): board (optional)
             dead (str): dead cards (optional)
             hero_only (bool): If True calculate equity only for the hero (faster)
+            tolerance (float): required standard error of equities (optional)
 
         Returns:
             list: if hero_only is False, returns list of equities
@@ -82,6 +117,13 @@ class Calc:
         Returns:
             float: if hero_only is True, returns hero's equity
         """
+        estimates = self._local_equity(players, board, dead, tolerance)
+        if estimates is not None:
+            return self._local_result(estimates, hero_only, tolerance)
+        if tolerance is not None:
+            if hero_only:
+                return self.pql.adaptive_hero_equity(players[0], players[1:], board, dead, tolerance=tolerance)
+            return self.pql.adaptive_equity(players, board, dead, tolerance=tolerance)
         if hero_only:
             return self.pql.hero_equity(players[0], players[1:], board, dead)
         else:
@@ -91,6 +133,71 @@ class Calc:
                 dead = ''
             return self.pql.equity(players, board, dead)
 
+    def _local_equity(self, players: list, board: str, dead: str, tolerance: float) -> list:
+        """ Returns EquityEstimate of players by exact or monte_carlo, None if Calc can't calculate them locally """
+        if self.exact:
+            estimates = self._exact_equity(players, board, dead)
+            if estimates is not None:
+                return estimates
+        if self.monte_carlo:
+            return self._monte_carlo_equity(players, board, dead, tolerance)
+        return None
+
+    @staticmethod
+    def _local_result(estimates: list, hero_only: bool, tolerance: float):
+        """ Returns local estimates like equities of OddsOracle, without tolerance they are rounded floats """
+        equities = estimates if tolerance is not None else [round_equity(estimate.equity) for estimate in estimates]
+        return equities[0] if hero_only else equities
+
+    def _exact_equity(self, players: list, board: str, dead: str) -> list:
+        """ Returns exact equities of players or None if they can't be enumerated """
+        enumerate_outcomes = self.executor.exact_outcomes if self.executor else exact.outcomes
+        try:
+            outcomes = enumerate_outcomes(players[0], players[1:], board, dead)
+        except exact.ExactEquityError:
+            return None
+        return [EquityEstimate(equity, 0.0, outcomes.total) for equity in (outcomes.equity, 1 - outcomes.equity)]
+
+    def _monte_carlo_equity(self, players: list, board: str, dead: str, tolerance: float) -> list:
+        """ Returns sampled equities of players or None if they can't be sampled """
+        equity = self.executor.monte_carlo_equity if self.executor else montecarlo.equity
+        try:
+            return equity(players, board, dead, trials=self.odds_oracle.trials, seconds=self.odds_oracle.seconds,
+                          tolerance=tolerance)
+        except montecarlo.MonteCarloError:
+            return None
+
+    def hero_equity_many(self, players: list, boards: Iterable[str], dead: str = None) -> list:
+        """ Calculates hero's (first player in list) equity on every board
+
+        Queries for all boards are sent together, see Pql.hero_equity_many
+
+        Args:
+            players (list): players ranges, the first one is hero
+            boards (Iterable[str]): boards, for example all turns of a flop
+            dead (str): dead cards (optional)
+
+        Returns:
+            list: hero's equity (float) for every board in the same order
+        """
+        return self.pql.hero_equity_many(players[0], players[1:], boards, dead)
+
+    def equity_distribution(self, players: list, board: str = None, dead: str = None, buckets: int = 10) -> list:
+        """ Calculates distribution of hero's (first player in list) equity on the street of the board
+
+        One query replaces a count query per bucket, see Pql.equity_histogram
+
+        Args:
+            players (list): players ranges, the first one is hero
+            board (str): board (optional)
+            dead (str): dead cards (optional)
+            buckets (int): number of equal equity buckets, a divisor of 100
+
+        Returns:
+            list: fractions (float) of hero's hands with equity in every bucket
+        """
+        return self.pql.equity_histogram(players[0], players[1:], board, dead, buckets)
+
     def range_distribution(self, main_range: str, sub_ranges: list, board: str, players: Iterable[str] = None,
                            equity: bool = True, cumulative: bool = True) -> List[SubRange]:
         """ Calculates how often sub_ranges are in main_range and what is hero's equity vs sub_ranges
@@ -110,26 +217,163 @@ class Calc:
             'range' - sub range.
 
         """
-        sub_ranges = map(close_parenthesis, sub_ranges)
-        if cumulative:
-            sub_ranges = create_cumulative_ranges(sub_ranges)
-        else:
-            sub_ranges = [sub_range for sub_range in sub_ranges]
-        fractions = self.pql.count_in_range(main_range, sub_ranges, board, players=players)
+        sub_ranges = self._prepare_sub_ranges(sub_ranges, cumulative)
+        planner = self.pql.planner()
+        fractions, equities = self._plan_range_distribution(planner, main_range, sub_ranges, board, players, equity)
+        planner.execute()
         distribution = []
-        for subrange, fraction in zip(sub_ranges, fractions):
+        for index, (subrange, fraction) in enumerate(zip(sub_ranges, fractions.result())):
             if equity:
-                villain_range = main_range + ":" + subrange
-                hero = list(players)[0]
                 try:
-                    equity = self.pql.hero_equity(hero, [villain_range], board)
+                    sub_range_equity = equities[index].result()
                 except PqlCardInMoreThanOnePlaceError:
-                    equity = None
+                    sub_range_equity = None
             else:
-                equity = 0
-            distribution.append(SubRange(subrange, fraction, equity))
+                sub_range_equity = 0
+            distribution.append(SubRange(subrange, fraction, sub_range_equity))
         return distribution
 
+    @staticmethod
+    def _plan_range_distribution(planner: PqlPlanner, main_range: str, sub_ranges: list, board: str,
+                                 players: Iterable[str], equity: bool) -> tuple:
+        """ Adds queries of range_distribution to planner, returns futures of fractions and of equities (or None) """
+        # Equities vs sub ranges have other from clauses than the count query, so nothing is fused,
+        # but all queries are sent in one batch
+        players = list(players) if players is not None else None
+        fractions = planner.count_in_range(main_range, sub_ranges, board, players=players)
+        if not equity:
+            return fractions, None
+        hero = players[0]
+        return fractions, [planner.hero_equity(hero, [main_range + ":" + subrange], board) for subrange in sub_ranges]
+
+    def prefetch(self, equities: Iterable[tuple] = (), distributions: Iterable[tuple] = ()):
+        """ Sends queries of many equity and range_distribution calls to OddsOracle together
+
+        Results are put into the cache of OddsOracle, so the calls with the same arguments made afterwards don't
+        wait for the server one by one. The cache is grown to hold all results (see Cache.reserve). Errors of queries
+        aren't raised here, the calls raise them. Equities aren't prefetched if Calc is exact or monte_carlo (they are
+        calculated locally where possible).
+
+        Usage:
+            calc.prefetch(equities=[(['AA', 'KK'], 'Ks7d2c')], distributions=[('75%', ['KK'], 'Ks7d2c', ['AA'])])
+            calc.equity(['AA', 'KK'], 'Ks7d2c')   # from the cache
+
+        Args:
+            equities (Iterable[tuple]): arguments of equity: (players, ) or (players, board)
+            distributions (Iterable[tuple]): arguments of range_distribution: (main_range, sub_ranges, board) or
+                (main_range, sub_ranges, board, players), the defaults of equity and cumulative are used
+        """
+        with self.odds_oracle.batch() as batch:
+            for distribution in distributions:
+                main_range, sub_ranges, board, players = (tuple(distribution) + (None,))[:4]
+                # Every call has its own planner, so its queries are fused exactly as in the call itself
+                planner = self.pql.planner()
+                self._plan_range_distribution(planner, main_range, self._prepare_sub_ranges(sub_ranges, True), board,
+                                              players, equity=True)
+                for pql in planner.fused_pqls():
+                    batch.pql(pql)
+            if not self.exact and not self.monte_carlo:
+                for equity in equities:
+                    players, board = (tuple(equity) + ('',))[:2]
+                    batch.equity(tuple(players), board or '')
+            # The calls read the results from the cache, so they mustn't be evicted by each other
+            self.odds_oracle.cache.reserve(len(batch))
+
+    @staticmethod
+    def _prepare_sub_ranges(sub_ranges: Iterable, cumulative: bool) -> list:
+        sub_ranges = map(close_parenthesis, sub_ranges)
+        if cumulative:
+            return create_cumulative_ranges(sub_ranges)
+        else:
+            return [sub_range for sub_range in sub_ranges]
+
+
+class AsyncCalc(Calc):
+    """
+    Class to make various general calculations with asyncio
+
+    Many calculations can be run simultaneously, for example:
+        distributions = await asyncio.gather(*[calc.range_distribution(...) for board in boards])
+    """
+
+    def __init__(self, odds_oracle: AsyncOddsOracle, exact: bool = False, monte_carlo: bool = False,
+                 workers: int = None):
+        """
+
+        Args:
+            odds_oracle (AsyncOddsOracle): AsyncOddsOracle
+            exact (bool): see Calc
+            monte_carlo (bool): see Calc
+            workers (int): see Calc
+        """
+        super().__init__(odds_oracle, exact=exact, monte_carlo=monte_carlo, workers=workers)
+        self.pql = AsyncPql(self.odds_oracle)
+
+    def prefetch(self, equities: Iterable[tuple] = (), distributions: Iterable[tuple] = ()):
+        """ AsyncCalc has no prefetch, its calculations are run simultaneously with asyncio.gather
+
+        Raises:
+            TypeError: always
+        """
+        raise TypeError('AsyncCalc has no prefetch, run calculations simultaneously with asyncio.gather')
+
+    async def equity(self, players: list, board: str = None, dead: str = None, hero_only: bool = False,
+                     tolerance: float = None):
+        """ Calculates equities, see Calc.equity
+
+        Exact and Monte Carlo equities are calculated in a thread of the default executor, so the event loop isn't
+        blocked.
+        """
+        if self.exact or self.monte_carlo:
+            estimates = await asyncio.get_running_loop().run_in_executor(None, self._local_equity, players, board,
+                                                                         dead, tolerance)
+            if estimates is not None:
+                return self._local_result(estimates, hero_only, tolerance)
+        if tolerance is not None:
+            if hero_only:
+                return await self.pql.adaptive_hero_equity(players[0], players[1:], board, dead, tolerance=tolerance)
+            return await self.pql.adaptive_equity(players, board, dead, tolerance=tolerance)
+        if hero_only:
+            return await self.pql.hero_equity(players[0], players[1:], board, dead)
+        else:
+            if board is None:
+                board = ''
+            if dead is None:
+                dead = ''
+            return await self.pql.equity(players, board, dead)
+
+    async def hero_equity_many(self, players: list, boards: Iterable[str], dead: str = None) -> list:
+        """ Calculates hero's equity on every board, see Calc.hero_equity_many """
+        return await self.pql.hero_equity_many(players[0], players[1:], boards, dead)
+
+    async def equity_distribution(self, players: list, board: str = None, dead: str = None,
+                                  buckets: int = 10) -> list:
+        """ Calculates distribution of hero's equity, see Calc.equity_distribution """
+        return await self.pql.equity_histogram(players[0], players[1:], board, dead, buckets)
+
+    async def range_distribution(self, main_range: str, sub_ranges: list, board: str, players: Iterable[str] = None,
+                                 equity: bool = True, cumulative: bool = True) -> List[SubRange]:
+        """ Calculates how often sub_ranges are in main_range and what is hero's equity vs sub_ranges
+
+        See Calc.range_distribution. Equities vs sub ranges are calculated simultaneously.
+        """
+        sub_ranges = self._prepare_sub_ranges(sub_ranges, cumulative)
+        fractions = await self.pql.count_in_range(main_range, sub_ranges, board, players=players)
+        if equity:
+            hero = list(players)[0]
+            equities = await asyncio.gather(*[self._sub_range_equity(hero, main_range + ":" + subrange, board)
+                                              for subrange in sub_ranges])
+        else:
+            equities = [0] * len(sub_ranges)
+        return [SubRange(subrange, fraction, equity)
+                for subrange, fraction, equity in zip(sub_ranges, fractions, equities)]
+
+    async def _sub_range_equity(self, hero: str, villain_range: str, board: str):
+        try:
+            return await self.pql.hero_equity(hero, [villain_range], board)
+        except PqlCardInMoreThanOnePlaceError:
+            return None
+
 
 class GameCalc:
     pass
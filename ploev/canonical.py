@@ -0,0 +1,161 @@
+# ploev
+# Copyright (C) 2017 Alexey Londkevich <vyvojer@gmail.com>
+
+# ploev is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# ploev is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Suit-isomorphic canonicalization of queries in generic syntax
+
+Queries which differ only by a permutation of suits ('As7h2d' vs 'Ac7s2h' with accordingly permuted ranges)
+have the same answer. Canonical form of a query is the minimal one over all 24 permutations of suits,
+flop cards and dead cards are sorted, so all isomorphic queries have the same canonical form.
+
+Functions return the query unchanged if it contains something, which can't be safely permuted.
+"""
+
+import itertools
+import re
+from typing import Optional, Tuple
+
+SUITS = 'shdc'
+RANKS = 'AKQJT98765432'
+
+_PERMUTATIONS = [str.maketrans(SUITS, ''.join(permutation)) for permutation in itertools.permutations(SUITS)]
+_MACRO = re.compile(r'(\$\w+)')
+_NOT_PERMUTABLE = re.compile(r'[abefgi-rtuvSHDC]')
+_CARD = re.compile(r'[2-9TJQKA][shdc]')
+_CARDS = re.compile(r'(?:[2-9TJQKA][shdc])*')
+_QUOTED = re.compile(r"'([^']*)'")
+_SLOT = re.compile(r'(\w+)\s*=\s*$')
+_IN_RANGE = re.compile(r'inRange\s*\(\s*\w+\s*,\s*$', re.IGNORECASE)
+_RANGE_SLOT = re.compile(r'hero|player_\d+', re.IGNORECASE)
+_BOARD_SLOTS = ('board', 'dead')
+_KEPT_SLOTS = ('game', 'syntax')
+
+
+def _card_order(card: str):
+    return RANKS.index(card[0]), SUITS.index(card[1])
+
+
+def _is_permutable_range(range_: str) -> bool:
+    """ Checks that all lowercase letters out of macros are suits or suit variables"""
+    return not any(_NOT_PERMUTABLE.search(part) for part in _MACRO.split(range_)[::2])
+
+
+def _parse_cards(cards: str) -> Optional[list]:
+    cards = cards.replace(' ', '')
+    if not _CARDS.fullmatch(cards):
+        return None
+    return _CARD.findall(cards)
+
+
+def _permute_range(range_: str, table: dict) -> str:
+    parts = _MACRO.split(range_)
+    parts[::2] = [part.translate(table) for part in parts[::2]]
+    return ''.join(parts)
+
+
+def _permute_board(cards: list, table: dict) -> str:
+    cards = [card.translate(table) for card in cards]
+    # flop is a set of cards, turn and river must stay on their places
+    return ''.join(sorted(cards[:3], key=_card_order) + cards[3:])
+
+
+def _permute_dead(cards: list, table: dict) -> str:
+    return ''.join(sorted((card.translate(table) for card in cards), key=_card_order))
+
+
+def canonical_equity_query(hands: tuple, board: str = '', dead: str = '') -> Tuple[tuple, str, str]:
+    """ Returns canonical form of equity query
+
+    Args:
+        hands (tuple): ranges of players in generic syntax
+        board (str): board
+        dead (str): dead cards
+
+    Returns:
+        tuple: canonical (hands, board, dead), or unchanged query if it can't be canonicalized
+    """
+    board_cards = _parse_cards(board or '')
+    dead_cards = _parse_cards(dead or '')
+    if board_cards is None or dead_cards is None or not all(_is_permutable_range(hand) for hand in hands):
+        return hands, board, dead
+    candidates = []
+    for table in _PERMUTATIONS:
+        candidates.append((_permute_board(board_cards, table),
+                           _permute_dead(dead_cards, table),
+                           tuple(_permute_range(hand, table) for hand in hands)))
+    canonical_board, canonical_dead, canonical_hands = min(candidates)
+    return canonical_hands, canonical_board, canonical_dead
+
+
+def canonical_pql(pql: str) -> str:
+    """ Returns canonical form of PQL query in generic syntax
+
+    Only quoted values of board, dead, hero, player_N and second arguments of inRange are permuted.
+
+    Args:
+        pql (str): PQL query
+
+    Returns:
+        str: canonical PQL query, or unchanged query if it can't be canonicalized
+    """
+    literals = []
+    for match in _QUOTED.finditer(pql):
+        before = pql[max(0, match.start() - 40):match.start()]
+        value = match.group(1)
+        slot = _SLOT.search(before)
+        if _IN_RANGE.search(before) or (slot and _RANGE_SLOT.fullmatch(slot.group(1))):
+            if not _is_permutable_range(value):
+                return pql
+            literals.append((match, 'range', value))
+        elif slot and slot.group(1).lower() in _BOARD_SLOTS:
+            cards = _parse_cards(value)
+            if cards is None:
+                return pql
+            literals.append((match, slot.group(1).lower(), cards))
+        elif slot and slot.group(1).lower() in _KEPT_SLOTS:
+            if slot.group(1).lower() == 'syntax' and value.lower() != 'generic':
+                return pql
+        else:
+            return pql
+    unquoted = _QUOTED.sub("''", pql)
+    if _CARD.search(unquoted):
+        # card outside of quotes, for example in a selector
+        return pql
+    if not literals:
+        return pql
+
+    def permute(table):
+        permuted = []
+        for _, kind, value in literals:
+            if kind == 'range':
+                permuted.append(_permute_range(value, table))
+            elif kind == 'board':
+                permuted.append(_permute_board(value, table))
+            else:
+                permuted.append(_permute_dead(value, table))
+        return permuted
+
+    # boards and dead cards define the canonical form first, ranges break ties
+    order = sorted(range(len(literals)), key=lambda index: literals[index][1] == 'range')
+    canonical = min((permute(table) for table in _PERMUTATIONS),
+                    key=lambda permuted: [permuted[index] for index in order])
+    parts = []
+    position = 0
+    for (match, _, _), value in zip(literals, canonical):
+        parts.append(pql[position:match.start(1)])
+        parts.append(value)
+        position = match.end(1)
+    parts.append(pql[position:])
+    return ''.join(parts)
@@ -94,6 +94,51 @@ def cards_to_str(cards: Iterable) -> str:
     return "".join([card_to_str(card) for card in cards])
 
 
+def card_to_int(card: Card) -> int:
+    """ Returns integer encoding of concrete card
+
+    Cards are encoded as (rank - 2) * 4 + suit - 1, so 2s is 0, 2h is 1 ... Ac is 51.
+    rank - 2 is 'value >> 2' and suit - 1 is 'value & 3'.
+
+    Args:
+        card (Card): concrete card
+
+    Returns:
+        int: encoded card
+    """
+    if not (2 <= card.rank <= 14 and 1 <= card.suit <= 4):
+        raise ValueError("Only concrete cards can be encoded, was {}".format(card_to_str(card)))
+    return (card.rank - 2) * 4 + card.suit - 1
+
+
+def card_from_int(value: int) -> Card:
+    """ Returns Card from integer encoding, see card_to_int
+
+    Args:
+        value (int): encoded card
+
+    Returns:
+        Card: card
+    """
+    if not 0 <= value < 52:
+        raise ValueError("Encoded card must be in range 0..51, was {}".format(value))
+    return Card((value >> 2) + 2, (value & 3) + 1)
+
+
+def cards_to_ints(cards) -> list:
+    """ Returns integer encodings of cards
+
+    Args:
+        cards (Iterable or str): cards or string representation of cards
+
+    Returns:
+        list: list of encoded cards
+    """
+    if cards is None or isinstance(cards, str):
+        cards = CardSet.from_str(cards)
+    return [card_to_int(card) for card in cards]
+
+
 class Deck:
     """ Class representing a standard deck"""
 
@@ -0,0 +1,279 @@
+# ploev
+# Copyright (C) 2017 Alexey Londkevich <vyvojer@gmail.com>
+
+# ploev is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# ploev is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Omaha holdings and PPT ranges as NumPy masks
+
+All C(52, 4) = 270725 holdings are enumerated once, a range in PPT generic syntax becomes a boolean mask
+over them. Cards are encoded as in ploev.cards.card_to_int.
+
+Supported subset of the generic syntax:
+    hands           'AA', 'AsKs', 'KQJT', 'Qss', 'AxKx', 'xxyy', '*' (a hand matches holdings containing it)
+    suit variables  'w', 'x', 'y', 'z' (the same variable is the same suit, different variables are different suits)
+    percentages     '30%' (top of holdings by a rough preflop ordering, not identical to PPT's one)
+    macros          '$ds' (double suited), '$ss' (single suited), '$r' (rainbow), '$np' (no pair)
+    operators       ',' (or), ':' (and), '!' (but not), parentheses
+"""
+
+import functools
+import itertools
+import re
+
+import numpy as np
+
+from ploev.cards import STRING_TO_RANK, STRING_TO_SUIT
+
+N_CARDS = 52
+N_HOLDINGS = 270725
+
+_SUIT_VARIABLES = 'wxyz'
+# Cards of a hand can be separated by whitespace ('Qs Ts Jd 2d')
+_TOKEN = re.compile(r'\s*(?:(?P<percent>\d+(?:\.\d+)?%)|(?P<macro>\$\w+)'
+                    r'|(?P<hand>[AKQJT2-9shdcwxyz*]+(?:\s+[AKQJT2-9shdcwxyz*]+)*)|(?P<operator>[,:!()]))')
+_HAND_CARD = re.compile(r'(\*)|([AKQJT2-9])?([shdcwxyz])?')
+
+
+class RangeSyntaxError(ValueError):
+    """ Range can't be parsed """
+
+    def __init__(self, range_: str, message: str):
+        super().__init__("{}: '{}'".format(message, range_))
+        self.range_ = range_
+
+
+@functools.lru_cache(maxsize=None)
+def holdings() -> np.ndarray:
+    """ Returns all Omaha holdings
+
+    Returns:
+        numpy.ndarray: read-only array of shape (270725, 4) with sorted encoded cards of each holding
+    """
+    array = np.array(list(itertools.combinations(range(N_CARDS), 4)), dtype=np.uint8)
+    array.flags.writeable = False
+    return array
+
+
+@functools.lru_cache(maxsize=None)
+def subset_keys(size: int) -> np.ndarray:
+    """ Returns keys of all 'size'-card subsets of every holding
+
+    A key encodes sorted cards of a subset as a number in base 52, so equal subsets of different holdings have
+    equal keys.
+
+    Args:
+        size (int): number of cards in a subset, 1 - 4
+
+    Returns:
+        numpy.ndarray: array of shape (270725, C(4, size)), subsets of a holding are in itertools.combinations order
+    """
+    columns = [_keys(holdings()[:, list(subset)]) for subset in itertools.combinations(range(4), size)]
+    return np.stack(columns, axis=1)
+
+
+def _keys(cards: np.ndarray) -> np.ndarray:
+    """ Encodes rows of sorted cards as integers """
+    keys = np.zeros(len(cards), dtype=np.int64)
+    for column in range(cards.shape[1]):
+        keys = keys * N_CARDS + cards[:, column]
+    return keys
+
+
+def conflict_mask(cards) -> np.ndarray:
+    """ Returns mask of holdings containing any of the cards
+
+    Args:
+        cards (Iterable): encoded cards
+
+    Returns:
+        numpy.ndarray: boolean mask
+    """
+    cards = list(cards)
+    if not cards:
+        return np.zeros(N_HOLDINGS, dtype=bool)
+    return np.isin(holdings(), cards).any(axis=1)
+
+
+def _hand_mask(range_: str, hand: str) -> np.ndarray:
+    """ Returns mask of holdings containing hand like 'AKxx' """
+    items = []
+    position = 0
+    while position < len(hand):
+        match = _HAND_CARD.match(hand, position)
+        if not match.group(0):
+            raise RangeSyntaxError(range_, "Unexpected symbol '{}'".format(hand[position]))
+        position = match.end()
+        if match.group(1) is None:
+            items.append((match.group(2), match.group(3)))
+    if len(items) + hand.count('*') > 4:
+        raise RangeSyntaxError(range_, "Hand '{}' has more than 4 cards".format(hand))
+    if not items:
+        return np.ones(N_HOLDINGS, dtype=bool)
+
+    variables = sorted({suit for _, suit in items if suit is not None and suit in _SUIT_VARIABLES})
+    candidates = []
+    for suits in itertools.permutations(range(4), len(variables)):
+        suit_of = dict(zip(variables, suits))
+        cards = []
+        for rank, suit in items:
+            ranks = range(13) if rank is None else [STRING_TO_RANK[rank] - 2]
+            if suit is None:
+                suits_ = range(4)
+            elif suit in suit_of:
+                suits_ = [suit_of[suit]]
+            else:
+                suits_ = [STRING_TO_SUIT[suit] - 1]
+            cards.append(np.array([rank_ * 4 + suit_ for rank_ in ranks for suit_ in suits_], dtype=np.int64))
+        grid = np.stack([axis.ravel() for axis in np.meshgrid(*cards, indexing='ij')], axis=1)
+        grid.sort(axis=1)
+        if grid.shape[1] > 1:
+            grid = grid[(np.diff(grid, axis=1) != 0).all(axis=1)]
+        candidates.append(_keys(grid))
+    keys = np.unique(np.concatenate(candidates))
+    return np.isin(subset_keys(len(items)), keys).any(axis=1)
+
+
+@functools.lru_cache(maxsize=None)
+def _preflop_order() -> np.ndarray:
+    """ Returns holdings sorted from the best to the worst by a rough preflop score
+
+    The score prefers high cards, pairs, suited cards (not more than two of a suit) and connected ranks.
+    """
+    cards = holdings().astype(np.int64)
+    ranks = cards >> 2
+    suits = cards & 3
+    score = ranks.sum(axis=1).astype(np.float64)
+    rank_counts = (ranks[:, :, None] == np.arange(13)).sum(axis=1)
+    score += ((rank_counts == 2) * (np.arange(13) + 6)).sum(axis=1)
+    score -= ((rank_counts >= 3) * 12).sum(axis=1)
+    suit_counts = (suits[:, :, None] == np.arange(4)).sum(axis=1)
+    high_in_suit = np.where(suits[:, :, None] == np.arange(4), ranks[:, :, None], -1).max(axis=1)
+    score += ((suit_counts == 2) * (5 + high_in_suit / 2)).sum(axis=1)
+    score -= ((suit_counts >= 3) * 3).sum(axis=1)
+    distinct = np.sort(ranks, axis=1)
+    gaps = np.diff(distinct, axis=1)
+    score += ((gaps >= 1) & (gaps <= 2)).sum(axis=1) * 2.5 - (gaps >= 4).sum(axis=1) * 1.5
+    return np.argsort(-score, kind='stable')
+
+
+def _percent_mask(percent: float) -> np.ndarray:
+    mask = np.zeros(N_HOLDINGS, dtype=bool)
+    mask[_preflop_order()[:int(round(N_HOLDINGS * percent / 100))]] = True
+    return mask
+
+
+def _macro_mask(range_: str, macro: str) -> np.ndarray:
+    cards = holdings()
+    suit_counts = np.sort(((cards[:, :, None] & 3) == np.arange(4)).sum(axis=1), axis=1)[:, ::-1]
+    if macro == '$ds':
+        return (suit_counts[:, 0] == 2) & (suit_counts[:, 1] == 2)
+    elif macro == '$ss':
+        return (suit_counts[:, 0] == 2) & (suit_counts[:, 1] == 1)
+    elif macro == '$r':
+        return suit_counts[:, 0] == 1
+    elif macro == '$np':
+        ranks = cards >> 2
+        return (np.diff(ranks, axis=1) != 0).all(axis=1)
+    raise RangeSyntaxError(range_, "Unknown macro '{}'".format(macro))
+
+
+class _Parser:
+    """ Recursive descent parser of ranges
+
+    ',' has the lowest priority, ':' and '!' are evaluated from left to right ((A:B)!C == A:(B!C)).
+    """
+
+    def __init__(self, range_: str):
+        self.range_ = range_
+        self.tokens = []
+        position = 0
+        stripped = range_.rstrip()
+        while position < len(stripped):
+            match = _TOKEN.match(stripped, position)
+            if match is None or not match.group(0).strip():
+                raise RangeSyntaxError(range_, "Unexpected symbol '{}'".format(stripped[position:].strip()[:1]))
+            kind = match.lastgroup
+            self.tokens.append((kind, re.sub(r'\s+', '', match.group(kind)) if kind == 'hand' else match.group(kind)))
+            position = match.end()
+        self.position = 0
+
+    def parse(self) -> np.ndarray:
+        if not self.tokens:
+            raise RangeSyntaxError(self.range_, 'Empty range')
+        mask = self._union()
+        if self.position != len(self.tokens):
+            raise RangeSyntaxError(self.range_, "Unexpected '{}'".format(self.tokens[self.position][1]))
+        return mask
+
+    def _peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def _union(self) -> np.ndarray:
+        mask = self._intersection()
+        while self._peek() == ('operator', ','):
+            self.position += 1
+            mask = mask | self._intersection()
+        return mask
+
+    def _intersection(self) -> np.ndarray:
+        mask = self._unary()
+        while self._peek() in (('operator', ':'), ('operator', '!')):
+            operator = self._peek()[1]
+            self.position += 1
+            other = self._unary()
+            mask = mask & other if operator == ':' else mask & ~other
+        return mask
+
+    def _unary(self) -> np.ndarray:
+        kind, value = self._peek()
+        if (kind, value) == ('operator', '!'):
+            self.position += 1
+            return ~self._unary()
+        if (kind, value) == ('operator', '('):
+            self.position += 1
+            mask = self._union()
+            if self._peek() != ('operator', ')'):
+                raise RangeSyntaxError(self.range_, "Missing ')'")
+            self.position += 1
+            return mask
+        if kind is None or kind == 'operator':
+            raise RangeSyntaxError(self.range_, 'Unexpected {}'.format("'{}'".format(value) if value else 'end'))
+        self.position += 1
+        if kind == 'hand':
+            return _hand_mask(self.range_, value)
+        elif kind == 'percent':
+            return _percent_mask(float(value[:-1]))
+        return _macro_mask(self.range_, value)
+
+
+@functools.lru_cache(maxsize=256)
+def _cached_range_mask(range_: str) -> np.ndarray:
+    mask = _Parser(range_).parse()
+    mask.flags.writeable = False
+    return mask
+
+
+def range_mask(range_: str) -> np.ndarray:
+    """ Returns mask of holdings in PPT range
+
+    Args:
+        range_ (str): range in generic syntax
+
+    Returns:
+        numpy.ndarray: read-only boolean mask over holdings()
+
+    Raises:
+        RangeSyntaxError: if range can't be parsed
+    """
+    return _cached_range_mask(range_.strip())
@@ -0,0 +1,261 @@
+# ploev
+# Copyright (C) 2017 Alexey Londkevich <vyvojer@gmail.com>
+
+# ploev is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# ploev is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Compaction of PPT ranges in generic syntax
+
+Ranges built by BoardExplorer and Player are long: nested parentheses, ':'-chains of street ranges, lists of
+hands containing each other. A compact range is equivalent, but shorter:
+    '((KK,77,K7,K6,AA,K)):((K))' -> '(77,AA,K):K'
+
+Rewrites don't depend on priorities of operators:
+    parentheses around a single operand are removed: '((KK))' -> 'KK'
+    a ',' list in parentheses between ',' operators is spliced: 'A,(B,C)' -> 'A,B,C', the same for ':'
+    duplicated operands of ',' or ':' lists are removed: 'A:B:A' -> 'A:B'
+    in ',' lists hands contained in a more general hand are removed: 'K,KK,K7' -> 'K', '*,...' -> '*'
+    in ':' lists more general hands are removed: 'K:KK' -> 'KK'
+    a hand listed with all 4 suits becomes a hand with a suit variable: 'Kss,Khh,Kdd,Kcc' -> 'Kxx'
+
+Ranges with something else than hands, percentages, macros, operators and parentheses are returned unchanged.
+"""
+
+import functools
+import re
+from collections import Counter
+
+_TOKEN = re.compile(r'\s*(?:(?P<atom>\d+(?:\.\d+)?%|\$\w+|[AKQJT2-9shdcwxyz*]+)|(?P<operator>[,:!()]))')
+_RANKS_ONLY = re.compile(r'[AKQJT2-9]{1,4}')
+_ONE_SUIT = re.compile(r'[AKQJT2-9]*([shdc])(?:[AKQJT2-9]|\1)*')
+_SUITS = 'shdc'
+_VARIABLE = 'x'
+_QUOTED = re.compile(r"'([^']*)'")
+_RANGE_SLOT = re.compile(r'(?:hero|player_\d+)\s*=\s*$|inRange\s*\(\s*\w+\s*,\s*$', re.IGNORECASE)
+
+
+class _Group:
+    """ Parenthesized expression: operands with the operators before them ('' before the first one) """
+
+    def __init__(self, items: list):
+        self.items = items
+
+    def operators(self) -> set:
+        return {operator for operator, _ in self.items[1:]}
+
+    def __str__(self):
+        return ''.join(operator + _parenthesized(operand) for operator, operand in self.items)
+
+
+class _Not:
+    """ Operand with unary '!' """
+
+    def __init__(self, operand):
+        self.operand = operand
+
+    def __str__(self):
+        return '!' + _parenthesized(self.operand)
+
+
+def _parenthesized(operand) -> str:
+    return '({})'.format(operand) if isinstance(operand, _Group) else str(operand)
+
+
+class _Parser:
+    def __init__(self, tokens: list):
+        self.tokens = tokens
+        self.position = 0
+
+    def _peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def group(self) -> _Group:
+        items = [('', self.operand())]
+        while self._peek()[0] == 'operator' and self._peek()[1] in ',:!':
+            operator = self._peek()[1]
+            self.position += 1
+            items.append((operator, self.operand()))
+        return _Group(items)
+
+    def operand(self):
+        kind, value = self._peek()
+        self.position += 1
+        if kind == 'atom':
+            return value
+        if value == '!':
+            return _Not(self.operand())
+        if value == '(':
+            group = self.group()
+            if self._peek() != ('operator', ')'):
+                raise ValueError('Missing )')
+            self.position += 1
+            return group
+        raise ValueError('Unexpected {}'.format(value))
+
+
+def _tokens(range_: str) -> list:
+    tokens = []
+    position = 0
+    stripped = range_.rstrip()
+    while position < len(stripped):
+        match = _TOKEN.match(stripped, position)
+        if match is None:
+            raise ValueError("Can't compact range")
+        tokens.append((match.lastgroup, match.group(match.lastgroup)))
+        position = match.end()
+    return tokens
+
+
+def _contains(general: str, specific: str) -> bool:
+    """ Returns True if every holding containing hand 'specific' contains hand 'general' (ranks only) """
+    if general == '*':
+        return True
+    if not (_RANKS_ONLY.fullmatch(general) and _RANKS_ONLY.fullmatch(specific)):
+        return False
+    return not Counter(general) - Counter(specific)
+
+
+def _merge_suits(operands: list) -> list:
+    """ Replaces a hand listed with all 4 suits by the hand with a suit variable """
+    templates = {}
+    for operand in operands:
+        if isinstance(operand, str):
+            suit = _ONE_SUIT.fullmatch(operand)
+            if suit:
+                templates.setdefault(operand.replace(suit.group(1), '?'), set()).add(suit.group(1))
+    merged = {template for template, suits in templates.items() if len(suits) == len(_SUITS)}
+    if not merged:
+        return operands
+    result = []
+    for operand in operands:
+        suit = _ONE_SUIT.fullmatch(operand) if isinstance(operand, str) else None
+        template = operand.replace(suit.group(1), '?') if suit else None
+        if template in merged:
+            replacement = template.replace('?', _VARIABLE)
+            if replacement not in result:
+                result.append(replacement)
+        else:
+            result.append(operand)
+    return result
+
+
+def _simplify_list(operator: str, operands: list) -> list:
+    """ Simplifies operands of a ',' or ':' list """
+    unique = []
+    for operand in operands:
+        if str(operand) not in map(str, unique):
+            unique.append(operand)
+    atoms = [operand for operand in unique if isinstance(operand, str)]
+    if operator == ',':
+        if '*' in atoms:
+            return ['*']
+        unique = [operand for operand in unique if not _is_redundant(operand, atoms, union=True)]
+        return _merge_suits(unique)
+    return [operand for operand in unique if not _is_redundant(operand, atoms, union=False)]
+
+
+def _is_redundant(operand, atoms: list, union: bool) -> bool:
+    """ Returns True if hand is contained in another hand of union (contains another hand of intersection)
+
+    Of equivalent hands ('K7' and '7K') the first one is kept.
+    """
+    if not isinstance(operand, str):
+        return False
+    for index, other in enumerate(atoms):
+        if other == operand:
+            continue
+        general, specific = (other, operand) if union else (operand, other)
+        if _contains(general, specific) and (not _contains(specific, general) or index < atoms.index(operand)):
+            return True
+    return False
+
+
+def _simplify(group: _Group) -> _Group:
+    items = []
+    for index, (operator, operand) in enumerate(group.items):
+        operand = _simplify_operand(operand)
+        next_operator = group.items[index + 1][0] if index + 1 < len(group.items) else ''
+        if isinstance(operand, _Group):
+            inner = operand.operators()
+            # A list in parentheses between the same operators is a part of the outer list
+            if len(inner) == 1 and next(iter(inner)) in ',:' and \
+                    {operator, next_operator} <= {'', next(iter(inner))}:
+                splice_operator = next(iter(inner))
+                items.append((operator, operand.items[0][1]))
+                items.extend((splice_operator, inner_operand) for _, inner_operand in operand.items[1:])
+                continue
+        items.append((operator, operand))
+    operators = {operator for operator, _ in items[1:]}
+    if len(operators) == 1 and next(iter(operators)) in ',:':
+        operator = next(iter(operators))
+        operands = _simplify_list(operator, [operand for _, operand in items])
+        items = [('', operands[0])] + [(operator, operand) for operand in operands[1:]]
+    return _Group(items)
+
+
+def _simplify_operand(operand):
+    if isinstance(operand, _Not):
+        return _Not(_simplify_operand(operand.operand))
+    if isinstance(operand, _Group):
+        group = _simplify(operand)
+        # Parentheses around a single operand aren't needed
+        while isinstance(group, _Group) and len(group.items) == 1:
+            group = group.items[0][1]
+        return group
+    return operand
+
+
+@functools.lru_cache(maxsize=4096)
+def compact_range(range_: str) -> str:
+    """ Returns shorter equivalent range
+
+    Args:
+        range_ (str): range in generic syntax
+
+    Returns:
+        str: compact range, or unchanged range if it can't be compacted
+    """
+    try:
+        tokens = _tokens(range_)
+        if not tokens:
+            return range_
+        parser = _Parser(tokens)
+        group = parser.group()
+        if parser.position != len(tokens):
+            return range_
+    except ValueError:
+        return range_
+    compact = str(_simplify_operand(group))
+    return compact if len(compact) < len(range_) else range_
+
+
+def compact_pql(pql: str) -> str:
+    """ Compacts ranges of PQL query in generic syntax
+
+    Quoted values of hero, player_N and second arguments of inRange are compacted.
+
+    Args:
+        pql (str): PQL query
+
+    Returns:
+        str: PQL query with compact ranges
+    """
+    parts = []
+    position = 0
+    for match in _QUOTED.finditer(pql):
+        if _RANGE_SLOT.search(pql[max(0, match.start() - 40):match.start()]):
+            parts.append(pql[position:match.start(1)])
+            parts.append(compact_range(match.group(1)))
+            position = match.end(1)
+    parts.append(pql[position:])
+    return ''.join(parts)
@@ -0,0 +1,308 @@
+# ploev
+# Copyright (C) 2017 Alexey Londkevich <vyvojer@gmail.com>
+
+# ploev is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# ploev is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Poker hand evaluator with lookup tables
+
+Cards are encoded as in ploev.cards.card_to_int (rank - 2 is 'card >> 2', suit - 1 is 'card & 3').
+A 5-card hand has one of 7462 values (0 - 7-5-4-3-2 high card ... 7461 - royal flush), the better hand
+has the bigger value. Values are looked up:
+    flushes             by bitmask of ranks
+    five unique ranks   by bitmask of ranks (straights and high cards)
+    paired hands        by product of primes of ranks
+
+Usage:
+    rank5(cards_to_ints('AsKsQsJsTs'))                       # 7461
+    omaha_rank(cards_to_ints('AsKs7h2c'), cards_to_ints('QsJsTs3d4d'))
+    omaha_ranks(holdings(), cards_to_ints('QsJsTs3d4d'))    # values of all holdings at once
+    board_ranks('QsJsTs3d4d')[range_mask('AA')]              # values of holdings of a range
+"""
+
+import functools
+import itertools
+from typing import Iterable
+
+import numpy as np
+
+from ploev.cards import cards_to_ints
+from ploev.combos import conflict_mask, holdings
+
+N_CARDS = 52
+N_VALUES = 7462
+
+# Categories of hands
+HIGH_CARD = 0
+PAIR = 1
+TWO_PAIR = 2
+TRIPS = 3
+STRAIGHT = 4
+FLUSH = 5
+FULL_HOUSE = 6
+QUADS = 7
+STRAIGHT_FLUSH = 8
+
+_PRIMES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41)
+_WHEEL = (12, 3, 2, 1, 0)
+_SHAPES = {(4, 1): QUADS, (3, 2): FULL_HOUSE, (3, 1, 1): TRIPS, (2, 2, 1): TWO_PAIR, (2, 1, 1, 1): PAIR}
+# Pairs of hole cards and triples of board cards of Omaha hands
+_HOLE_PAIRS = tuple(itertools.combinations(range(4), 2))
+_BOARD_TRIPLES = tuple(itertools.combinations(range(5), 3))
+
+
+def _order_key(ranks: tuple, flush: bool) -> tuple:
+    """ Returns sort key of hand with ranks (sorted descending), only for building of tables """
+    if len(set(ranks)) == 5:
+        straight = ranks[0] - ranks[4] == 4 or ranks == _WHEEL
+        high = 3 if ranks == _WHEEL else ranks[0]
+        if straight:
+            return (STRAIGHT_FLUSH if flush else STRAIGHT), (high,)
+        return (FLUSH if flush else HIGH_CARD), ranks
+    counts = {rank: ranks.count(rank) for rank in ranks}
+    grouped = sorted(counts, key=lambda rank: (counts[rank], rank), reverse=True)
+    return _SHAPES[tuple(counts[rank] for rank in grouped)], tuple(grouped)
+
+
+def _build_tables():
+    classes = []
+    for ranks in itertools.combinations(range(12, -1, -1), 5):
+        classes.append((_order_key(ranks, True), 'flush', ranks))
+        classes.append((_order_key(ranks, False), 'unique', ranks))
+    for ranks in itertools.combinations_with_replacement(range(12, -1, -1), 5):
+        if 1 < max(ranks.count(rank) for rank in ranks) < 5:
+            classes.append((_order_key(ranks, False), 'paired', ranks))
+    classes.sort()
+    flushes = np.full(1 << 13, -1, dtype=np.int16)
+    unique = np.full(1 << 13, -1, dtype=np.int16)
+    paired = {}
+    categories = np.zeros(N_VALUES, dtype=np.int8)
+    for value, ((category, _), kind, ranks) in enumerate(classes):
+        categories[value] = category
+        if kind == 'paired':
+            paired[int(np.prod([_PRIMES[rank] for rank in ranks]))] = value
+        else:
+            mask = sum(1 << rank for rank in ranks)
+            (flushes if kind == 'flush' else unique)[mask] = value
+    return flushes, unique, paired, categories
+
+
+_FLUSHES, _UNIQUE, _PAIRED, _CATEGORIES = _build_tables()
+_PAIRED_PRODUCTS = np.array(sorted(_PAIRED), dtype=np.int64)
+_PAIRED_VALUES = np.array([_PAIRED[product] for product in sorted(_PAIRED)], dtype=np.int16)
+_PRIMES_ARRAY = np.array(_PRIMES, dtype=np.int64)
+# Python lists are faster than arrays for indexing by Python ints
+_FLUSHES_LIST = _FLUSHES.tolist()
+_UNIQUE_LIST = _UNIQUE.tolist()
+
+
+def category(value: int) -> int:
+    """ Returns category of hand value: HIGH_CARD ... STRAIGHT_FLUSH
+
+    Args:
+        value (int): value of 5-card hand, see rank5
+
+    Returns:
+        int: category
+    """
+    return int(_CATEGORIES[value])
+
+
+def rank5(cards: Iterable[int]) -> int:
+    """ Returns value of 5-card hand, the better hand has the bigger value
+
+    Args:
+        cards (Iterable[int]): 5 encoded cards
+
+    Returns:
+        int: value 0 ... 7461
+    """
+    mask = 0
+    product = 1
+    suits = set()
+    for card in cards:
+        rank = card >> 2
+        mask |= 1 << rank
+        product *= _PRIMES[rank]
+        suits.add(card & 3)
+    if len(suits) == 1:
+        return _FLUSHES_LIST[mask]
+    value = _UNIQUE_LIST[mask]
+    return value if value >= 0 else _PAIRED[product]
+
+
+def _parts(cards: tuple) -> tuple:
+    """ Returns bitmask, product of primes and suit (-1 for different suits) of cards """
+    mask = 0
+    product = 1
+    suits = set()
+    for card in cards:
+        mask |= 1 << (card >> 2)
+        product *= _PRIMES[card >> 2]
+        suits.add(card & 3)
+    return mask, product, suits.pop() if len(suits) == 1 else -1
+
+
+def omaha_rank(hole: Iterable[int], board: Iterable[int]) -> int:
+    """ Returns value of the best Omaha hand: exactly two hole cards and three board cards
+
+    Args:
+        hole (Iterable[int]): 4 encoded hole cards
+        board (Iterable[int]): 3, 4 or 5 encoded board cards
+
+    Returns:
+        int: value of the hand, see rank5
+    """
+    pairs = [_parts(pair) for pair in itertools.combinations(hole, 2)]
+    best = -1
+    for triple_mask, triple_product, triple_suit in [_parts(triple) for triple in itertools.combinations(board, 3)]:
+        for pair_mask, pair_product, pair_suit in pairs:
+            mask = pair_mask | triple_mask
+            if triple_suit >= 0 and pair_suit == triple_suit:
+                value = _FLUSHES_LIST[mask]
+            else:
+                value = _UNIQUE_LIST[mask]
+                if value < 0:
+                    value = _PAIRED[pair_product * triple_product]
+            if value > best:
+                best = value
+    return best
+
+
+def rank5_array(cards: np.ndarray) -> np.ndarray:
+    """ Returns values of 5-card hands
+
+    Args:
+        cards (numpy.ndarray): encoded cards, the last axis is 5 cards of a hand
+
+    Returns:
+        numpy.ndarray: values of hands (int16), shape is cards.shape[:-1]
+    """
+    cards = np.asarray(cards)
+    ranks = (cards >> 2).astype(np.int64)
+    suits = cards & 3
+    mask = np.bitwise_or.reduce(1 << ranks, axis=-1)
+    flush = (suits == suits[..., :1]).all(axis=-1)
+    unique = _UNIQUE[mask]
+    product = _PRIMES_ARRAY[ranks].prod(axis=-1)
+    position = np.minimum(np.searchsorted(_PAIRED_PRODUCTS, product), len(_PAIRED_PRODUCTS) - 1)
+    return np.where(flush, _FLUSHES[mask], np.where(unique >= 0, unique, _PAIRED_VALUES[position]))
+
+
+@functools.lru_cache(maxsize=None)
+def _rank_values() -> np.ndarray:
+    """ Returns values of not flush hands by ranks of two hole cards and ranks of three board cards
+
+    Ranks are keys 'sum(rank * 13 ** position)', shape (13 ** 2, 13 ** 3). Impossible hands (5 cards of a rank)
+    have meaningless values.
+    """
+    ranks = np.indices((13,) * 5).reshape(5, -1).T.astype(np.int64)
+    mask = np.bitwise_or.reduce(1 << ranks, axis=1)
+    product = _PRIMES_ARRAY[ranks].prod(axis=1)
+    position = np.minimum(np.searchsorted(_PAIRED_PRODUCTS, product), len(_PAIRED_PRODUCTS) - 1)
+    values = np.zeros((13 ** 2, 13 ** 3), dtype=np.int16)
+    values[(ranks[:, :2] * 13 ** np.arange(2)).sum(axis=1), (ranks[:, 2:] * 13 ** np.arange(3)).sum(axis=1)] = \
+        np.where(_UNIQUE[mask] >= 0, _UNIQUE[mask], _PAIRED_VALUES[position])
+    return values
+
+
+def _parts_array(cards: np.ndarray) -> tuple:
+    """ Returns bitmasks of ranks, keys of ranks and suits (-1 for different suits) of cards, see _rank_values """
+    ranks = cards >> 2
+    suits = cards & 3
+    mask = np.bitwise_or.reduce(1 << ranks, axis=-1)
+    key = (ranks * 13 ** np.arange(cards.shape[-1])).sum(axis=-1)
+    suit = np.where((suits == suits[..., :1]).all(axis=-1), suits[..., 0], -1)
+    return mask, key, suit
+
+
+def omaha_rank_array(holes: np.ndarray, boards: np.ndarray) -> np.ndarray:
+    """ Returns values of the best Omaha hands, every holding has its own board
+
+    Values of 60 hands of a holding are looked up by parts: 6 pairs of hole cards and 10 triples of board cards.
+
+    Args:
+        holes (numpy.ndarray): encoded hole cards, shape (n, 4)
+        boards (numpy.ndarray): encoded cards of 5-card boards, shape (n, 5)
+
+    Returns:
+        numpy.ndarray: values of hands (int16), shape (n, )
+    """
+    holes = np.asarray(holes, dtype=np.int64)
+    boards = np.asarray(boards, dtype=np.int64)
+    pair_mask, pair_key, pair_suit = (part[:, :, None] for part in _parts_array(holes[:, _HOLE_PAIRS]))
+    triple_mask, triple_key, triple_suit = (part[:, None, :] for part in _parts_array(boards[:, _BOARD_TRIPLES]))
+    flush = (pair_suit == triple_suit) & (pair_suit >= 0)
+    values = np.where(flush, _FLUSHES[pair_mask | triple_mask], _rank_values()[pair_key, triple_key])
+    return values.max(axis=(1, 2))
+
+
+@functools.lru_cache(maxsize=1024)
+def _pair_values(board: tuple) -> np.ndarray:
+    """ Returns values of the best hands of all two hole cards and three cards of the board, shape (52, 52) """
+    triples = np.array(list(itertools.combinations(board, 3)), dtype=np.int64).reshape(-1, 3)
+    first, second = np.triu_indices(N_CARDS, 1)
+    pairs = np.stack([first, second], axis=1)
+    shape = (len(pairs), len(triples))
+    hands = np.concatenate([np.broadcast_to(pairs[:, None, :], shape + (2,)),
+                            np.broadcast_to(triples, shape + (3,))], axis=-1)
+    values = np.full((N_CARDS, N_CARDS), -1, dtype=np.int16)
+    values[first, second] = values[second, first] = rank5_array(hands).max(axis=1)
+    values.flags.writeable = False
+    return values
+
+
+def omaha_ranks(holes: np.ndarray, board: Iterable[int]) -> np.ndarray:
+    """ Returns values of the best Omaha hands of many holdings on one board
+
+    The best hand of every two hole cards is looked up in a table of the board, so all 270725 holdings
+    are evaluated in milliseconds. Values of holdings containing board cards are meaningless.
+
+    Args:
+        holes (numpy.ndarray): encoded hole cards, shape (n, 4)
+        board (Iterable[int]): 3, 4 or 5 encoded board cards
+
+    Returns:
+        numpy.ndarray: values of hands (int16), shape (n, )
+    """
+    holes = np.asarray(holes)
+    values = _pair_values(tuple(sorted(board)))
+    return np.max([values[holes[:, first], holes[:, second]] for first, second in _HOLE_PAIRS], axis=0)
+
+
+def board_ranks(board) -> np.ndarray:
+    """ Returns values of the best hands of all Omaha holdings on the board
+
+    The array is aligned with ploev.combos.holdings, so values of a range are 'board_ranks(board)[range_mask]'.
+    Arrays of the last boards are cached.
+
+    Args:
+        board (str or Iterable): 3, 4 or 5 cards: string, cards or encoded cards
+
+    Returns:
+        numpy.ndarray: read-only array of values (int16) of 270725 holdings, -1 for holdings with board cards
+    """
+    if isinstance(board, str) or any(not isinstance(card, (int, np.integer)) for card in board):
+        board = cards_to_ints(board)
+    board = tuple(sorted(int(card) for card in board))
+    if len(board) not in (3, 4, 5) or len(set(board)) != len(board):
+        raise ValueError('Board must contain 3, 4 or 5 different cards')
+    return _board_ranks(board)
+
+
+@functools.lru_cache(maxsize=64)
+def _board_ranks(board: tuple) -> np.ndarray:
+    values = omaha_ranks(holdings(), board)
+    values[conflict_mask(board)] = -1
+    values.flags.writeable = False
+    return values
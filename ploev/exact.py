@@ -0,0 +1,257 @@
+# ploev
+# Copyright (C) 2017 Alexey Londkevich <vyvojer@gmail.com>
+
+# ploev is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# ploev is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Exact heads-up equities on the turn and the river
+
+There are at most 44 runouts of a turn board, so instead of sampling deals with OddsOracle all deals are
+enumerated: every runout, every holding of hero's range and every holding of villain's range not sharing cards
+with it. Holdings are values of ploev.eval, ranges are masks of ploev.combos.
+
+Pairs of holdings aren't iterated. Villain's holdings weaker than hero's holding are looked up in a cumulative
+table by value, the ones sharing cards with hero's holding are subtracted by inclusion-exclusion over subsets of
+its cards (every subset has its own table).
+
+Only what can be enumerated exactly is supported: two players, a board of 4 or 5 cards, ranges of ploev.combos
+without percentages (combos orders holdings not as PPT does). ExactEquityError is raised for everything else, so
+callers can fall back to OddsOracle.
+
+Enumeration can be split into shards (see ploev.parallel): deals returns Deals of a query, runout_outcomes counts
+any block of hero's holdings on one runout, merge_outcomes sums outcomes of shards.
+
+Usage:
+    outcomes('AsAhQh8d', ['JJ'], 'Ks7d2cTs')    # Outcomes(wins=..., ties=..., total=...)
+    hero_equity('AsAhQh8d', ['JJ'], 'Ks7d2cTs')
+"""
+
+import functools
+from math import comb
+from collections import namedtuple
+from typing import Iterable
+
+import numpy as np
+
+from ploev.cards import cards_to_ints
+from ploev.combos import N_CARDS, N_HOLDINGS, RangeSyntaxError, conflict_mask, holdings, range_mask, subset_keys
+from ploev.eval import omaha_ranks
+
+
+class ExactEquityError(ValueError):
+    """ Equity can't be enumerated exactly """
+
+
+Deals = namedtuple('Deals', 'heroes villains board runouts')
+
+
+class Outcomes(namedtuple('Outcomes', 'wins ties total')):
+    """ Numbers of enumerated deals: won and tied by hero and all of them """
+
+    __slots__ = ()
+
+    @property
+    def equity(self) -> float:
+        return (self.wins + self.ties / 2) / self.total
+
+
+@functools.lru_cache(maxsize=None)
+def _subset_indices(size: int) -> np.ndarray:
+    """ Returns indices of 'size'-card subsets of every holding, the same subsets have the same index """
+    if not size:
+        return np.zeros((N_HOLDINGS, 1), dtype=np.int64)
+    keys = subset_keys(size)
+    _, inverse = np.unique(keys, return_inverse=True)
+    return inverse.reshape(keys.shape)
+
+
+class _Villains:
+    """ Villain's holdings on a board
+
+    For every subset of cards (the empty one too) there is a cumulative number of holdings containing it by
+    value. Distinct values on a board are few (a value depends on two hole cards), so tables are small.
+    """
+
+    def __init__(self, villains: np.ndarray, values: np.ndarray):
+        self.levels = np.unique(values)
+        ranks = np.searchsorted(self.levels, values)
+        self.tables = []
+        for size in range(4):
+            packed = _subset_indices(size)[villains] * len(self.levels) + ranks[:, None]
+            counts = np.bincount(packed.ravel(), minlength=comb(N_CARDS, size) * len(self.levels))
+            table = np.zeros((comb(N_CARDS, size), len(self.levels) + 1), dtype=np.int32)
+            table[:, 1:] = counts.reshape(table.shape[0], -1).cumsum(axis=1)
+            self.tables.append(table)
+        self.is_villain = np.zeros(N_HOLDINGS, dtype=bool)
+        self.is_villain[villains] = True
+
+    def count(self, heroes: np.ndarray, values: np.ndarray) -> Outcomes:
+        """ Counts pairs of hero's holding and villain's holding not sharing cards by inclusion-exclusion """
+        weaker = np.searchsorted(self.levels, values, side='left')[:, None]
+        not_stronger = np.searchsorted(self.levels, values, side='right')[:, None]
+        counts = np.zeros(3, dtype=np.int64)
+        for size, table in enumerate(self.tables):
+            indices = _subset_indices(size)[heroes]
+            shared = [table[indices, weaker].sum(), table[indices, not_stronger].sum(), table[indices, -1].sum()]
+            counts += (-1) ** size * np.array(shared, dtype=np.int64)
+        # Villain's holding sharing all 4 cards is hero's holding itself, it has the same value
+        itself = int(self.is_villain[heroes].sum())
+        return Outcomes(int(counts[0]), int(counts[1] - counts[0]) + itself, int(counts[2]) + itself)
+
+
+def _mask(range_: str) -> np.ndarray:
+    if '%' in range_:
+        raise ExactEquityError("Percentages aren't supported: '{}'".format(range_))
+    try:
+        return range_mask(range_)
+    except RangeSyntaxError as error:
+        raise ExactEquityError(str(error)) from error
+
+
+def _cards(cards) -> tuple:
+    try:
+        cards = tuple(sorted(cards_to_ints(cards if cards else '')))
+    except (KeyError, ValueError, IndexError) as error:
+        raise ExactEquityError("Wrong cards: '{}'".format(cards)) from error
+    if len(set(cards)) != len(cards):
+        raise ExactEquityError("Card in more than one place: '{}'".format(cards))
+    return cards
+
+
+def _runouts(board: tuple, dead: tuple) -> list:
+    if len(board) == 5:
+        return [board]
+    if len(board) == 4:
+        return [tuple(sorted(board + (card,))) for card in range(N_CARDS) if card not in board + dead]
+    raise ExactEquityError('Only turn and river boards can be enumerated')
+
+
+def deals(hero: str, villains: Iterable[str], board: str, dead: str = None) -> Deals:
+    """ Prepares deals of hero's and villain's ranges for enumeration
+
+    Args:
+        hero (str): hero's range
+        villains (Iterable[str]): villain's range (the only one)
+        board (str): board of 4 or 5 cards
+        dead (str): dead cards (optional)
+
+    Returns:
+        Deals: holdings (indices of combos.holdings) of hero and villain not containing board and dead cards, board
+            cards and all runouts of the board (tuples of 5 cards)
+
+    Raises:
+        ExactEquityError: if equity can't be enumerated exactly
+    """
+    villains = list(villains)
+    if len(villains) != 1:
+        raise ExactEquityError('Only heads-up equity can be enumerated')
+    board = _cards(board)
+    dead = _cards(dead)
+    if set(board) & set(dead):
+        raise ExactEquityError('Card in more than one place')
+    runouts = _runouts(board, dead)
+    alive = ~conflict_mask(board + dead)
+    return Deals(np.flatnonzero(_mask(hero) & alive), np.flatnonzero(_mask(villains[0]) & alive), board, runouts)
+
+
+def runout_outcomes(heroes: np.ndarray, villains: np.ndarray, board: tuple, runout: tuple) -> Outcomes:
+    """ Enumerates deals of heroes against villains on one runout of the board
+
+    Args:
+        heroes (numpy.ndarray): hero's holdings, see Deals, any part of them
+        villains (numpy.ndarray): villain's holdings, see Deals
+        board (tuple): board cards
+        runout (tuple): one of runouts of the board
+
+    Returns:
+        Outcomes: outcomes, may be all zeros
+    """
+    river = list(set(runout) - set(board))
+    heroes = heroes[~np.isin(holdings()[heroes], river).any(axis=1)]
+    villains = villains[~np.isin(holdings()[villains], river).any(axis=1)]
+    if not len(heroes) or not len(villains):
+        return Outcomes(0, 0, 0)
+    counter = _Villains(villains, omaha_ranks(holdings()[villains], runout))
+    return counter.count(heroes, omaha_ranks(holdings()[heroes], runout))
+
+
+def merge_outcomes(parts: Iterable[Outcomes]) -> Outcomes:
+    """ Sums outcomes of disjoint sets of deals
+
+    Args:
+        parts (Iterable[Outcomes]): outcomes of shards
+
+    Returns:
+        Outcomes: outcomes of all deals
+
+    Raises:
+        ExactEquityError: if there are no deals
+    """
+    wins = ties = total = 0
+    for part in parts:
+        wins += part.wins
+        ties += part.ties
+        total += part.total
+    if not total:
+        raise ExactEquityError('Card in more than one place')
+    return Outcomes(wins, ties, total)
+
+
+def outcomes(hero: str, villains: Iterable[str], board: str, dead: str = None) -> Outcomes:
+    """ Enumerates all deals of hero's and villain's ranges and runouts of the board
+
+    Args:
+        hero (str): hero's range
+        villains (Iterable[str]): villain's range (the only one)
+        board (str): board of 4 or 5 cards
+        dead (str): dead cards (optional)
+
+    Returns:
+        Outcomes: numbers of deals won and tied by hero and number of all deals
+
+    Raises:
+        ExactEquityError: if equity can't be enumerated exactly or there are no deals
+    """
+    heroes, villains, board, runouts = deals(hero, villains, board, dead)
+    return merge_outcomes(runout_outcomes(heroes, villains, board, runout) for runout in runouts)
+
+
+def hero_equity(hero: str, villains: Iterable[str], board: str, dead: str = None) -> float:
+    """ Returns exact hero's equity, see Pql.hero_equity and outcomes
+
+    Args:
+        hero (str): hero's range
+        villains (Iterable[str]): villain's range (the only one)
+        board (str): board of 4 or 5 cards
+        dead (str): dead cards (optional)
+
+    Returns:
+        float: hero's equity
+    """
+    return outcomes(hero, villains, board, dead).equity
+
+
+def equity(players: Iterable[str], board: str, dead: str = None) -> list:
+    """ Returns exact equities of two players, see Pql.equity and outcomes
+
+    Args:
+        players (Iterable[str]): ranges of two players
+        board (str): board of 4 or 5 cards
+        dead (str): dead cards (optional)
+
+    Returns:
+        list: equities (float) of players
+    """
+    players = list(players)
+    hero = hero_equity(players[0], players[1:], board, dead)
+    return [hero, 1 - hero]
@@ -1163,14 +1163,28 @@ class GameTreeException(Exception):
 
 class GameTree(AnkiMixin):
 
-    def __init__(self, root: GameNode, odds_oracle: OddsOracle):
+    def __init__(self, root: GameNode, odds_oracle: OddsOracle, exact: bool = False, monte_carlo: bool = False,
+                 workers: int = None):
+        """
+
+        Args:
+            root (GameNode): root node
+            odds_oracle (OddsOracle): OddsOracle
+            exact (bool): if True, heads-up equities of turn and river leaves are enumerated exactly, see Calc
+            monte_carlo (bool): if True, equities of leaves are sampled locally, see Calc
+            workers (int): number of processes computing local equities, see Calc
+        """
         super().__init__()
         self.anki_fields['description'] = None
         self.root = root
-        self.calc = Calc(odds_oracle)
+        self.calc = Calc(odds_oracle, exact=exact, monte_carlo=monte_carlo, workers=workers)
         self.hero = root.game.get_hero()
         self._hero_node = None
 
+    def close(self):
+        """ Stops worker processes of calc, see Calc.close """
+        self.calc.close()
+
     def __iter__(self):
         yield from self.root
 
@@ -1358,15 +1372,32 @@ class GameTree(AnkiMixin):
                 player.had_equity = had_equity
 
     @staticmethod
-    def _calculate_fractions(node: GameNode, calc):
-        logger = logging.getLogger("GameTree._calculate_fractions")
-        logger.debug("Calculating fractions for node %s", node)
-        # calculating fraction
+    def _equity_queries(node: GameNode) -> list:
+        """ Returns arguments (players, board) of Calc.equity queries of the leaf node, see _calculate_equities """
+        board = node.game.board.ppt()
+        active_players = node.game_state.get_active_players()
+        queries = []
+        if len(active_players) > 1:
+            queries.append((sorted(player.ppt() for player in active_players), board))
+        if node.game_state.leaf == GameLeaf.FOLD:
+            queries.append((sorted(player.ppt() for player in active_players + [node.player]), board))
+        return queries
+
+    @staticmethod
+    def _fractions_query(node: GameNode) -> tuple:
+        """ Returns arguments (main_range, sub_ranges, board, players) of Calc.range_distribution of the node """
         board = node.game.board.ppt()
         active_players = node.game_state.get_active_players()
         main_range = node.player.main_range_ppt()
         sub_range = [node.player.sub_range_ppt()]
         players_ranges = [player.ppt() for player in active_players if player != node.player]
+        return main_range, sub_range, board, players_ranges
+
+    @staticmethod
+    def _calculate_fractions(node: GameNode, calc):
+        logger = logging.getLogger("GameTree._calculate_fractions")
+        logger.debug("Calculating fractions for node %s", node)
+        main_range, sub_range, board, players_ranges = GameTree._fractions_query(node)
         fractions = calc.range_distribution(main_range, sub_range, board, players=players_ranges)
         node.line_fraction = fractions[0].fraction
 
@@ -1458,6 +1489,19 @@ class GameTree(AnkiMixin):
         for node in self:
             node.clear_calculation()
 
+    def _prefetch(self):
+        """ Sends queries of all nodes to OddsOracle together, calculate_node takes their results from the cache """
+        equities = []
+        distributions = []
+        for node in self:
+            if node.is_leaf_node:
+                equities.extend(self._equity_queries(node))
+                if not self._is_the_node_player_a_hero(node):
+                    distributions.append(self._fractions_query(node))
+            elif not self._is_hero_choice(node):
+                distributions.extend(self._fractions_query(line) for line in node.lines)
+        self.calc.prefetch(equities=equities, distributions=distributions)
+
     def calculate(self):
         logger = logging.getLogger("GameTree.calculate")
         logger.debug("{!s}\n".format(self))
@@ -1466,6 +1510,7 @@ class GameTree(AnkiMixin):
             level = nodes_by_level.setdefault(node.level_id, list())
             level.append(node)
         self.clear_calculation()
+        self._prefetch()
         for level in sorted(nodes_by_level.keys(), reverse=True):
             for node in nodes_by_level[level]:
                 self.calculate_node(node)
@@ -0,0 +1,241 @@
+# ploev
+# Copyright (C) 2017 Alexey Londkevich <vyvojer@gmail.com>
+
+# ploev is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# ploev is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Launcher of OddsOracle xmlrpc servers
+
+Usage:
+    with ServerLauncher() as launcher:
+        launcher.start_many(40000, 4)
+        pool = OddsOraclePool(['localhost:{}'.format(port) for port in range(40000, 40004)])
+"""
+
+import logging
+import os
+import shlex
+import subprocess
+import time
+import xmlrpc.client
+
+from ploev.settings import CONFIG
+
+DEFAULT_COMMAND = 'java -Duser.language=en-US -cp p2.jar propokertools.cli.XMLRPCServer {port}'
+
+logger = logging.getLogger('ppt.launcher')
+
+
+class _TimeoutTransport(xmlrpc.client.Transport):
+    def __init__(self, timeout: float):
+        super().__init__()
+        self.timeout = timeout
+
+    def make_connection(self, host):
+        connection = super().make_connection(host)
+        connection.timeout = self.timeout
+        return connection
+
+
+def is_ready(host: str, port: int, timeout: float = 1.0) -> bool:
+    """ Returns True if xmlrpc server answers
+
+    Args:
+        host (str): host
+        port (int): port
+        timeout (float): socket timeout
+
+    Returns:
+        bool: True if server answered (even with an error)
+    """
+    url = 'http://{}:{}/xmlrpc'.format(host, port)
+    client = xmlrpc.client.ServerProxy(url, transport=_TimeoutTransport(timeout))
+    try:
+        client.PPTServer.executePQL('', 10, 1, 1)
+    except (xmlrpc.client.Fault, xmlrpc.client.ProtocolError):
+        return True
+    except OSError:
+        return False
+    finally:
+        client('close')()
+    return True
+
+
+def wait_ready(host: str, port: int, timeout: float = 60.0, poll_interval: float = 0.05,
+               max_poll_interval: float = 1.0, process: subprocess.Popen = None) -> float:
+    """ Waits until xmlrpc server answers
+
+    The server is polled with exponential backoff: poll_interval, 2 * poll_interval ... max_poll_interval.
+
+    Args:
+        host (str): host
+        port (int): port
+        timeout (float): max seconds to wait
+        poll_interval (float): first interval between polls
+        max_poll_interval (float): max interval between polls
+        process (subprocess.Popen): process of the server, waiting stops if it exits
+
+    Returns:
+        float: seconds waited
+
+    Raises:
+        TimeoutError: if server doesn't answer in timeout seconds
+        ConnectionError: if process of the server exited
+    """
+    started = time.monotonic()
+    interval = poll_interval
+    while True:
+        if is_ready(host, port, timeout=max(max_poll_interval, 1.0)):
+            waited = time.monotonic() - started
+            logger.info('Server {}:{} is ready in {:.2f} s'.format(host, port, waited))
+            return waited
+        if process is not None and process.poll() is not None:
+            raise ConnectionError('Server {}:{} exited with code {}'.format(host, port, process.returncode))
+        left = timeout - (time.monotonic() - started)
+        if left <= 0:
+            raise TimeoutError('Server {}:{} is not ready in {} s'.format(host, port, timeout))
+        time.sleep(min(interval, left))
+        interval = min(interval * 2, max_poll_interval)
+
+
+class ServerLauncher:
+    """ Starts xmlrpc servers and waits until they answer
+
+    Works on Windows (a server gets its own console) and on POSIX systems.
+
+    Attributes:
+        command (str): command of server, '{port}' is replaced by port
+        cwd (str): working directory of server
+        host (str): host of servers
+        timeout (float): max seconds to wait for a server
+        processes (dict): port -> subprocess.Popen of started servers
+    """
+
+    def __init__(self, command: str = None, cwd: str = None, host: str = 'localhost', timeout: float = 60.0,
+                 poll_interval: float = 0.05, max_poll_interval: float = 1.0):
+        """
+        Command and cwd are taken from the settings file if not provided
+
+        Args:
+            command (str): command of server, '{port}' is replaced by port
+            cwd (str): working directory of server
+            host (str): host of servers
+            timeout (float): max seconds to wait for a server
+            poll_interval (float): first interval between polls of a server
+            max_poll_interval (float): max interval between polls of a server
+        """
+        if command is None:
+            command = CONFIG['ODDS_ORACLE'].get('command', DEFAULT_COMMAND)
+        if cwd is None:
+            cwd = os.path.join(CONFIG['ODDS_ORACLE']['path'], 'ui_jar')
+            if not os.path.isdir(cwd):
+                cwd = None
+        self.command = command
+        self.cwd = cwd
+        self.host = host
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.processes = {}
+
+    def _arguments(self, port: int) -> list:
+        return [argument.format(port=port) for argument in shlex.split(self.command, posix=os.name != 'nt')]
+
+    def launch(self, port: int) -> subprocess.Popen:
+        """ Starts server without waiting
+
+        Args:
+            port (int): port of server
+
+        Returns:
+            subprocess.Popen: process of server
+        """
+        arguments = self._arguments(port)
+        logger.info('Starting server: {}'.format(' '.join(arguments)))
+        if os.name == 'nt':
+            process = subprocess.Popen(arguments, cwd=self.cwd, creationflags=subprocess.CREATE_NEW_CONSOLE)
+        else:
+            process = subprocess.Popen(arguments, cwd=self.cwd, stdout=subprocess.DEVNULL,
+                                       stderr=subprocess.DEVNULL, start_new_session=True)
+        self.processes[port] = process
+        return process
+
+    def wait(self, port: int) -> float:
+        """ Waits until server answers, see wait_ready """
+        return wait_ready(self.host, port, self.timeout, self.poll_interval, self.max_poll_interval,
+                          process=self.processes.get(port))
+
+    def start(self, port: int) -> subprocess.Popen:
+        """ Starts server and waits until it answers
+
+        Args:
+            port (int): port of server
+
+        Returns:
+            subprocess.Popen: process of server
+
+        Raises:
+            TimeoutError: if server doesn't answer in timeout seconds
+            ConnectionError: if server exited
+        """
+        process = self.launch(port)
+        try:
+            self.wait(port)
+        except BaseException:
+            self._terminate([self.processes.pop(port)])
+            raise
+        return process
+
+    def start_many(self, first_port: int, count: int) -> list:
+        """ Starts servers on consecutive ports and waits until all of them answer
+
+        Servers start simultaneously, so it takes about as long as starting one server.
+
+        Args:
+            first_port (int): port of the first server
+            count (int): number of servers
+
+        Returns:
+            list: processes of servers
+        """
+        ports = list(range(first_port, first_port + count))
+        processes = [self.launch(port) for port in ports]
+        try:
+            for port in ports:
+                self.wait(port)
+        except BaseException:
+            self._terminate([self.processes.pop(port) for port in ports])
+            raise
+        return processes
+
+    def stop(self):
+        """ Terminates started servers """
+        processes, self.processes = self.processes, {}
+        self._terminate(processes.values())
+
+    @staticmethod
+    def _terminate(processes):
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
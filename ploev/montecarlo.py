@@ -0,0 +1,241 @@
+# ploev
+# Copyright (C) 2017 Alexey Londkevich <vyvojer@gmail.com>
+
+# ploev is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# ploev is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Monte Carlo equities of ranges with NumPy
+
+Deals are sampled in batches, as OddsOracle does it: a holding of every player uniformly from the range (a mask of
+ploev.combos), deals where players share cards are rejected, the runout uniformly from the rest of the deck. Hands
+of the whole batch are evaluated at once by ploev.eval.omaha_rank_array. Every winner of a deal gets its share:
+1 / number of winners.
+
+Ranges with percentages aren't supported (combos orders holdings not as PPT does), MonteCarloError is raised for
+them and for everything else that can't be sampled, so callers can fall back to OddsOracle.
+
+Sampling can be split into shards (see ploev.parallel): Deals can be built of arrays of holdings, Deals.sums samples
+a shard with its own random generator, Sums of shards are added.
+
+Usage:
+    equity(['AsAhQh8d', 'JJ'], 'Ks7d2c', trials=100000)    # [EquityEstimate(...), EquityEstimate(...)]
+"""
+
+import time
+from collections import namedtuple
+from typing import Iterable, List
+
+import numpy as np
+
+from ploev.cards import cards_to_ints
+from ploev.combos import N_CARDS, RangeSyntaxError, conflict_mask, holdings, range_mask
+from ploev.eval import omaha_rank_array
+from ploev.ppt import EquityEstimate
+
+_BOARD_SIZES = (0, 3, 4, 5)
+
+
+class MonteCarloError(ValueError):
+    """ Equity can't be sampled """
+
+
+def _bits(cards: np.ndarray) -> np.ndarray:
+    """ Returns 52-bit masks of cards, the last axis is cards of a mask """
+    return np.bitwise_or.reduce(np.uint64(1) << cards.astype(np.uint64), axis=-1)
+
+
+def _cards(cards) -> list:
+    try:
+        cards = cards_to_ints(cards if cards else '')
+    except (KeyError, ValueError, IndexError) as error:
+        raise MonteCarloError("Wrong cards: '{}'".format(cards)) from error
+    if len(set(cards)) != len(cards):
+        raise MonteCarloError("Card in more than one place: '{}'".format(cards))
+    return cards
+
+
+def _range_cards(range_: str, alive: np.ndarray) -> np.ndarray:
+    """ Returns cards of holdings of range not containing dead and board cards, shape (n, 4) """
+    if '%' in range_:
+        raise MonteCarloError("Percentages aren't supported: '{}'".format(range_))
+    try:
+        mask = range_mask(range_) & alive
+    except RangeSyntaxError as error:
+        raise MonteCarloError(str(error)) from error
+    if not mask.any():
+        raise MonteCarloError("Card in more than one place: '{}'".format(range_))
+    return holdings()[mask].astype(np.int64)
+
+
+class Sums(namedtuple('Sums', 'shares squares trials')):
+    """ Sums of shares and squared shares of players over sampled deals and number of deals
+
+    Sums of disjoint samples are added with +.
+    """
+
+    __slots__ = ()
+
+    def __add__(self, other: 'Sums') -> 'Sums':
+        return Sums(self.shares + other.shares, self.squares + other.squares, self.trials + other.trials)
+
+    def estimates(self) -> List[EquityEstimate]:
+        """ Returns EquityEstimate of every player, stderr is estimated by variance of shares """
+        means = self.shares / self.trials
+        errors = np.sqrt(np.maximum(self.squares / self.trials - means ** 2, 0) / self.trials)
+        return [EquityEstimate(float(mean), float(error), self.trials) for mean, error in zip(means, errors)]
+
+    def is_enough(self, start: float, seconds: float = None, tolerance: float = None) -> bool:
+        """ Checks if sampling started at start (time.monotonic) must stop, see equity """
+        if seconds is not None and time.monotonic() - start >= seconds:
+            return True
+        return tolerance is not None and self.trials > 0 and max(estimate.stderr for estimate in
+                                                                 self.estimates()) <= tolerance
+
+
+class Deals:
+    """ Ranges of players, board and dead cards prepared for sampling
+
+    Args:
+        ranges (list): cards of holdings of every player, numpy arrays of shape (n, 4)
+        board (numpy.ndarray): board cards
+        used (int): 52-bit mask of board and dead cards
+    """
+
+    def __init__(self, ranges: list, board: np.ndarray, used: int):
+        self.ranges = ranges
+        self.range_bits = [_bits(cards) for cards in ranges]
+        self.board = board
+        self.used = np.uint64(used)
+
+    @classmethod
+    def from_query(cls, players: Iterable[str], board: str = None, dead: str = None) -> 'Deals':
+        """ Prepares deals of ranges of players
+
+        Raises:
+            MonteCarloError: if deals can't be sampled
+        """
+        players = list(players)
+        if len(players) < 2:
+            raise MonteCarloError('At least two players are needed')
+        board = _cards(board)
+        dead = _cards(dead)
+        if len(board) not in _BOARD_SIZES:
+            raise MonteCarloError('Board must contain 0, 3, 4 or 5 cards')
+        if set(board) & set(dead):
+            raise MonteCarloError('Card in more than one place')
+        alive = ~conflict_mask(board + dead)
+        return cls([_range_cards(player, alive) for player in players], np.array(board, dtype=np.int64),
+                   _bits(np.array(board + dead, dtype=np.int64)))
+
+    def sums(self, trials: int, batch_size: int, rng: np.random.Generator, stop=None) -> Sums:
+        """ Samples trials accepted deals in batches
+
+        Args:
+            trials (int): number of deals
+            batch_size (int): number of deals sampled at once
+            rng (numpy.random.Generator): random generator
+            stop: function of Sums of deals sampled so far, sampling stops when it returns True (optional)
+
+        Returns:
+            Sums: sums of sampled deals
+
+        Raises:
+            MonteCarloError: if players share cards in all deals of the first batch
+        """
+        sums = Sums(0, 0, 0)
+        while sums.trials < trials:
+            shares = self.sample(min(batch_size, trials), rng)[:, :trials - sums.trials]
+            if not shares.shape[1] and not sums.trials:
+                raise MonteCarloError('Players share cards in all sampled deals')
+            sums += Sums(shares.sum(axis=1), (shares ** 2).sum(axis=1), shares.shape[1])
+            if stop is not None and stop(sums):
+                break
+        return sums
+
+    def sample(self, size: int, rng: np.random.Generator) -> np.ndarray:
+        """ Samples deals, deals with players sharing cards are rejected
+
+        Returns:
+            numpy.ndarray: shares of players in accepted deals, shape (players, deals)
+        """
+        used = np.full(size, self.used, dtype=np.uint64)
+        accepted = np.ones(size, dtype=bool)
+        holes = []
+        for cards, bits in zip(self.ranges, self.range_bits):
+            index = rng.integers(len(cards), size=size)
+            accepted &= (used & bits[index]) == 0
+            used |= bits[index]
+            holes.append(cards[index])
+        deals = int(accepted.sum())
+        if not deals:
+            return np.zeros((len(holes), 0))
+        boards = np.broadcast_to(self.board, (deals, len(self.board)))
+        missing = 5 - len(self.board)
+        if missing:
+            # The missing cards are the ones with the smallest random keys, used cards get bigger keys
+            keys = rng.random((deals, N_CARDS))
+            keys[((used[accepted, None] >> np.arange(N_CARDS, dtype=np.uint64)) & np.uint64(1)).astype(bool)] = 2
+            boards = np.concatenate([boards, np.argpartition(keys, missing - 1, axis=1)[:, :missing]], axis=1)
+        values = np.stack([omaha_rank_array(cards[accepted], boards) for cards in holes])
+        winners = values == values.max(axis=0)
+        return winners / winners.sum(axis=0)
+
+
+def equity(players: Iterable[str], board: str = None, dead: str = None, trials: int = 100000,
+           seconds: float = None, tolerance: float = None, batch_size: int = 10000,
+           seed=None) -> List[EquityEstimate]:
+    """ Returns equities of players sampled by Monte Carlo
+
+    Sampling stops after trials deals, or after seconds, or when standard errors of all equities are not bigger
+    than tolerance, whatever comes first.
+
+    Args:
+        players (Iterable[str]): ranges of players
+        board (str): board of 0, 3, 4 or 5 cards (optional)
+        dead (str): dead cards (optional)
+        trials (int): max number of deals
+        seconds (float): max seconds of sampling (optional)
+        tolerance (float): required standard error of equities (optional)
+        batch_size (int): number of deals sampled at once
+        seed: seed of numpy.random.default_rng (optional)
+
+    Returns:
+        list: EquityEstimate of every player, stderr is estimated by variance of shares
+
+    Raises:
+        MonteCarloError: if equity can't be sampled
+    """
+    deals = Deals.from_query(players, board, dead)
+    start = time.monotonic()
+
+    def stop(sums: Sums) -> bool:
+        return sums.is_enough(start, seconds, tolerance)
+
+    return deals.sums(trials, batch_size, np.random.default_rng(seed), stop).estimates()
+
+
+def hero_equity(hero: str, villains: Iterable[str], board: str = None, dead: str = None,
+                **kwargs) -> EquityEstimate:
+    """ Returns hero's equity sampled by Monte Carlo, see equity
+
+    Args:
+        hero (str): hero's range
+        villains (Iterable[str]): ranges of villains
+        board (str): board of 0, 3, 4 or 5 cards (optional)
+        dead (str): dead cards (optional)
+        **kwargs: trials, seconds, tolerance, batch_size and seed, see equity
+
+    Returns:
+        EquityEstimate: hero's equity
+    """
+    return equity([hero] + list(villains), board, dead, **kwargs)[0]
@@ -0,0 +1,240 @@
+# ploev
+# Copyright (C) 2017 Alexey Londkevich <vyvojer@gmail.com>
+
+# ploev is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# ploev is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Local equities computed by a pool of processes
+
+ShardedExecutor splits the work of ploev.exact and ploev.montecarlo into shards and runs them in a
+concurrent.futures.ProcessPoolExecutor:
+
+    * exact enumeration is split into runouts of the board and blocks of hero's holdings, outcomes of shards are
+      summed;
+    * Monte Carlo trials are split between workers, every shard samples with its own random stream spawned from
+      one numpy.random.SeedSequence, sums of shares of shards are summed.
+
+Arrays of holdings are put into multiprocessing.shared_memory once per computation and shards get only names of
+the blocks, so ranges aren't pickled for every shard. Workers use views of the blocks without copying them.
+
+Usage:
+    with ShardedExecutor(workers=32) as executor:
+        executor.monte_carlo_equity(['AsAhQh8d', 'JJ'], 'Ks7d2c', seed=1)
+        executor.exact_outcomes('AsAhQh8d', ['JJ'], 'Ks7d2cTs')
+"""
+
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+from typing import Iterable, List
+
+import numpy as np
+
+from ploev import exact, montecarlo
+from ploev.ppt import EquityEstimate
+
+
+class _SharedArray:
+    """ Copy of an array in shared memory, processes attach to it by descriptor (name, shape, dtype) """
+
+    def __init__(self, array: np.ndarray):
+        array = np.ascontiguousarray(array)
+        self._memory = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, array.dtype, buffer=self._memory.buf)[...] = array
+        self.descriptor = (self._memory.name, array.shape, array.dtype.str)
+
+    def release(self):
+        self._memory.close()
+        self._memory.unlink()
+
+
+class _Attached:
+    """ Shared memory attached by a worker process
+
+    Views of the memory reference the array of the whole memory (their common base). Closing the memory while there
+    are views would crash the process, so it's detached only when the array isn't referenced by views.
+    """
+
+    def __init__(self, descriptor: tuple):
+        name, shape, dtype = descriptor
+        self._memory = shared_memory.SharedMemory(name=name)
+        self._array = np.ndarray(shape, dtype, buffer=self._memory.buf)
+        self._array.flags.writeable = False
+        self._references = sys.getrefcount(self._array)
+
+    def view(self) -> np.ndarray:
+        return self._array.view()
+
+    def is_viewed(self) -> bool:
+        return sys.getrefcount(self._array) > self._references
+
+    def detach(self):
+        self._array = None
+        self._memory.close()
+
+
+# Shared memory attached by a worker process, by name
+_attached = {}
+
+
+def _view(descriptor: tuple) -> np.ndarray:
+    """ Returns a read-only view of a shared array, the memory stays attached until _detach """
+    name = descriptor[0]
+    if name not in _attached:
+        _attached[name] = _Attached(descriptor)
+    return _attached[name].view()
+
+
+def _detach(keep: Iterable[tuple]):
+    """ Detaches shared memory of finished computations, but the one of descriptors to keep
+
+    Shards don't detach memory they view, it's detached by the next shards.
+    """
+    keep = {name for name, _, _ in keep}
+    for name in list(_attached):
+        if name not in keep and not _attached[name].is_viewed():
+            _attached.pop(name).detach()
+
+
+def _split(size: int, parts: int) -> list:
+    """ Splits size into at most parts nonzero sizes differing by one at most """
+    return [size // parts + (part < size % parts) for part in range(min(size, parts))]
+
+
+def _exact_shard(heroes: tuple, villains: tuple, start: int, stop: int, board: tuple,
+                 runout: tuple) -> exact.Outcomes:
+    _detach([heroes, villains])
+    return exact.runout_outcomes(_view(heroes)[start:stop], _view(villains), board, runout)
+
+
+def _monte_carlo_shard(ranges: list, board: np.ndarray, used: int, trials: int, batch_size: int,
+                       seed: np.random.SeedSequence) -> montecarlo.Sums:
+    _detach(ranges)
+    deals = montecarlo.Deals([_view(descriptor) for descriptor in ranges], board, used)
+    return deals.sums(trials, batch_size, np.random.default_rng(seed))
+
+
+class ShardedExecutor:
+    """ Computes local equities in a pool of processes
+
+    Processes are started with the first computation and live until shutdown.
+
+    Args:
+        workers (int): number of processes, os.cpu_count() if None
+    """
+
+    def __init__(self, workers: int = None):
+        self.workers = workers if workers else os.cpu_count() or 1
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            return self._pool
+
+    def shutdown(self):
+        """ Stops processes of the pool """
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+
+    def exact_outcomes(self, hero: str, villains: Iterable[str], board: str, dead: str = None) -> exact.Outcomes:
+        """ Enumerates all deals like ploev.exact.outcomes
+
+        Args:
+            hero (str): hero's range
+            villains (Iterable[str]): villain's range (the only one)
+            board (str): board of 4 or 5 cards
+            dead (str): dead cards (optional)
+
+        Returns:
+            Outcomes: numbers of deals won and tied by hero and number of all deals
+
+        Raises:
+            ExactEquityError: if equity can't be enumerated exactly or there are no deals
+        """
+        heroes, villains, board, runouts = exact.deals(hero, villains, board, dead)
+        blocks = _split(len(heroes), -(-self.workers // len(runouts)))
+        bounds = np.cumsum([0] + blocks)
+        shared = [_SharedArray(heroes), _SharedArray(villains)]
+        futures = []
+        try:
+            futures = [self.pool.submit(_exact_shard, shared[0].descriptor, shared[1].descriptor, start, stop,
+                                        board, runout)
+                       for runout in runouts for start, stop in zip(bounds[:-1], bounds[1:])]
+            return exact.merge_outcomes(future.result() for future in futures)
+        finally:
+            wait(futures)
+            for array in shared:
+                array.release()
+
+    def monte_carlo_equity(self, players: Iterable[str], board: str = None, dead: str = None, trials: int = 100000,
+                           seconds: float = None, tolerance: float = None, batch_size: int = 10000,
+                           seed=None) -> List[EquityEstimate]:
+        """ Samples equities like ploev.montecarlo.equity
+
+        Trials are sampled in rounds of at most workers * batch_size deals, seconds and tolerance are checked
+        after every round. Every shard has its own random stream, so equities depend only on seed if seconds
+        aren't limited.
+
+        Args:
+            players (Iterable[str]): ranges of players
+            board (str): board of 0, 3, 4 or 5 cards (optional)
+            dead (str): dead cards (optional)
+            trials (int): max number of deals
+            seconds (float): max seconds of sampling (optional)
+            tolerance (float): required standard error of equities (optional)
+            batch_size (int): number of deals sampled at once by a worker
+            seed: entropy of numpy.random.SeedSequence (optional)
+
+        Returns:
+            list: EquityEstimate of every player
+
+        Raises:
+            MonteCarloError: if equity can't be sampled
+        """
+        deals = montecarlo.Deals.from_query(players, board, dead)
+        shared = [_SharedArray(cards) for cards in deals.ranges]
+        ranges = [array.descriptor for array in shared]
+        seeds = np.random.SeedSequence(seed)
+        sums = montecarlo.Sums(0, 0, 0)
+        start = time.monotonic()
+        futures = []
+        try:
+            while sums.trials < trials:
+                shards = _split(min(trials - sums.trials, self.workers * batch_size), self.workers)
+                futures = [self.pool.submit(_monte_carlo_shard, ranges, deals.board, int(deals.used), shard,
+                                            batch_size, shard_seed)
+                           for shard, shard_seed in zip(shards, seeds.spawn(len(shards)))]
+                for future in futures:
+                    sums += future.result()
+                if sums.is_enough(start, seconds, tolerance):
+                    break
+        finally:
+            wait(futures)
+            for array in shared:
+                array.release()
+        return sums.estimates()
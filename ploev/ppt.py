@@ -17,15 +17,25 @@
 """ Classes for working with Odds Oracle and PQL"""
 
 import re
-import os
+import math
+import contextlib
 import functools
-import subprocess
+import threading
 import time
 import xmlrpc.client
 import logging
-import pyparsing as pp
+from collections import namedtuple, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from ploev.settings import CONFIG
-from typing import Iterable
+from ploev.cache import Cache, MemoryCache, make_key
+from ploev.canonical import canonical_equity_query, canonical_pql
+from ploev.compact import compact_pql, compact_range
+from ploev.launcher import ServerLauncher
+from ploev.recording import Recorder, read_recording
+from ploev.samples import is_mergeable_pql, merge_equity_results, sample_trials
+from ploev.stats import QueryStats, find_caller
+from ploev.transport import KeepAliveTransport, TransportStats
+from typing import Iterable, List, Optional
 
 # noinspection SqlNoDataSourceInspection
 
@@ -69,12 +79,19 @@ class OddsOracle:
         threads (int): number of threads
         syntax (str): query syntax
         game: (str): game query
+        cache (Cache): cache of results
+        canonicalize (bool): if True, queries are sent and cached in suit-isomorphic canonical form
+        compact (bool): if True, ranges of queries are compacted before sending, see ploev.compact
+        query_stats (QueryStats): statistics of queries, see OddsOracle.stats
+        merge_samples (bool): if True, equity and avg/count PQL results are cached with their trials and refined
+            by the missing trials when more trials are requested, see ploev.samples
+        recorder (Recorder): if set, every call of the server is recorded, see OddsOracle.recording
+        timeout (float): socket timeout of requests in seconds, None - no timeout
+        gzip_threshold (int): request bodies longer than gzip_threshold bytes are gzip-encoded, None - never
+        transport_stats (TransportStats): counters of HTTP requests of all threads
 
     """
     _CONFIG_FILE = 'odds_oracle.ini'
-    _JAVA_CLASS_FOLDER = 'ui_jar'
-    _JAVA_JAR = 'p2.jar'
-    _JAVA_CLASS = 'propokertools.cli.XMLRPCServer'
 
     _XMLRPC = 'http://{host}:{port}/xmlrpc'
 
@@ -82,7 +99,9 @@ class OddsOracle:
 
     def __init__(self, host: str = None, port: str = None,
                  trials: int = None, seconds: int = None, threads: int = None,
-                 syntax: str = None, game: str = None, connect: bool = True):
+                 syntax: str = None, game: str = None, connect: bool = True, cache: Cache = None,
+                 canonicalize: bool = True, merge_samples: bool = False, compact: bool = True,
+                 timeout: float = None, gzip_threshold: int = None):
         """
         Arguments host, port, trials, secondd, threads, syntax, game takes from settings file if not provided
 
@@ -95,6 +114,17 @@ class OddsOracle:
             syntax (str): query syntax
             game (str): game query
             connect (bool): tries to run and connect OddsOracle if True
+            cache (Cache): cache of results, in-memory LRU cache if not provided.
+                Use ploev.cache.SqliteCache to keep results between sessions and processes
+            canonicalize (bool): if True, queries are sent and cached in suit-isomorphic canonical form
+                (only for generic syntax), so 'As7h2d' and 'Ac7s2h' flops share one cached result
+            merge_samples (bool): if True, a cached result computed with fewer trials than requested isn't
+                recomputed: only the missing trials are sent to the server and the samples are merged
+            compact (bool): if True, ranges are rewritten to shorter equivalent ones before sending and caching
+                (only for generic syntax)
+            timeout (float): socket timeout of requests in seconds, None - no timeout
+            gzip_threshold (int): request bodies longer than gzip_threshold bytes are gzip-encoded (big multiway
+                ranges), None - never. The encoding is turned off if the server refuses it
         """
 
         self.path = CONFIG['ODDS_ORACLE']['path']
@@ -127,13 +157,33 @@ class OddsOracle:
             self.game = game
         else:
             self.game = CONFIG['PQL']['game']
+        if cache is not None:
+            self.cache = cache
+        else:
+            self.cache = MemoryCache()
+        self.canonicalize = canonicalize
+        self.compact = compact
+        self.merge_samples = merge_samples
+        self.recorder = None
+        self.timeout = timeout
+        self.gzip_threshold = gzip_threshold
+        self.query_stats = QueryStats()
+        self.transport_stats = TransportStats()
+        # Futures of queries being sent to the server, concurrent identical queries wait for them
+        self._flights = {}
+        self._flights_lock = threading.Lock()
         self._client = None
+        # ServerProxy isn't thread-safe, so every thread has its own client
+        self._local = threading.local()
+        self._multicall_supported = None
         if connect:
             self.get_client()
 
     def get_client(self):
         """ Return xmlrpc client of OddsOracle
 
+        The client belongs to the current thread, other threads create their own clients.
+
         Returns:
             xmlrpc.client.ServerProxy
 
@@ -143,12 +193,12 @@ class OddsOracle:
 
         def connect():
             server.PPTServer.executePQL('', 10, 1, 1)
-            self._client = server
+            self._client = self._local.client = server
             self.logger.info('Successfully connected to {}'.format(url))
             return self._client
 
-        url = OddsOracle._XMLRPC.format(host=self._host, port=self._port)
-        server = xmlrpc.client.ServerProxy(url)
+        url = self._url()
+        server = self._server_proxy(url)
         try:
             return connect()
         except ConnectionError:
@@ -161,26 +211,122 @@ class OddsOracle:
                 raise ConnectionError(
                     "Connection to {} failed: \r\n{}. \r\nIs OddsOracle server running?".format(url, exception))
 
+    def _url(self) -> str:
+        return OddsOracle._XMLRPC.format(host=self._host, port=self._port)
+
+    def _thread_client(self) -> xmlrpc.client.ServerProxy:
+        """ Returns xmlrpc client of the current thread """
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self._server_proxy(self._url())
+        return client
+
+    def _server_proxy(self, url: str) -> xmlrpc.client.ServerProxy:
+        """ Returns new xmlrpc client with keep-alive transport """
+        transport = KeepAliveTransport(timeout=self.timeout, gzip_threshold=self.gzip_threshold,
+                                       stats=self.transport_stats)
+        return xmlrpc.client.ServerProxy(url, transport=transport)
+
     def run_server(self):
-        """ Tries to run OddsOracle server """
-        command = 'cmd /K java  -Duser.language=en-US -cp {} {} {}'.format(self._JAVA_JAR, self._JAVA_CLASS, self._port)
-        cwd = os.path.join(self.path, OddsOracle._JAVA_CLASS_FOLDER)
-        self.server = subprocess.Popen(command, cwd=cwd, creationflags=subprocess.CREATE_NEW_CONSOLE)
-        time.sleep(6)
+        """ Tries to run OddsOracle server and waits until it answers
+
+        Raises:
+            ConnectionError: if server can't be started
+        """
+        launcher = ServerLauncher(host=self._host)
+        try:
+            self.server = launcher.start(int(self._port))
+        except OSError as exception:
+            raise ConnectionError("Can't start OddsOracle server: {}".format(exception)) from exception
+
+    def _pql_key(self, pql: str, trials: int = None, seconds: int = None) -> str:
+        trials = self.trials if trials is None else trials
+        seconds = self.seconds if seconds is None else seconds
+        return make_key('pql', self.game, self.syntax, trials, seconds, pql)
+
+    def _equity_key(self, hands: tuple, board: str, dead: str) -> str:
+        return make_key('equity', self.game, self.syntax, self.trials, self.seconds, list(hands), board, dead)
 
-    @functools.lru_cache()
-    def pql(self, pql: str):
+    def _is_canonicalizable(self) -> bool:
+        return self.canonicalize and self.syntax.lower() == 'generic'
+
+    def _is_compactable(self) -> bool:
+        return self.compact and self.syntax.lower() == 'generic'
+
+    def _canonical_pql(self, pql: str) -> str:
+        if self._is_compactable():
+            pql = compact_pql(pql)
+        if self._is_canonicalizable():
+            return canonical_pql(pql)
+        return pql
+
+    def _canonical_equity(self, hands: tuple, board: str, dead: str) -> tuple:
+        if self._is_compactable():
+            hands = tuple(compact_range(hand) for hand in hands)
+        if self._is_canonicalizable():
+            return canonical_equity_query(hands, board, dead)
+        return hands, board, dead
+
+    def pql(self, pql: str, trials: int = None, seconds: int = None):
         """
         Invoke OddsOracle's executePQL
 
+        Results are taken from the cache if possible.
+
         Args:
             pql (str): PQL query
+            trials (int): max trials for the query, OddsOracle.trials if not provided
+            seconds (int): max seconds for the query, OddsOracle.seconds if not provided
 
         Returns:
             PqlResult: result of query
 
         """
-        result = self._client.PPTServer.executePQL(pql, self.trials, self.seconds, self.threads)
+        return self._pql(pql, trials, seconds, self._caller())
+
+    def _pql(self, pql: str, trials: int, seconds: int, caller: str) -> 'PqlResult':
+        query = self._canonical_pql(pql)
+        sampling = self._pql_sampling(query, trials, lambda missing: self._execute_pql(query, missing, seconds))
+        key = self._pql_cache_key(query, trials, seconds, sampling)
+        return self._cached_query('pql', pql, key, caller,
+                                  execute=lambda: self._execute_pql(query, trials, seconds),
+                                  check=functools.partial(self._check_pql_result, pql),
+                                  parse=PqlResult, sampling=sampling)
+
+    def _pql_sampling(self, query: str, trials: int, execute) -> '_Sampling':
+        """ Returns _Sampling of PQL query or None if its samples aren't merged """
+        if not self.merge_samples or not is_mergeable_pql(query):
+            return None
+        return _Sampling(self.trials if trials is None else trials, execute, merge_pql_results)
+
+    def _equity_sampling(self, execute) -> '_Sampling':
+        """ Returns _Sampling of equity query or None if its samples aren't merged """
+        if not self.merge_samples:
+            return None
+        return _Sampling(self.trials, execute, merge_equity_results)
+
+    def _sample_key(self, kind: str, *query) -> str:
+        """ Key of merged samples doesn't depend on trials """
+        return make_key(kind + '-samples', self.game, self.syntax, *query)
+
+    def _pql_cache_key(self, query: str, trials: int, seconds: int, sampling: '_Sampling') -> str:
+        """ Returns key of canonical PQL query, the key of merged samples if sampling is provided
+
+        All ways of sending queries (OddsOracle.pql, batches, PqlPlanner) share keys, so they share results.
+        """
+        return self._pql_key(query, trials, seconds) if sampling is None else self._sample_key('pql', query)
+
+    def _equity_cache_key(self, query: tuple, sampling: '_Sampling') -> str:
+        """ Returns key of canonical equity query (hands, board, dead), see _pql_cache_key """
+        return self._equity_key(*query) if sampling is None else self._sample_key('equity', *query)
+
+    def _execute_pql(self, pql: str, trials: int = None, seconds: int = None) -> str:
+        trials = self.trials if trials is None else trials
+        seconds = self.seconds if seconds is None else seconds
+        return self._call('PPTServer.executePQL', pql, trials, seconds, self.threads)
+
+    @staticmethod
+    def _check_pql_result(pql: str, result: str):
         logger = logging.getLogger('ppt.OddsOracle.pql')
         logger.info('Really executed PQL: \n{} \nGot result: \n{}'.format(pql, result))
         if 'ERROR' in result:
@@ -188,13 +334,13 @@ class OddsOracle:
                 raise PqlCardInMoreThanOnePlaceError(pql, result)
             else:
                 raise PqlError(pql, result)
-        return PqlResult(result)
 
-    @functools.lru_cache(typed=True)
     def equity(self, hands: tuple, board: str = '', dead: str = '') -> list:
         """
         Invoke OddsOracle's computeEquityAuto
 
+        Results are taken from the cache if possible.
+
         Args:
             hands(list): list of hands
             board(str): board
@@ -204,31 +350,810 @@ class OddsOracle:
             list: list of equities
 
         """
+        return self._equity(hands, board, dead, self._caller())
+
+    def _equity(self, hands: tuple, board: str, dead: str, caller: str) -> list:
+        hands = tuple(hands)
+        query = self._canonical_equity(hands, board, dead)
+        sampling = self._equity_sampling(lambda missing: self._compute_equity(*query, trials=missing))
+        key = self._equity_cache_key(query, sampling)
+        return self._cached_query('equity', self._equity_text(hands, board, dead), key, caller,
+                                  execute=lambda: self._compute_equity(*query),
+                                  check=functools.partial(self._check_equity_result, hands, board, dead),
+                                  parse=self._parse_equity_result, sampling=sampling)
+
+    def map_pql(self, pqls: Iterable[str], trials: int = None, seconds: int = None, max_workers: int = 8,
+                batch_size: int = None) -> list:
+        """ Executes PQL queries simultaneously
+
+        If batch_size is provided, queries are sent in batches (see QueryBatch, not more than batch_size queries
+        per batch) and batches are sent simultaneously.
+
+        Args:
+            pqls (Iterable[str]): PQL queries
+            trials (int): max trials for each query, OddsOracle.trials if not provided
+            seconds (int): max seconds for each query, OddsOracle.seconds if not provided
+            max_workers (int): max number of queries (or batches) sent to the server at the same time
+            batch_size (int): max number of queries in one batch, queries aren't batched if not provided
+
+        Returns:
+            list: PqlResult for every query in the same order
+
+        Raises:
+            PqlError: the first error of queries
+            ValueError: trials or seconds are provided with batch_size (batches use OddsOracle settings)
+        """
+        if batch_size is None:
+            caller = self._caller()
+            return self._map(lambda pql: self._pql(pql, trials, seconds, caller), pqls, max_workers)
+        if trials is not None or seconds is not None:
+            raise ValueError('Batched queries use trials and seconds of OddsOracle')
+        batches = []
+        pql_results = []
+        for pql in pqls:
+            if not batches or len(batches[-1]) >= batch_size:
+                batches.append(self.batch(batch_size))
+            pql_results.append(batches[-1].pql(pql))
+        self._map(QueryBatch.execute, batches, max_workers)
+        return [pql_result.result() for pql_result in pql_results]
+
+    def map_equity(self, queries: Iterable[tuple], max_workers: int = 8) -> list:
+        """ Computes equities simultaneously
+
+        Usage:
+            odds_oracle.map_equity([(('AA', 'KK'), 'Ks7d2c'), (('AA', 'QQ'), 'Ks7d2c', '5h')])
+
+        Args:
+            queries (Iterable[tuple]): arguments of equity: (hands, ), (hands, board) or (hands, board, dead)
+            max_workers (int): max number of queries sent to the server at the same time
+
+        Returns:
+            list: list of equities for every query in the same order
+
+        Raises:
+            ComputeEquityError: the first error of queries
+        """
+        caller = self._caller()
+
+        def equity(query):
+            hands, board, dead = (tuple(query) + ('', ''))[:3]
+            return self._equity(hands, board, dead, caller)
+
+        return self._map(equity, queries, max_workers)
+
+    @staticmethod
+    def _map(function, items: Iterable, max_workers: int) -> list:
+        items = list(items)
+        if len(items) <= 1 or max_workers <= 1:
+            return [function(item) for item in items]
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+            return list(executor.map(function, items))
+
+    def _cached_query(self, kind: str, text: str, key: str, caller: str, execute, check, parse,
+                      sampling: '_Sampling' = None):
+        """ Returns parsed result from the cache or from the server and records statistics
+
+        Concurrent identical queries (with the same key) aren't sent to the server twice: the first one goes to the
+        server and the others wait for its result or exception.
+
+        If sampling is provided, the cached result is a merged sample. It's refined with the missing trials if it
+        has fewer trials than sampling.trials.
+        """
+        result = self.cache.get(key)
+        hit = self._is_enough(result, sampling)
+        shared = False
+        server_seconds = 0.0
+        if not hit:
+            flight, leader = self._join_flight(key)
+            if leader:
+                started = time.perf_counter()
+                try:
+                    # The previous identical query could finish between cache.get and _join_flight
+                    result = self.cache.get(key)
+                    hit = self._is_enough(result, sampling)
+                    if not hit:
+                        if sampling is None:
+                            result = execute()
+                            check(result)
+                        else:
+                            sample = sampling.execute(sampling.trials - (0 if result is None else sample_trials(result)))
+                            check(sample)
+                            result = sampling.merge(result, sample)
+                        server_seconds = time.perf_counter() - started
+                        self.cache.set(key, result)
+                except BaseException as exception:
+                    self._land_flight(key, flight, exception=exception)
+                    self.query_stats.record(kind, caller, hit=False, server_seconds=time.perf_counter() - started,
+                                            error=True, query=text)
+                    raise
+                self._land_flight(key, flight, result)
+            else:
+                try:
+                    result = flight.result()
+                except BaseException:
+                    self.query_stats.record(kind, caller, hit=True, shared=True, error=True, query=text)
+                    raise
+                if not self._is_enough(result, sampling):
+                    # The flight was for fewer trials
+                    return self._cached_query(kind, text, key, caller, execute, check, parse, sampling)
+                hit = shared = True
+        started = time.perf_counter()
+        parsed = parse(result)
+        self.query_stats.record(kind, caller, hit, server_seconds, len(result), time.perf_counter() - started,
+                                query=text, shared=shared)
+        return parsed
+
+    @staticmethod
+    def _is_enough(result: str, sampling: '_Sampling') -> bool:
+        """ Returns True if cached result has enough trials """
+        if result is None:
+            return False
+        if sampling is None:
+            return True
+        trials = sample_trials(result)
+        return trials is None or trials >= sampling.trials
+
+    def _join_flight(self, key: str) -> tuple:
+        """ Returns (future, leader), the leader sends the query and others wait for the future """
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = self._flights[key] = Future()
+            return flight, True
+
+    def _land_flight(self, key: str, flight: Future, result: str = None, exception: BaseException = None):
+        """ Finishes the flight of the leader: sets result or exception for waiting queries """
+        with self._flights_lock:
+            del self._flights[key]
+        if exception is not None:
+            flight.set_exception(exception)
+        else:
+            flight.set_result(result)
+
+    def _caller(self) -> Optional[str]:
+        """ Returns caller of a query, None if query_stats doesn't need it (finding it isn't cheap) """
+        if not self.query_stats.needs_callers:
+            return None
+        return find_caller((OddsOracle, QueryBatch, PqlPlanner), depth=3)
+
+    @staticmethod
+    def _equity_text(hands: tuple, board: str, dead: str) -> str:
+        return 'equity {} board={} dead={}'.format(list(hands), board, dead)
+
+    def stats(self) -> dict:
+        """ Returns statistics of queries: calls, cache hits and misses, server latency, response sizes, parse time
+
+        Statistics are grouped by kind of query ('pql', 'equity') and by caller if query_stats.track_callers is True.
+        Caller is 'origin > api', for example 'GameTree._calculate_equities > Pql.equity'. Set
+        query_stats.slow_query_seconds to log slow queries.
+
+        HTTP requests of all queries are counted in 'transport' (see TransportStats.snapshot).
+
+        Returns:
+            dict: see QueryStats.snapshot, and 'transport' counters
+        """
+        snapshot = self.query_stats.snapshot()
+        snapshot['transport'] = self.transport_stats.snapshot()
+        return snapshot
+
+    def reset_stats(self):
+        """ Removes all statistics of queries """
+        self.query_stats.reset()
+        self.transport_stats.reset()
+
+    def _compute_equity(self, hands: tuple, board: str, dead: str, trials: int = None) -> str:
         self.logger.debug(f'Really calculated (not cashed)')
-        result = self._client.PPTServer.computeEquityAuto(self.game, board, dead, self.syntax, hands,
-                                                          self.trials, self.seconds, self.threads)
+        trials = self.trials if trials is None else trials
+        return self._call('PPTServer.computeEquityAuto', self.game, board, dead, self.syntax, list(hands),
+                          trials, self.seconds, self.threads)
+
+    def _check_equity_result(self, hands: tuple, board: str, dead: str, result: str):
         if 'Error' in result:
             if 'cannot be in more than one place at the same time' in result:
                 raise ComputeEquityCardInMoreThanOnePlaceError(board=board, dead=dead, hands=hands, result=result)
             else:
                 raise ComputeEquityError(board=board, dead=dead, hands=hands, result=result)
         self.logger.debug('Equity result: {}'.format(result))
-        return self._parse_equity_result(result)
+
+    def _call(self, method: str, *params):
+        """ Invoke method of the server, for example 'PPTServer.executePQL', and records the call """
+        if self.recorder is None:
+            return self._send(method, *params)
+        started = time.perf_counter()
+        try:
+            result = self._send(method, *params)
+        except xmlrpc.client.Fault as fault:
+            self._record(method, params, fault=fault, seconds=time.perf_counter() - started)
+            raise
+        self._record(method, params, result, seconds=time.perf_counter() - started)
+        return result
+
+    def _send(self, method: str, *params):
+        """ Sends call to the server """
+        return getattr(self._thread_client(), method)(*params)
+
+    @contextlib.contextmanager
+    def recording(self, path: str):
+        """ Records calls of the server to a file while in the context
+
+        Usage:
+            with odds_oracle.recording('traffic.jsonl.gz'):
+                tree.calculate()
+
+        Calls are recorded with responses and latencies, see ploev.recording and ReplayOddsOracle.
+        Cached results don't go to the server, so they aren't recorded.
+
+        Args:
+            path (str): path of the recording, calls are appended if it exists
+
+        Yields:
+            Recorder: recorder
+        """
+        recorder = Recorder(path)
+        self.recorder = recorder
+        try:
+            yield recorder
+        finally:
+            self.recorder = None
+            recorder.close()
+
+    def _record(self, method: str, params: tuple, result=None, seconds: float = 0.0,
+                fault: xmlrpc.client.Fault = None):
+        """ Records call, calls of system.multicall are recorded one by one with equal shares of latency """
+        recorder = self.recorder
+        if recorder is None:
+            return
+        if method != 'system.multicall':
+            recorder.record(method, params, result, seconds,
+                            None if fault is None else (fault.faultCode, fault.faultString))
+        elif fault is None:
+            calls = params[0]
+            for call, answer in zip(calls, result):
+                if isinstance(answer, dict):
+                    recorder.record(call['methodName'], call['params'], seconds=seconds / len(calls),
+                                    fault=(answer.get('faultCode'), answer.get('faultString')))
+                else:
+                    recorder.record(call['methodName'], call['params'], answer[0], seconds / len(calls))
+
+    def batch(self, max_size: int = 64) -> 'QueryBatch':
+        """ Returns a batch of queries which will be sent to the server together
+
+        Args:
+            max_size (int): max number of queries in one request
+
+        Returns:
+            QueryBatch: empty batch
+        """
+        return QueryBatch(self, max_size)
+
+    def _multicall(self, calls: list) -> list:
+        """ Invoke several methods of the server
+
+        Calls are sent in one system.multicall request if the server supports it, otherwise one by one.
+
+        Args:
+            calls (list): list of tuples (method, params)
+
+        Returns:
+            list: results of calls, xmlrpc.client.Fault for failed calls
+        """
+        if self._multicall_supported is not False:
+            multicall = [{'methodName': method, 'params': list(params)} for method, params in calls]
+            try:
+                answers = self._call('system.multicall', multicall)
+            except xmlrpc.client.Fault as fault:
+                self.logger.info('system.multicall is not supported ({}), calls will be sent one by one'.format(fault))
+                self._multicall_supported = False
+            else:
+                self._multicall_supported = True
+                return [self._multicall_answer(answer) for answer in answers]
+        return self._call_many(calls)
+
+    @staticmethod
+    def _multicall_answer(answer):
+        if isinstance(answer, dict):
+            return xmlrpc.client.Fault(answer.get('faultCode'), answer.get('faultString'))
+        return answer[0]
+
+    def _call_many(self, calls: list) -> list:
+        """ Invoke several methods of the server one by one """
+        results = []
+        for method, params in calls:
+            try:
+                results.append(self._call(method, *params))
+            except xmlrpc.client.Fault as fault:
+                results.append(fault)
+        return results
 
     @staticmethod
     def _parse_equity_result(result: str) -> list:
         equities = []
         for m in re.finditer(r"(.+) = (.+?)% (.+)\n", result):
-            equities.append(round(float(m.group(2)) / 100, 3))
+            equities.append(round_equity(float(m.group(2)) / 100))
         return equities
 
 
+# Merged samples of a query: requested trials, function(missing trials) returning result of the server, merge function
+_Sampling = namedtuple('_Sampling', 'trials execute merge')
+
+# params - function(trials) returning params of the method, sampling - _Sampling (without execute) or None
+_BatchQuery = namedtuple('_BatchQuery', 'method params check parse kind text caller sampling')
+
+
+class QueryBatch:
+    """ Batch of queries sent to OddsOracle together
+
+    Queries are sent in system.multicall requests (not more than max_size queries per request), or one by one
+    if the server doesn't support system.multicall. Cached results don't go to the server at all. If OddsOracle
+    merges samples, results are cached as merged samples like results of OddsOracle.pql and OddsOracle.equity, and
+    only the missing trials are requested.
+
+    Usage:
+        with odds_oracle.batch() as batch:
+            equity = batch.equity(('AA', 'KK'), board='Ks7d2c')
+            result = batch.pql(pql)
+        equity.result(), result.result()
+
+    Attributes:
+        odds_oracle (OddsOracle): OddsOracle
+        max_size (int): max number of queries in one request
+    """
+
+    def __init__(self, odds_oracle: OddsOracle, max_size: int = 64):
+        self.odds_oracle = odds_oracle
+        self.max_size = max_size
+        self._queries = OrderedDict()
+
+    def __len__(self):
+        return sum(len(futures) for _, futures in self._queries.values())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.execute()
+
+    def _add(self, key: str, query: _BatchQuery) -> Future:
+        future = Future()
+        self._queries.setdefault(key, (query, []))[1].append(future)
+        return future
+
+    def pql(self, pql: str) -> Future:
+        """ Adds PQL query
+
+        Args:
+            pql (str): PQL query
+
+        Returns:
+            Future: future of PqlResult
+        """
+        oo = self.odds_oracle
+        canonical = oo._canonical_pql(pql)
+        # The batch sends the missing trials itself
+        sampling = oo._pql_sampling(canonical, None, execute=None)
+        query = _BatchQuery(method='PPTServer.executePQL',
+                            params=lambda trials: (canonical, trials, oo.seconds, oo.threads),
+                            check=functools.partial(oo._check_pql_result, pql),
+                            parse=PqlResult,
+                            kind='pql', text=pql, caller=oo._caller(), sampling=sampling)
+        return self._add(oo._pql_cache_key(canonical, None, None, sampling), query)
+
+    def equity(self, hands: tuple, board: str = '', dead: str = '') -> Future:
+        """ Adds equity query
+
+        Args:
+            hands(list): list of hands
+            board(str): board
+            dead(str): dead cards
+
+        Returns:
+            Future: future of list of equities
+        """
+        oo = self.odds_oracle
+        hands = tuple(hands)
+        c_hands, c_board, c_dead = oo._canonical_equity(hands, board, dead)
+        sampling = oo._equity_sampling(execute=None)
+        query = _BatchQuery(method='PPTServer.computeEquityAuto',
+                            params=lambda trials: (oo.game, c_board, c_dead, oo.syntax, list(c_hands),
+                                                   trials, oo.seconds, oo.threads),
+                            check=functools.partial(oo._check_equity_result, hands, board, dead),
+                            parse=oo._parse_equity_result,
+                            kind='equity', text=oo._equity_text(hands, board, dead), caller=oo._caller(),
+                            sampling=sampling)
+        return self._add(oo._equity_cache_key((c_hands, c_board, c_dead), sampling), query)
+
+    def execute(self):
+        """ Sends queries to the server and sets results of futures
+
+        Queries being sent by other threads at the moment aren't sent again, their results are waited for.
+        Latency of a system.multicall request is shared equally between its queries in OddsOracle statistics.
+        """
+        oo = self.odds_oracle
+        queries, self._queries = self._queries, OrderedDict()
+        pending = []
+        flights = {}
+        # Cached merged samples with fewer trials than needed
+        samples = {}
+        waiting = []
+        for key, (query, futures) in queries.items():
+            result = oo.cache.get(key)
+            if not oo._is_enough(result, query.sampling):
+                flight, leader = oo._join_flight(key)
+                if not leader:
+                    waiting.append((key, flight))
+                    continue
+                # The previous identical query could finish between cache.get and _join_flight
+                result = oo.cache.get(key)
+                if not oo._is_enough(result, query.sampling):
+                    pending.append(key)
+                    flights[key] = flight
+                    samples[key] = result
+                    continue
+                oo._land_flight(key, flight, result)
+            self._set_result(query, futures, result, hit=True)
+        try:
+            self._execute_pending(queries, pending, flights, samples)
+        finally:
+            for key, flight in waiting:
+                query, futures = queries[key]
+                try:
+                    result = flight.result()
+                except Exception as exception:
+                    oo.query_stats.record(query.kind, query.caller, hit=True, shared=True, error=True,
+                                          query=query.text)
+                    for future in futures:
+                        future.set_exception(exception)
+                else:
+                    self._set_result(query, futures, result, hit=True, shared=True)
+
+    def _execute_pending(self, queries: OrderedDict, pending: list, flights: dict, samples: dict):
+        oo = self.odds_oracle
+        for start in range(0, len(pending), self.max_size):
+            chunk = pending[start:start + self.max_size]
+            started = time.perf_counter()
+            try:
+                results = oo._multicall([self._call_of(queries[key][0], samples[key]) for key in chunk])
+            except BaseException as exception:
+                for key in pending[start:]:
+                    oo._land_flight(key, flights[key], exception=exception)
+                    for future in queries[key][1]:
+                        future.set_exception(exception)
+                raise
+            server_seconds = (time.perf_counter() - started) / len(chunk)
+            for key, result in zip(chunk, results):
+                query, futures = queries[key]
+                try:
+                    if isinstance(result, Exception):
+                        raise result
+                    query.check(result)
+                    if query.sampling is not None:
+                        result = query.sampling.merge(samples[key], result)
+                except Exception as exception:
+                    oo._land_flight(key, flights[key], exception=exception)
+                    oo.query_stats.record(query.kind, query.caller, hit=False, server_seconds=server_seconds,
+                                          error=True, query=query.text)
+                    for future in futures:
+                        future.set_exception(exception)
+                else:
+                    oo.cache.set(key, result)
+                    oo._land_flight(key, flights[key], result)
+                    self._set_result(query, futures, result, hit=False, server_seconds=server_seconds)
+
+    def _call_of(self, query: _BatchQuery, sample: Optional[str]) -> tuple:
+        """ Returns (method, params) of query requesting the trials missing in the cached sample """
+        trials = self.odds_oracle.trials
+        if sample is not None:
+            trials -= sample_trials(sample)
+        return query.method, query.params(trials)
+
+    def _set_result(self, query: _BatchQuery, futures: list, result: str, hit: bool, server_seconds: float = 0.0,
+                    shared: bool = False):
+        started = time.perf_counter()
+        parsed = query.parse(result)
+        parse_seconds = time.perf_counter() - started
+        stats = self.odds_oracle.query_stats
+        stats.record(query.kind, query.caller, hit, server_seconds, len(result), parse_seconds, query=query.text,
+                     shared=shared)
+        # Duplicates of the query are answered without the server
+        for _ in futures[1:]:
+            stats.record(query.kind, query.caller, True, response_bytes=len(result))
+        futures[0].set_result(parsed)
+        for future in futures[1:]:
+            future.set_result(query.parse(result))
+
+
+class _Endpoint:
+    """ Endpoint of OddsOraclePool """
+
+    def __init__(self, host: str, port: str, server_proxy):
+        self.host = host
+        self.port = port
+        self.url = OddsOracle._XMLRPC.format(host=host, port=port)
+        # function(url) returning new xmlrpc client
+        self._server_proxy = server_proxy
+        self.in_flight = 0
+        self.failures = 0
+        self.down_until = 0.0
+        self._idle_clients = []
+
+    def __repr__(self):
+        return '{}({!r}, {!r})'.format(type(self).__name__, self.host, self.port)
+
+    def is_healthy(self, now: float) -> bool:
+        return self.down_until <= now
+
+    def acquire_client(self) -> xmlrpc.client.ServerProxy:
+        # ServerProxy isn't thread-safe, so every concurrent request takes its own proxy
+        try:
+            return self._idle_clients.pop()
+        except IndexError:
+            return self._server_proxy(self.url)
+
+    def release_client(self, client: xmlrpc.client.ServerProxy):
+        self._idle_clients.append(client)
+
+
+class OddsOraclePool(OddsOracle):
+    """Represent several OddsOracle xmlrpc servers
+
+    Has the same interface as OddsOracle. Each query is sent to the least loaded healthy server, queries of a batch
+    are split between healthy servers.
+    A server, which failed, is taken out of rotation for 'retry_after' seconds (doubled on every
+    consecutive failure, but not more than 'max_retry_after').
+
+    Attributes:
+        endpoints (list): endpoints of servers
+        retry_after (float): seconds a failed server is out of rotation
+        max_retry_after (float): max seconds a failed server is out of rotation
+    """
+
+    _FAILURES = (ConnectionError, OSError, xmlrpc.client.ProtocolError)
+
+    def __init__(self, endpoints: Iterable, trials: int = None, seconds: int = None, threads: int = None,
+                 syntax: str = None, game: str = None, connect: bool = True, cache: Cache = None,
+                 canonicalize: bool = True, retry_after: float = 5, max_retry_after: float = 300,
+                 timeout: float = None, gzip_threshold: int = None, merge_samples: bool = False,
+                 compact: bool = True):
+        """
+        Args:
+            endpoints (Iterable): servers as 'host:port' strings or (host, port) tuples
+            trials (int): max trials for query
+            seconds (int): max seconds for query
+            threads (int): number of threads
+            syntax (str): query syntax
+            game (str): game query
+            connect (bool): checks connection to servers if True, servers aren't started (see run_server)
+            cache (Cache): cache of results
+            canonicalize (bool): if True, queries are sent and cached in suit-isomorphic canonical form
+            retry_after (float): seconds a failed server is out of rotation
+            max_retry_after (float): max seconds a failed server is out of rotation
+            timeout (float): socket timeout of requests in seconds, None - no timeout
+            gzip_threshold (int): request bodies longer than gzip_threshold bytes are gzip-encoded, None - never
+            merge_samples (bool): if True, cached results are refined by the missing trials, see OddsOracle
+            compact (bool): if True, ranges are compacted before sending, see OddsOracle
+        """
+        self.endpoints = []
+        for endpoint in endpoints:
+            if isinstance(endpoint, str):
+                host, port = endpoint.rsplit(':', 1)
+            else:
+                host, port = endpoint
+            self.endpoints.append(_Endpoint(host, str(port), self._server_proxy))
+        if not self.endpoints:
+            raise ValueError("OddsOraclePool needs at least one endpoint")
+        self.retry_after = retry_after
+        self.max_retry_after = max_retry_after
+        self._lock = threading.Lock()
+        super().__init__(host=self.endpoints[0].host, port=self.endpoints[0].port, trials=trials, seconds=seconds,
+                         threads=threads, syntax=syntax, game=game, connect=connect, cache=cache,
+                         canonicalize=canonicalize, timeout=timeout, gzip_threshold=gzip_threshold,
+                         merge_samples=merge_samples, compact=compact)
+
+    def get_client(self):
+        """ Checks connection to all servers
+
+        Servers that don't answer are taken out of rotation.
+
+        Returns:
+            list: healthy endpoints
+
+        Raises:
+            ConnectionError: if can't connect to any server
+        """
+        for endpoint in self.endpoints:
+            try:
+                self._call_endpoint(endpoint, 'PPTServer.executePQL', '', 10, 1, 1)
+                self.logger.info('Successfully connected to {}'.format(endpoint.url))
+            except self._FAILURES:
+                self.logger.warning("Connection to {} failed".format(endpoint.url))
+        if not self.healthy_endpoints():
+            raise ConnectionError("Connection to all servers of the pool failed. Are OddsOracle servers running?")
+        return self.healthy_endpoints()
+
+    def run_server(self):
+        """ Servers of the pool aren't started by OddsOraclePool, get_client doesn't try to run them
+
+        Raises:
+            ConnectionError: always, servers must be run before connecting to the pool
+        """
+        raise ConnectionError("OddsOraclePool doesn't run servers, start them before connecting: {}".format(
+            ', '.join(endpoint.url for endpoint in self.endpoints)))
+
+    def healthy_endpoints(self) -> list:
+        """ Returns endpoints in rotation """
+        now = time.monotonic()
+        with self._lock:
+            return [endpoint for endpoint in self.endpoints if endpoint.is_healthy(now)]
+
+    def _choose_endpoint(self, tried: list) -> _Endpoint:
+        now = time.monotonic()
+        with self._lock:
+            candidates = [endpoint for endpoint in self.endpoints
+                          if endpoint.is_healthy(now) and endpoint not in tried]
+            if not candidates:
+                return None
+            endpoint = min(candidates, key=lambda e: e.in_flight)
+            endpoint.in_flight += 1
+            return endpoint
+
+    def _call_endpoint(self, endpoint: _Endpoint, method: str, *params):
+        with self._lock:
+            client = endpoint.acquire_client()
+        try:
+            result = getattr(client, method)(*params)
+        except self._FAILURES:
+            with self._lock:
+                endpoint.failures += 1
+                delay = min(self.retry_after * 2 ** (endpoint.failures - 1), self.max_retry_after)
+                endpoint.down_until = time.monotonic() + delay
+            raise
+        else:
+            with self._lock:
+                endpoint.failures = 0
+                endpoint.down_until = 0.0
+                endpoint.release_client(client)
+            return result
+
+    def _send(self, method: str, *params):
+        """ Sends call to the least loaded healthy server """
+        tried = []
+        while True:
+            endpoint = self._choose_endpoint(tried)
+            if endpoint is None:
+                raise ConnectionError("No healthy OddsOracle server in the pool (tried {})".format(tried))
+            tried.append(endpoint)
+            try:
+                return self._call_endpoint(endpoint, method, *params)
+            except self._FAILURES as exception:
+                self.logger.warning("Server {} failed, taken out of rotation: {}".format(endpoint.url, exception))
+            finally:
+                with self._lock:
+                    endpoint.in_flight -= 1
+
+    def _multicall(self, calls: list) -> list:
+        """ Invoke several methods, calls are split between healthy servers and the parts are sent simultaneously """
+        parts = max(1, min(len(calls), len(self.healthy_endpoints())))
+        multicall = super()._multicall
+        if parts == 1:
+            return multicall(calls)
+        size = -(-len(calls) // parts)
+        chunks = [calls[start:start + size] for start in range(0, len(calls), size)]
+        return [result for chunk in self._map(multicall, chunks, len(chunks)) for result in chunk]
+
+    def _call_many(self, calls: list) -> list:
+        """ Invoke several methods simultaneously, one call per server """
+
+        def call(method_params):
+            method, params = method_params
+            try:
+                return self._call(method, *params)
+            except xmlrpc.client.Fault as fault:
+                return fault
+
+        with ThreadPoolExecutor(max_workers=max(1, min(len(calls), len(self.endpoints)))) as executor:
+            return list(executor.map(call, calls))
+
+
+class ReplayError(LookupError):
+    """ Call isn't in the recording """
+
+    def __init__(self, method: str, params: tuple):
+        super().__init__("Call {}{} isn't recorded".format(method, params))
+        self.method = method
+        self.params = params
+
+
+class ReplayOddsOracle(OddsOracle):
+    """Serves responses recorded by OddsOracle.recording instead of the server
+
+    Has the same interface as OddsOracle, so BoardExplorer, Calc, GameTree etc. work without the server.
+    Settings (trials, seconds, threads, syntax, game) must be the same as while recording, because calls are
+    looked up by their params. Responses of identical calls are served in the recorded order (the last one is
+    repeated).
+
+    Attributes:
+        latency_scale (float): recorded latency multiplier, 0 - responses are served without delay
+        missed (int): number of calls absent in the recording
+    """
+
+    def __init__(self, path: str, latency_scale: float = 0.0, trials: int = None, seconds: int = None,
+                 threads: int = None, syntax: str = None, game: str = None, cache: Cache = None,
+                 canonicalize: bool = True, merge_samples: bool = False, compact: bool = True):
+        """
+        Args:
+            path (str): path of the recording
+            latency_scale (float): recorded latency multiplier, 0 - responses are served without delay
+            trials (int): max trials for query
+            seconds (int): max seconds for query
+            threads (int): number of threads
+            syntax (str): query syntax
+            game (str): game query
+            cache (Cache): cache of results
+            canonicalize (bool): if True, queries are sent and cached in suit-isomorphic canonical form
+            merge_samples (bool): if True, cached results are refined by the missing trials
+            compact (bool): if True, ranges are compacted before sending
+        """
+        self.latency_scale = latency_scale
+        self.missed = 0
+        self._responses = {}
+        self._served = {}
+        self._replay_lock = threading.Lock()
+        for call in read_recording(path):
+            self._responses.setdefault(self._replay_key(call.method, call.params), []).append(call)
+        super().__init__(trials=trials, seconds=seconds, threads=threads, syntax=syntax, game=game, connect=False,
+                         cache=cache, canonicalize=canonicalize, merge_samples=merge_samples, compact=compact)
+        # Calls of a batch are looked up one by one
+        self._multicall_supported = False
+
+    @staticmethod
+    def _replay_key(method: str, params: tuple) -> str:
+        return make_key(method, *params)
+
+    def get_client(self):
+        """ There is no server, returns None """
+        return None
+
+    def run_server(self):
+        """ Responses are served from the recording, there is no server to run
+
+        Raises:
+            TypeError: always
+        """
+        raise TypeError("ReplayOddsOracle serves a recording, it doesn't run servers")
+
+    def _send(self, method: str, *params):
+        """ Returns recorded response of the call
+
+        Raises:
+            ReplayError: if the call isn't recorded
+            xmlrpc.client.Fault: if the recorded call failed
+        """
+        key = self._replay_key(method, params)
+        with self._replay_lock:
+            calls = self._responses.get(key)
+            if not calls:
+                self.missed += 1
+                raise ReplayError(method, params)
+            served = self._served.get(key, 0)
+            self._served[key] = served + 1
+            call = calls[min(served, len(calls) - 1)]
+        if self.latency_scale and call.seconds:
+            time.sleep(call.seconds * self.latency_scale)
+        if call.fault is not None:
+            raise xmlrpc.client.Fault(*call.fault)
+        return call.response
+
+
 class PqlResult:
     """ Class parsing  a pql result
 
     Attributes:
         results_list (list): list of parsed results
         results_dict (dict): dict of parsed results
+        values (dict): not rounded values of count (as fraction) and avg selectors
+        trials (int): number of trials
     """
     NAME = 'name'
     PERCENTAGE = 'percentage'
@@ -237,75 +1162,116 @@ class PqlResult:
     FRACTION = 'fraction'
     PERCENT = 'percent'
 
-    _COUNT_SELECTOR = 'count_selector'
-    _AVG_SELECTOR = 'avg_selector'
-    _HISTOGRAM_SELECTOR = 'histogram_percent_selector'
-    _HISTOGRAM_ELEMENT = 'histogram_percent_element'
-    _TRIALS_GROUP = 'trials_group'
-    _TRIALS = 'trials'
+    _LINE = re.compile(r'^\s*([\w ]+?)\s*=\s*(.+?)\s*$', re.MULTILINE)
+    _TRIALS = re.compile(r'^\s*(\d+) trials\s*$', re.MULTILINE)
+    _COUNT = re.compile(r'([\d.]+)% \((\d+)\)$')
+    _AVG = re.compile(r'-?[\d.]+(?:[eE][-+]?\d+)?$')
+    _HISTOGRAM_ELEMENT = re.compile(r'\[([\d/]+):([\d.]+)% \((\d+)\)\]')
 
     def __init__(self, result: str):
         self.results_list = []
         self.results_dict = {}
+        self.values = {}
         self.trials = None
         self._parse(result)
 
     def _parse(self, pql_result: str):
         """ Parses pql result """
-        name = pp.Word(pp.alphanums + "_" + " ").setResultsName(self.NAME)
-        percentage = pp.Word(pp.nums + '.').setResultsName(self.PERCENTAGE) + "%"
-        counts = "(" + pp.Word(pp.nums).setResultsName(self.COUNTS) + ")"
-        count_selector = pp.Group(name + "=" + percentage + counts).setResultsName(self._COUNT_SELECTOR)
-        # avg selector
-        avg_selector = pp.Group(name + "=" + pp.Word(pp.nums + '.').setResultsName(self.PERCENTAGE)).setResultsName(
-            self._AVG_SELECTOR)
-        # histogram_selector
-        percents = [str(percent) for percent in range(100)]
-        percent = pp.oneOf(percents).setResultsName(self.PERCENT)
-        fraction = pp.Word(pp.nums + '/').setResultsName(self.FRACTION)
-        histogram_element = pp.Group('[' + (percent ^ fraction) + ':' + percentage + counts + ']'
-                                     + pp.ZeroOrMore(',')).setResultsName(self._HISTOGRAM_ELEMENT)
-        histogram_selector = pp.Group(name + '=' + pp.OneOrMore(histogram_element)).setResultsName(
-            self._HISTOGRAM_SELECTOR)
-        # trials
-        trials = pp.Group(pp.Word(pp.nums).setResultsName(self._TRIALS) + "trials").setResultsName(self._TRIALS_GROUP)
-        pql_answer = pp.OneOrMore(count_selector ^ avg_selector ^ histogram_selector ^ trials)
-        results = pql_answer.parseString(pql_result, parseAll=False)
-        for result in results:
-            if result.getName() == self._TRIALS_GROUP:
-                self.trials = int(result.asDict()[self._TRIALS])
-            if result.getName() in [self._COUNT_SELECTOR, self._AVG_SELECTOR, self._HISTOGRAM_SELECTOR]:
-                r_d = result.asDict()
-                selector_result = dict()
-                name = r_d[self.NAME].rstrip()
-                selector_result[self.NAME] = name
-                if result.getName() == self._COUNT_SELECTOR:
-                    selector_result[self.PERCENTAGE] = round(float(r_d[self.PERCENTAGE]) / 100, 3)
-                    selector_result[self.COUNTS] = int(r_d[self.COUNTS])
-                elif result.getName() == self._AVG_SELECTOR:
-                    selector_result[self.PERCENTAGE] = round(float(r_d[self.PERCENTAGE]), 3)
-                elif result.getName() == self._HISTOGRAM_SELECTOR:
-                    elements = {}
-                    it_was_fractions = False
-                    for sub_result in result:
-                        if isinstance(sub_result, pp.ParseResults):
-                            sr_d = sub_result.asDict()
-                            f_or_p = sr_d.get(self.FRACTION)
-                            if f_or_p:
-                                it_was_fractions = True
-                            else:
-                                f_or_p = sr_d[self.PERCENT]
-                            elements[f_or_p] = {}
-                            elements[f_or_p][self.PERCENTAGE] = round(float(sr_d[self.PERCENTAGE]) / 100, 3)
-                            elements[f_or_p][self.COUNTS] = int(sr_d[self.COUNTS])
-                    selector_result[self.HISTOGRAM] = elements
-                self.results_list.append(selector_result)
-                self.results_dict[name] = selector_result
+        trials = self._TRIALS.search(pql_result)
+        if trials:
+            self.trials = int(trials.group(1))
+        for line in self._LINE.finditer(pql_result):
+            name, value = line.groups()
+            selector_result = {self.NAME: name}
+            if value[0] == '[':
+                elements = {}
+                for element in self._HISTOGRAM_ELEMENT.finditer(value):
+                    f_or_p, percentage, counts = element.groups()
+                    elements[f_or_p] = {self.PERCENTAGE: round_equity(float(percentage) / 100),
+                                        self.COUNTS: int(counts)}
+                selector_result[self.HISTOGRAM] = elements
+            else:
+                count = self._COUNT.match(value)
+                if count:
+                    self.values[name] = float(count.group(1)) / 100
+                    selector_result[self.PERCENTAGE] = round_equity(self.values[name])
+                    selector_result[self.COUNTS] = int(count.group(2))
+                elif self._AVG.match(value):
+                    self.values[name] = float(value)
+                    selector_result[self.PERCENTAGE] = round_equity(self.values[name])
+                else:
+                    continue
+            self.results_list.append(selector_result)
+            self.results_dict[name] = selector_result
+
+
+EquityEstimate = namedtuple('EquityEstimate', 'equity stderr trials')
+EquityEstimate.__doc__ = """ Equity with its precision: standard error and number of trials """
+
+# Digits of equities and fractions returned without standard error
+EQUITY_DIGITS = 3
+
+
+def round_equity(equity: float) -> float:
+    """ Rounds equity or fraction to EQUITY_DIGITS digits """
+    return round(equity, EQUITY_DIGITS)
+
+
+def _mergeable_values(pql_result: PqlResult) -> list:
+    """ Returns (name, kind, value) of every selector: counts of count selectors, not rounded avg values """
+    values = []
+    for result in pql_result.results_list:
+        name = result[PqlResult.NAME]
+        if PqlResult.HISTOGRAM in result:
+            raise ValueError("Can't merge histogram {}".format(name))
+        if PqlResult.COUNTS in result:
+            values.append((name, 'count', result[PqlResult.COUNTS]))
+        else:
+            values.append((name, 'avg', pql_result.values[name]))
+    return values
+
+
+def merge_pql_results(old: Optional[str], new: str) -> str:
+    """ Merges results of avg and count selectors of the same PQL query, see ploev.samples
+
+    Args:
+        old (str): previous result, None if there is no previous result
+        new (str): result of the new trials
+
+    Returns:
+        str: merged result with 'N trials' line
+
+    Raises:
+        ValueError: if results have different or unmergeable selectors
+    """
+    new_result = PqlResult(new)
+    new_trials = new_result.trials or 0
+    new_values = _mergeable_values(new_result)
+    if old is None:
+        old_trials, old_values = 0, [(name, kind, 0) for name, kind, _ in new_values]
+    else:
+        old_result = PqlResult(old)
+        old_trials, old_values = old_result.trials or 0, _mergeable_values(old_result)
+    if [value[:2] for value in old_values] != [value[:2] for value in new_values]:
+        raise ValueError("Can't merge results of different PQL queries")
+    trials = old_trials + new_trials
+    merged = []
+    for (name, kind, old_value), (_, _, new_value) in zip(old_values, new_values):
+        if kind == 'count':
+            counts = old_value + new_value
+            merged.append('{} = {:.4f}% ({})'.format(name, counts / trials * 100 if trials else 0, counts))
+        else:
+            value = (old_value * old_trials + new_value * new_trials) / trials if trials else new_value
+            merged.append('{} = {!r}'.format(name, value))
+    merged.append('{} trials'.format(trials))
+    return '\n'.join(merged) + '\n'
 
 
 class Pql:
     """ Class implements different usable PQL queries"""
     _PQL_COMMON = "select {selectors} \n{from_clause}"
+    # Street by number of board cards
+    _STREETS = {0: 'preflop', 3: 'flop', 4: 'turn', 5: 'river'}
     logger = logging.getLogger('ppt.Pql')
 
     def __init__(self, odds_oracle: OddsOracle):
@@ -315,6 +1281,10 @@ class Pql:
         """
         self.odds_oracle = odds_oracle
 
+    def planner(self) -> 'PqlPlanner':
+        """ Returns planner fusing queries with identical from clause """
+        return PqlPlanner(self)
+
     def equity(self, players: Iterable, board='', dead='') -> list:
         """ Return equities for each players.
 
@@ -358,12 +1328,163 @@ class Pql:
             float: hero's equity
         """
         self.logger.debug('Started hero_equity')
+        pql = self._hero_equity_pql(hero, villains, board, dead)
+        return self._hero_equity_result(self.odds_oracle.pql(pql))
+
+    def _hero_equity_pql(self, hero: str, villains: list, board: str = None, dead: str = None) -> str:
         selector = 'avg(riverEquity(hero)) as EQ'
         from_clause = self._construct_from_clause(board=board, dead=dead, hero=hero, players=villains)
-        pql = self._PQL_COMMON.format(selectors=selector, from_clause=from_clause)
-        pql_result = self.odds_oracle.pql(pql)
+        return self._PQL_COMMON.format(selectors=selector, from_clause=from_clause)
+
+    @staticmethod
+    def _hero_equity_result(pql_result: 'PqlResult') -> float:
         return pql_result.results_dict['EQ'][PqlResult.PERCENTAGE]
 
+    def hero_equity_many(self, hero: str, villains: list, boards: Iterable[str], dead: str = None,
+                         batch_size: int = 64, max_workers: int = 8) -> list:
+        """ Return hero's equity on every board
+
+        Queries are sent with OddsOracle.map_pql in batches (not more than batch_size queries per batch), batches are
+        sent simultaneously.
+
+        Usage:
+            turn_equities = pql.hero_equity_many(hero, villains, [flop + card for card in turn_cards])
+
+        Args:
+            hero (str): hero's hand
+            villains (list): list of villain's hand
+            boards (Iterable[str]): boards
+            dead (str): dead cards
+            batch_size (int): max number of queries in one batch
+            max_workers (int): max number of batches sent to the server at the same time
+
+        Returns:
+            list: hero's equity (float) for every board in the same order
+
+        Raises:
+            PqlError: the first error of queries
+        """
+        pqls = [self._hero_equity_pql(hero, villains, board or None, dead) for board in boards]
+        pql_results = self.odds_oracle.map_pql(pqls, max_workers=max_workers, batch_size=batch_size)
+        return [self._hero_equity_result(pql_result) for pql_result in pql_results]
+
+    def adaptive_hero_equity(self, hero: str, villains: list, board: str = None, dead: str = None,
+                             tolerance: float = 0.005, initial_trials: int = 10000,
+                             max_trials: int = None) -> EquityEstimate:
+        """ Return hero's equity calculated with required precision
+
+        See Pql.adaptive_equity
+
+        Args:
+            hero (str): hero's hand
+            villains (list): list of villain's hand
+            board (str): board
+            dead (str): dead cards
+            tolerance (float): required standard error
+            initial_trials (int): trials of the first query
+            max_trials (int): max total trials, OddsOracle.trials if not provided
+
+        Returns:
+            EquityEstimate: hero's equity
+        """
+        pql = self._hero_equity_pql(hero, villains, board, dead)
+        return self._adaptive(pql, ['EQ'], tolerance, initial_trials, max_trials)[0]
+
+    def adaptive_equity(self, players: Iterable, board: str = None, dead: str = None, tolerance: float = 0.005,
+                        initial_trials: int = 10000, max_trials: int = None) -> List[EquityEstimate]:
+        """ Return equities for each players calculated with required precision
+
+        The first query is run with initial_trials. Standard error of equity p after n trials is estimated as
+        sqrt(p * (1 - p) / n) (upper bound for a value in [0, 1]). While the error of any player is bigger than
+        tolerance, the query is repeated with the missing trials and results are pooled.
+
+        Args:
+            players (list): list of players ranges
+            board (str): board
+            dead (str): dead cards
+            tolerance (float): required standard error
+            initial_trials (int): trials of the first query
+            max_trials (int): max total trials, OddsOracle.trials if not provided
+
+        Returns:
+            list: list of EquityEstimate
+        """
+        return self._adaptive(*self._adaptive_equity_pql(players, board, dead), tolerance, initial_trials, max_trials)
+
+    def _adaptive_equity_pql(self, players: Iterable, board: str = None, dead: str = None) -> tuple:
+        """ Returns PQL of equities of players and names of their selectors """
+        players = list(players)
+        names = ['EQ{}'.format(number) for number in range(1, len(players) + 1)]
+        selectors = ",\n\t".join(['avg(riverEquity(player_{})) as {}'.format(number, name)
+                                   for number, name in enumerate(names, start=1)])
+        from_clause = self._construct_from_clause(board=board, dead=dead, players=players)
+        return self._PQL_COMMON.format(selectors=selectors, from_clause=from_clause), names
+
+    @staticmethod
+    def _stderr(equity: float, trials: int) -> float:
+        return math.sqrt(max(equity * (1 - equity), 0) / trials) if trials else float('inf')
+
+    def _adaptive(self, pql: str, names: list, tolerance: float, initial_trials: int,
+                  max_trials: int = None) -> List[EquityEstimate]:
+        runs = self._adaptive_runs(names, tolerance, initial_trials, max_trials)
+        try:
+            trials = next(runs)
+            while True:
+                trials = runs.send(self.odds_oracle.pql(pql, trials=trials))
+        except StopIteration as stop:
+            return stop.value
+
+    def _adaptive_runs(self, names: list, tolerance: float, initial_trials: int, max_trials: int = None):
+        """ Generator of trials of adaptive queries
+
+        It receives PqlResult of every query and returns list of EquityEstimate. Queries are sent by the caller,
+        so Pql and AsyncPql share the stopping rule.
+        """
+        if max_trials is None:
+            max_trials = self.odds_oracle.trials
+        if self.odds_oracle.merge_samples:
+            return (yield from self._adaptive_merged_runs(names, tolerance, initial_trials, max_trials))
+        sums = [0.0] * len(names)
+        total = 0
+        used = set()
+        run = min(initial_trials, max_trials)
+        while True:
+            # Every run has different number of trials, so no cached sample is pooled twice
+            used.add(run)
+            pql_result = yield run
+            trials = pql_result.trials or run
+            for index, name in enumerate(names):
+                sums[index] += pql_result.values[name] * trials
+            total += trials
+            equities = [sum_ / total for sum_ in sums]
+            needed = max(equity * (1 - equity) for equity in equities) / tolerance ** 2
+            if needed <= total or total >= max_trials:
+                break
+            run = min(max(int(math.ceil(needed)) - total, total), max_trials - total)
+            while run in used and run < max_trials - total:
+                run += 1
+            if run in used:
+                break
+        self.logger.debug('Adaptive equity {} after {} trials'.format(equities, total))
+        return [EquityEstimate(equity, self._stderr(equity, total), total) for equity in equities]
+
+    def _adaptive_merged_runs(self, names: list, tolerance: float, initial_trials: int, max_trials: int):
+        """ Results of OddsOracle with merged samples are already pooled, so only the total trials are raised """
+        target = min(initial_trials, max_trials)
+        previous = 0
+        while True:
+            pql_result = yield target
+            total = pql_result.trials or target
+            equities = [pql_result.values[name] for name in names]
+            needed = max(equity * (1 - equity) for equity in equities) / tolerance ** 2
+            # The server could stop early because of the time limit
+            if needed <= total or total >= max_trials or total <= previous:
+                break
+            previous = total
+            target = min(max(int(math.ceil(needed)), 2 * total), max_trials)
+        self.logger.debug('Adaptive equity {} after {} trials'.format(equities, total))
+        return [EquityEstimate(equity, self._stderr(equity, total), total) for equity in equities]
+
     def count_in_range(self, main_range: str, sub_ranges: list, board: str, players: Iterable[str] = None, dead: str = ''):
         """ Returns how often sub_ranges are in main_range
 
@@ -379,12 +1500,176 @@ class Pql:
 
         """
         self.logger.debug('Started count_in_range')
+        pql = self._count_in_range_pql(main_range, sub_ranges, board, players, dead)
+        return self._count_in_range_result(self.odds_oracle.pql(pql))
+
+    def _count_in_range_pql(self, main_range: str, sub_ranges: list, board: str, players: Iterable[str] = None,
+                            dead: str = '') -> str:
         other_players = [main_range]
         if players is not None:
             other_players.extend(list(players))
         selector = "count(inRange(player_{},'{}'))"
         selectors = ",\n\t".join([selector.format(1, sub_range) for sub_range in sub_ranges])
         from_clause = self._construct_from_clause(board=board, dead=dead, players=other_players)
-        pql = self._PQL_COMMON.format(selectors=selectors, from_clause=from_clause)
-        pql_result = self.odds_oracle.pql(pql)
+        return self._PQL_COMMON.format(selectors=selectors, from_clause=from_clause)
+
+    @staticmethod
+    def _count_in_range_result(pql_result: 'PqlResult') -> list:
         return [result[PqlResult.PERCENTAGE] for result in pql_result.results_list]
+
+    def equity_histogram(self, hero: str, villains: list, board: str = None, dead: str = None,
+                         buckets: int = 10) -> list:
+        """ Returns distribution of hero's equity on the street of the board
+
+        All buckets are calculated by one query. The server counts equities by whole percents (on the river by
+        fractions of the pot: 0, 1/4, 1/2 ...), so the number of buckets should be a divisor of 100.
+
+        Usage:
+            # how often hero has 0-10%, 10-20% ... 90-100% equity vs the villain's hand on the flop
+            distribution = pql.equity_histogram('AsKsQhJh', ['AA'], 'Ks7d2c')
+
+        Args:
+            hero (str): hero's hand
+            villains (list): list of villain's hand
+            board (str): board
+            dead (str): dead cards
+            buckets (int): number of equal buckets
+
+        Returns:
+            list: fractions (float) of trials with hero's equity in every bucket
+
+        Raises:
+            ValueError: if the board doesn't contain 0, 3, 4 or 5 cards
+        """
+        self.logger.debug('Started equity_histogram')
+        pql = self._equity_histogram_pql(hero, villains, board, dead)
+        return self._equity_histogram_result(self.odds_oracle.pql(pql), buckets, self._is_river(board))
+
+    @classmethod
+    def _street(cls, board: str) -> str:
+        cards = re.sub(r'\s', '', board or '')
+        if len(cards) % 2 or len(cards) // 2 not in cls._STREETS:
+            raise ValueError('Board must contain 0, 3, 4 or 5 cards: {}'.format(board))
+        return cls._STREETS[len(cards) // 2]
+
+    def _is_river(self, board: str) -> bool:
+        return self._street(board) == 'river'
+
+    def _equity_histogram_pql(self, hero: str, villains: list, board: str = None, dead: str = None) -> str:
+        if self._is_river(board):
+            selector = 'histogram(hero, fractionalRiverEquity(hero)) as HIST'
+        else:
+            selector = 'histogram(hero, equity(hero, {})) as HIST'.format(self._street(board))
+        from_clause = self._construct_from_clause(board=board, dead=dead, hero=hero, players=villains)
+        return self._PQL_COMMON.format(selectors=selector, from_clause=from_clause)
+
+    @staticmethod
+    def _equity_histogram_result(pql_result: 'PqlResult', buckets: int, fractions: bool = False) -> list:
+        counts = [0] * buckets
+        for element, result in pql_result.results_dict['HIST'][PqlResult.HISTOGRAM].items():
+            # Elements are whole percents or, on the river, fractions of the pot ('0', '1/2', '1')
+            numerator, _, denominator = element.partition('/')
+            bucket = int(numerator) * buckets // int(denominator or (1 if fractions else 100))
+            counts[min(bucket, buckets - 1)] += result[PqlResult.COUNTS]
+        total = sum(counts)
+        return [count / total if total else 0.0 for count in counts]
+
+
+class PqlPlanner:
+    """ Planner fusing Pql queries
+
+    Selectors of pending queries with identical from clause (the same board, dead cards and players in the same
+    slots) are sent in one 'select a, b, c ... from ...' query, so the server runs one simulation for all of them.
+    For example, hero's equity vs a range and fractions of sub ranges in this range with hero in the hand are one
+    query. Queries with different from clauses aren't fused, but all queries are sent in one batch (one
+    system.multicall request if the server supports it). Fused queries are cached as queries of OddsOracle.pql
+    (as merged samples if OddsOracle merges samples), so they share results with it.
+
+    Usage:
+        planner = pql.planner()
+        equity = planner.hero_equity(hero, [main_range], board)
+        fractions = planner.count_in_range(main_range, sub_ranges, board, players=[hero])
+        planner.execute()
+        equity.result(), fractions.result()
+    """
+    _ALIAS = 'S{}'
+
+    def __init__(self, pql: Pql):
+        """
+        Args:
+            pql (Pql): Pql
+        """
+        self.pql = pql
+        # from clause -> (selector -> alias, list of (aliases, handler, future))
+        self._groups = OrderedDict()
+
+    def __len__(self):
+        return len(self._groups)
+
+    def _add(self, from_clause: str, selectors: list, handler) -> Future:
+        aliases_by_selector, requests = self._groups.setdefault(from_clause, (OrderedDict(), []))
+        aliases = []
+        for selector in selectors:
+            if selector not in aliases_by_selector:
+                aliases_by_selector[selector] = self._ALIAS.format(len(aliases_by_selector))
+            aliases.append(aliases_by_selector[selector])
+        future = Future()
+        requests.append((aliases, handler, future))
+        return future
+
+    def hero_equity(self, hero: str, villains: list, board: str = None, dead: str = None) -> Future:
+        """ Adds hero equity query, see Pql.hero_equity
+
+        Returns:
+            Future: future of hero's equity (float)
+        """
+        from_clause = self.pql._construct_from_clause(board=board, dead=dead, hero=hero, players=villains)
+        return self._add(from_clause, ['avg(riverEquity(hero))'],
+                         lambda results: results[0][PqlResult.PERCENTAGE])
+
+    def count_in_range(self, main_range: str, sub_ranges: list, board: str, players: Iterable[str] = None,
+                       dead: str = '') -> Future:
+        """ Adds count in range query, see Pql.count_in_range
+
+        Unlike Pql.count_in_range, the first of players takes the hero slot (main_range is player_1 in both), so
+        the query is fused with hero_equity(players[0], [main_range] + players[1:]) queries. Names of slots don't
+        change dealt hands, so fractions are the same.
+
+        Returns:
+            Future: future of list of percentages(float)
+        """
+        players = list(players) if players is not None else []
+        hero = players[0] if players else None
+        from_clause = self.pql._construct_from_clause(board=board, dead=dead, hero=hero,
+                                                      players=[main_range] + players[1:])
+        selectors = ["count(inRange(player_1,'{}'))".format(sub_range) for sub_range in sub_ranges]
+        return self._add(from_clause, selectors,
+                         lambda results: [result[PqlResult.PERCENTAGE] for result in results])
+
+    def _fused_pql(self, from_clause: str) -> str:
+        aliases_by_selector = self._groups[from_clause][0]
+        selectors = ",\n\t".join(['{} as {}'.format(selector, alias)
+                                   for selector, alias in aliases_by_selector.items()])
+        return self.pql._PQL_COMMON.format(selectors=selectors, from_clause=from_clause)
+
+    def fused_pqls(self) -> list:
+        """ Returns fused queries of pending queries, execute sends them """
+        return [self._fused_pql(from_clause) for from_clause in self._groups]
+
+    def execute(self):
+        """ Sends fused queries and sets results of futures """
+        groups, pqls = self._groups, self.fused_pqls()
+        self._groups = OrderedDict()
+        batch = self.pql.odds_oracle.batch()
+        pql_results = [batch.pql(pql) for pql in pqls]
+        try:
+            batch.execute()
+        finally:
+            for (_, requests), pql_result in zip(groups.values(), pql_results):
+                exception = pql_result.exception() if pql_result.done() else ConnectionError('Query was not sent')
+                for aliases, handler, future in requests:
+                    if exception is not None:
+                        future.set_exception(exception)
+                    else:
+                        results_dict = pql_result.result().results_dict
+                        future.set_result(handler([results_dict[alias] for alias in aliases]))
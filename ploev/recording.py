@@ -0,0 +1,101 @@
+# ploev
+# Copyright (C) 2017 Alexey Londkevich <vyvojer@gmail.com>
+
+# ploev is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# ploev is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Recording of OddsOracle traffic
+
+A recording is a gzip compressed file with one JSON object per line: method, params, response or fault, seconds.
+
+Usage:
+    with odds_oracle.recording('traffic.jsonl.gz'):
+        tree.calculate()
+    odds_oracle = ReplayOddsOracle('traffic.jsonl.gz', latency_scale=1.0)
+"""
+
+import gzip
+import json
+import threading
+from collections import namedtuple
+from typing import List
+
+RecordedCall = namedtuple('RecordedCall', 'method params response fault seconds')
+RecordedCall.__doc__ = """ Call of server: response is None if the call failed with fault (code, string) """
+
+
+class Recorder:
+    """ Writes calls of server to a recording, thread-safe
+
+    Attributes:
+        path (str): path of the recording
+        calls (int): number of written calls
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): path of the recording, calls are appended if it exists
+        """
+        self.path = path
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._file = gzip.open(path, 'at', encoding='utf-8')
+
+    def record(self, method: str, params: tuple, response=None, seconds: float = 0.0, fault: tuple = None):
+        """ Writes call
+
+        Args:
+            method (str): method of server, for example 'PPTServer.executePQL'
+            params (tuple): params of the call
+            response: response of server
+            seconds (float): latency of the call
+            fault (tuple): (code, string) of xmlrpc fault if the call failed
+        """
+        line = json.dumps({'method': method, 'params': list(params), 'response': response,
+                           'fault': list(fault) if fault is not None else None, 'seconds': round(seconds, 6)},
+                          separators=(',', ':'), ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + '\n')
+            self.calls += 1
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def read_recording(path: str) -> List[RecordedCall]:
+    """ Reads calls from recording
+
+    Args:
+        path (str): path of the recording
+
+    Returns:
+        list: RecordedCall in the recorded order
+    """
+    calls = []
+    with gzip.open(path, 'rt', encoding='utf-8') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            call = json.loads(line)
+            fault = tuple(call['fault']) if call.get('fault') is not None else None
+            calls.append(RecordedCall(call['method'], tuple(call['params']), call.get('response'), fault,
+                                      call.get('seconds', 0.0)))
+    return calls
@@ -0,0 +1,121 @@
+# ploev
+# Copyright (C) 2017 Alexey Londkevich <vyvojer@gmail.com>
+
+# ploev is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# ploev is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Merging of Monte Carlo samples of OddsOracle results
+
+A result computed with n1 trials and a result of the same query computed with other n2 trials are merged into one
+result of n1 + n2 trials: counts are added, averages and equities are weighted by trials. Merged results are in
+OddsOracle format with a 'N trials' line, so they are parsed as usual. PQL results are merged by
+ploev.ppt.merge_pql_results, which parses them with PqlResult.
+
+Usage:
+    merged = merge_equity_results(cached_result, result_of_missing_trials)
+"""
+
+import re
+from typing import Optional
+
+_TRIALS = re.compile(r'^\s*(\d+) trials\s*$', re.MULTILINE)
+_EQUITY_LINE = re.compile(r'^(.+) = (.+?)% \((.+)\)$', re.MULTILINE)
+_SELECT = re.compile(r'^\s*select\s+(.*?)\s+from\s', re.IGNORECASE | re.DOTALL)
+_SELECTOR = re.compile(r'\s*(\w+)\s*\(')
+_MERGEABLE_SELECTORS = ('avg', 'count')
+
+
+def is_mergeable_pql(pql: str) -> bool:
+    """ Returns True if all selectors of PQL query are avg or count
+
+    Args:
+        pql (str): PQL query
+
+    Returns:
+        bool: True if results of the query can be merged
+    """
+    select = _SELECT.match(pql)
+    if select is None:
+        return False
+    selectors = []
+    depth = 0
+    start = 0
+    clause = select.group(1)
+    for position, char in enumerate(clause):
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            selectors.append(clause[start:position])
+            start = position + 1
+    selectors.append(clause[start:])
+    for selector in selectors:
+        function = _SELECTOR.match(selector)
+        if function is None or function.group(1).lower() not in _MERGEABLE_SELECTORS:
+            return False
+    return True
+
+
+def sample_trials(result: str) -> Optional[int]:
+    """ Returns number of trials of PQL or equity result
+
+    The number of trials of a raw computeEquityAuto result isn't reported, it's the sum of the hands' counts
+    (each trial is shared between the hands).
+
+    Args:
+        result (str): result in OddsOracle format
+
+    Returns:
+        int: number of trials, None if unknown
+    """
+    trials = _TRIALS.search(result)
+    if trials:
+        return int(trials.group(1))
+    counts = [float(line.group(3)) for line in _EQUITY_LINE.finditer(result)]
+    if counts:
+        return int(round(sum(counts)))
+    return None
+
+
+def merge_equity_results(old: Optional[str], new: str) -> str:
+    """ Merges computeEquityAuto results of the same hands
+
+    Args:
+        old (str): previous result, None if there is no previous result
+        new (str): result of the new trials
+
+    Returns:
+        str: merged result with 'N trials' line
+
+    Raises:
+        ValueError: if results are for different hands
+    """
+    new_trials = sample_trials(new) or 0
+    new_lines = [(line.group(1), float(line.group(2)), float(line.group(3))) for line in _EQUITY_LINE.finditer(new)]
+    if old is None:
+        old_trials, old_lines = 0, [(hand, 0.0, 0.0) for hand, _, _ in new_lines]
+    else:
+        old_trials = sample_trials(old) or 0
+        old_lines = [(line.group(1), float(line.group(2)), float(line.group(3)))
+                     for line in _EQUITY_LINE.finditer(old)]
+    if [line[0] for line in old_lines] != [line[0] for line in new_lines]:
+        raise ValueError("Can't merge equities of different hands")
+    trials = old_trials + new_trials
+    merged = []
+    for (hand, old_percent, old_counts), (_, new_percent, new_counts) in zip(old_lines, new_lines):
+        percent = (old_percent * old_trials + new_percent * new_trials) / trials if trials else new_percent
+        counts = old_counts + new_counts
+        merged.append('{} = {:.4f}% ({})'.format(hand, percent, int(counts) if counts.is_integer() else counts))
+    merged.append('{} trials'.format(trials))
+    return '\n'.join(merged) + '\n'
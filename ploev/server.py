@@ -0,0 +1,469 @@
+# ploev
+# Copyright (C) 2017 Alexey Londkevich <vyvojer@gmail.com>
+
+# ploev is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# ploev is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Pure-Python stand-in for OddsOracle xmlrpc server
+
+The server has the same PPTServer.executePQL and PPTServer.computeEquityAuto interface, so OddsOracle, Calc and
+GameTree work without Java OddsOracle. Answers are computed by a local Monte Carlo simulation of omahahi
+in generic syntax (see ploev.combos for the supported range syntax).
+
+Supported PQL:
+    select avg(riverEquity(<player>)) [as <name>], count(inRange(<player>, '<range>')) [as <name>],
+        histogram(<player>, fractionalRiverEquity(<player>)) [as <name>],
+        histogram(<player>, equity(<player>, <street of the board>)) [as <name>], ...
+    from game='omahahi', syntax='generic', board='...', dead='...', hero='...', player_1='...', ...
+
+Names of players, game and syntax aren't case-sensitive, cards of a hand can be separated by spaces.
+
+Equity histograms are counted by whole percents (the last element is 99) or by fractions of the pot on the river
+as OddsOracle does. Equity on the street is exact (all runouts of the dealt holdings are enumerated), so it isn't
+supported preflop and is slow on the flop.
+
+Usage:
+    with PPTServer() as server:
+        odds_oracle = OddsOracle(port=server.port, connect=False)
+
+Or from the command line:
+    python -m ploev.server --port 40000
+"""
+
+import argparse
+import itertools
+import logging
+import random
+import re
+import socketserver
+import threading
+import time
+from collections import namedtuple
+from fractions import Fraction
+from xmlrpc.server import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+
+import numpy as np
+
+from ploev.cards import card_from_int, card_to_str, cards_to_ints
+from ploev.combos import RangeSyntaxError, conflict_mask, holdings, range_mask
+from ploev.eval import omaha_rank
+
+_GAME = 'omahahi'
+_SYNTAX = 'generic'
+# Attempts to deal non-conflicting hands for one trial
+_MAX_ATTEMPTS = 1000
+# Street by number of board cards
+_STREETS = {0: 'preflop', 3: 'flop', 4: 'turn', 5: 'river'}
+
+
+class SimulationError(Exception):
+    """ Query can't be simulated, the message is returned to the client """
+
+
+def _card_conflict(card: int) -> SimulationError:
+    return SimulationError('Card {} cannot be in more than one place at the same time'.format(
+        card_to_str(card_from_int(card))))
+
+
+_Player = namedtuple('_Player', 'name indexes cards')
+
+
+class Simulation:
+    """ Monte Carlo simulation of omahahi hand
+
+    Holdings of players are dealt uniformly from their ranges (without conflicting cards), the rest of the board
+    is dealt from the remaining deck.
+    """
+
+    def __init__(self, ranges: list, board: str = '', dead: str = '', rng: random.Random = None):
+        """
+        Args:
+            ranges (list): list of (name, range) of players
+            board (str): board
+            dead (str): dead cards
+            rng (random.Random): random generator
+
+        Raises:
+            SimulationError: if query is wrong
+        """
+        try:
+            self.board = cards_to_ints(board)
+            dead_cards = cards_to_ints(dead)
+        except ValueError as error:
+            raise SimulationError(str(error))
+        if len(self.board) not in (0, 3, 4, 5):
+            raise SimulationError('Board must contain 0, 3, 4 or 5 cards')
+        known = self.board + dead_cards
+        for card in known:
+            if known.count(card) > 1:
+                raise _card_conflict(card)
+        self.rng = rng if rng is not None else random.Random()
+        self._deck = [card for card in range(52) if card not in known]
+        free = ~conflict_mask(known)
+        self.players = []
+        for name, range_ in ranges:
+            try:
+                indexes = np.flatnonzero(range_mask(range_) & free)
+            except RangeSyntaxError as error:
+                raise SimulationError(str(error))
+            if len(indexes) == 0:
+                raise SimulationError('Range {} of {}: cards cannot be in more than one place at the same time'
+                                      .format(range_, name))
+            self.players.append(_Player(name, indexes, holdings()[indexes]))
+        if not self.players:
+            raise SimulationError('No players')
+
+    def player_index(self, name: str) -> int:
+        for index, player in enumerate(self.players):
+            if player.name == name:
+                return index
+        raise SimulationError('Unknown player {}'.format(name))
+
+    def deal(self) -> list:
+        """ Returns indexes of holdings of players (in holdings()) and their cards
+
+        Raises:
+            SimulationError: if non-conflicting hands can't be dealt
+        """
+        for _ in range(_MAX_ATTEMPTS):
+            dealt = []
+            used = set()
+            for player in self.players:
+                position = self.rng.randrange(len(player.indexes))
+                cards = player.cards[position].tolist()
+                if used.intersection(cards):
+                    break
+                used.update(cards)
+                dealt.append((position, cards))
+            else:
+                return dealt
+        raise SimulationError('Cards cannot be in more than one place at the same time: '
+                              'ranges of players conflict with each other')
+
+    def river_equities(self, dealt: list) -> list:
+        """ Deals the rest of the board and returns share of pot of each player """
+        board = self.board + self.rng.sample(self._free_deck(dealt), 5 - len(self.board))
+        return [float(share) for share in self._pot_shares(dealt, board)]
+
+    def street_equities(self, dealt: list) -> list:
+        """ Returns exact equities (Fraction) of players on the board, all runouts of the board are enumerated
+
+        Raises:
+            SimulationError: if the board is preflop (too many runouts)
+        """
+        if not self.board:
+            raise SimulationError('Equity on the street is not supported preflop')
+        totals = [Fraction(0)] * len(dealt)
+        runouts = 0
+        for runout in itertools.combinations(self._free_deck(dealt), 5 - len(self.board)):
+            shares = self._pot_shares(dealt, self.board + list(runout))
+            totals = [total + share for total, share in zip(totals, shares)]
+            runouts += 1
+        return [total / runouts for total in totals]
+
+    def _free_deck(self, dealt: list) -> list:
+        used = set(card for _, cards in dealt for card in cards)
+        return [card for card in self._deck if card not in used]
+
+    @staticmethod
+    def _pot_shares(dealt: list, board: list) -> list:
+        values = [omaha_rank(cards, board) for _, cards in dealt]
+        best = max(values)
+        winners = values.count(best)
+        return [Fraction(1, winners) if value == best else Fraction(0) for value in values]
+
+    def run(self, trials: int, seconds: float, on_trial):
+        """ Runs simulation
+
+        Args:
+            trials (int): max number of trials
+            seconds (float): max time of simulation
+            on_trial (Callable): called with dealt holdings for every trial
+
+        Returns:
+            int: number of trials
+        """
+        deadline = time.monotonic() + seconds
+        done = 0
+        while done < trials:
+            on_trial(self.deal())
+            done += 1
+            if done % 64 == 0 and time.monotonic() > deadline:
+                break
+        return done
+
+
+_FROM = re.compile(r"(\w+)\s*=\s*'([^']*)'")
+_SELECTOR = re.compile(r"^(avg|count)\s*\(\s*(riverEquity|inRange)\s*\(\s*(\w+)\s*(?:,\s*'([^']*)'\s*)?\)\s*\)"
+                       r"(?:\s+as\s+(\w+))?$", re.IGNORECASE)
+_HISTOGRAM = re.compile(r"^histogram\s*\(\s*(\w+)\s*,\s*(fractionalRiverEquity|equity)\s*\(\s*(\w+)\s*"
+                        r"(?:,\s*(\w+)\s*)?\)\s*\)(?:\s+as\s+(\w+))?$", re.IGNORECASE)
+_PLAYER = re.compile(r'hero|player_\d+', re.IGNORECASE)
+
+
+def _split_top_level(text: str) -> list:
+    """ Splits text by commas out of parentheses and quotes """
+    parts = []
+    depth = 0
+    quoted = False
+    start = 0
+    for position, char in enumerate(text):
+        if char == "'":
+            quoted = not quoted
+        elif not quoted and char == '(':
+            depth += 1
+        elif not quoted and char == ')':
+            depth -= 1
+        elif not quoted and depth == 0 and char == ',':
+            parts.append(text[start:position].strip())
+            start = position + 1
+    parts.append(text[start:].strip())
+    return parts
+
+
+class PqlQuery:
+    """ Parsed PQL query
+
+    Attributes:
+        selectors (list): list of (name, function, argument, player, range of inRange or street of equity)
+        clauses (dict): values of from clause
+        players (list): list of (name, range)
+    """
+
+    def __init__(self, pql: str):
+        """
+        Args:
+            pql (str): PQL query
+
+        Raises:
+            SimulationError: if query is wrong or not supported
+        """
+        match = re.match(r"^\s*select\s+(.*?)\s+from\s+(.*)$", pql, re.IGNORECASE | re.DOTALL)
+        if match is None:
+            raise SimulationError('Query must be "select ... from ..."')
+        selectors_text, from_text = match.groups()
+        self.clauses = {}
+        for part in _split_top_level(from_text):
+            clause = _FROM.fullmatch(part)
+            if clause is None:
+                raise SimulationError('Wrong from clause: {}'.format(part))
+            # Names of clauses and players aren't case-sensitive
+            self.clauses[clause.group(1).lower()] = clause.group(2)
+        if self.clauses.get('game', _GAME).lower() != _GAME or self.clauses.get('syntax', _SYNTAX).lower() != _SYNTAX:
+            raise SimulationError('Only game={} and syntax={} are supported'.format(_GAME, _SYNTAX))
+        self.players = [(name, range_) for name, range_ in self.clauses.items() if _PLAYER.fullmatch(name)]
+        unknown = set(self.clauses) - {'game', 'syntax', 'board', 'dead'} - {name for name, _ in self.players}
+        if unknown:
+            raise SimulationError('Unknown from clause: {}'.format(', '.join(sorted(unknown))))
+        self.selectors = []
+        for number, text in enumerate(_split_top_level(selectors_text), start=1):
+            selector = _SELECTOR.match(text)
+            if selector is not None:
+                function, argument, player, range_, name = selector.groups()
+                function, argument, player = function.lower(), argument.lower(), player.lower()
+                if (function, argument) not in (('avg', 'riverequity'), ('count', 'inrange')) \
+                        or (argument == 'inrange') != (range_ is not None):
+                    raise SimulationError('Not supported selector: {}'.format(text))
+            else:
+                selector = _HISTOGRAM.match(text)
+                if selector is None:
+                    raise SimulationError('Not supported selector: {}'.format(text))
+                function = 'histogram'
+                histogram_player, argument, player, range_, name = selector.groups()
+                argument, player = argument.lower(), player.lower()
+                if histogram_player.lower() != player or (argument == 'equity') != (range_ is not None) \
+                        or (range_ is not None and range_.lower() not in _STREETS.values()):
+                    raise SimulationError('Not supported selector: {}'.format(text))
+                range_ = range_ and range_.lower()
+            if name is None:
+                name = '{} {}'.format(function.upper(), number)
+            self.selectors.append((name, function, argument, player, range_))
+
+
+class PPTServer:
+    """ Stand-in for OddsOracle xmlrpc server
+
+    Attributes:
+        host (str): host
+        port (int): port, chosen by the system if 0 was passed
+    """
+    logger = logging.getLogger('ppt.PPTServer')
+
+    def __init__(self, host: str = 'localhost', port: int = 0, seed: int = None):
+        """
+        Args:
+            host (str): host
+            port (int): port, 0 for any free port
+            seed (int): seed of random generator, simulations are reproducible if it's set
+        """
+        self._server = _ThreadingXMLRPCServer((host, port), requestHandler=_RequestHandler, logRequests=False,
+                                              allow_none=True)
+        self._server.register_function(self.execute_pql, 'PPTServer.executePQL')
+        self._server.register_function(self.compute_equity_auto, 'PPTServer.computeEquityAuto')
+        self._server.register_multicall_functions()
+        self._seeds = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.host = host
+        self.port = self._server.server_address[1]
+
+    @property
+    def url(self) -> str:
+        return 'http://{}:{}/xmlrpc'.format(self.host, self.port)
+
+    def _rng(self) -> random.Random:
+        with self._lock:
+            return random.Random(self._seeds.getrandbits(64))
+
+    def execute_pql(self, pql: str, trials: int, seconds: int, threads: int = 1) -> str:
+        """ Executes PQL query, threads are ignored
+
+        Returns:
+            str: result in OddsOracle format or 'ERROR: ...'
+        """
+        try:
+            query = PqlQuery(pql)
+            simulation = Simulation(query.players, query.clauses.get('board', ''), query.clauses.get('dead', ''),
+                                    rng=self._rng())
+            return self._execute(query, simulation, trials, seconds)
+        except SimulationError as error:
+            self.logger.info('PQL error: {}'.format(error))
+            return 'ERROR: {}\n'.format(error)
+
+    @staticmethod
+    def _execute(query: PqlQuery, simulation: Simulation, trials: int, seconds: float) -> str:
+        checks = []
+        for name, function, argument, player, range_ in query.selectors:
+            index = simulation.player_index(player)
+            if argument == 'inrange':
+                try:
+                    mask = range_mask(range_)[simulation.players[index].indexes]
+                except RangeSyntaxError as error:
+                    raise SimulationError(str(error))
+                checks.append((index, mask))
+            else:
+                if argument == 'equity' and range_ != _STREETS.get(len(simulation.board)):
+                    raise SimulationError('Equity histogram is supported only on the street of the board')
+                checks.append((index, None))
+        arguments = set(argument for _, _, argument, _, _ in query.selectors)
+        totals = [0.0] * len(checks)
+        histograms = [{} for _ in checks]
+
+        def on_trial(dealt):
+            equities = simulation.river_equities(dealt) if arguments & {'riverequity', 'fractionalriverequity'} \
+                else None
+            street_equities = simulation.street_equities(dealt) if 'equity' in arguments else None
+            for number, (_, function, argument, _, _) in enumerate(query.selectors):
+                index, mask = checks[number]
+                if function == 'histogram':
+                    if argument == 'equity':
+                        # Whole percents, 100% is counted in the last element as OddsOracle does
+                        element = str(min(int(street_equities[index] * 100), 99))
+                    else:
+                        element = str(Fraction(equities[index]).limit_denominator(len(dealt)))
+                    histograms[number][element] = histograms[number].get(element, 0) + 1
+                elif mask is None:
+                    totals[number] += equities[index]
+                elif mask[dealt[index][0]]:
+                    totals[number] += 1
+
+        done = simulation.run(trials, seconds, on_trial)
+        lines = []
+        for (name, function, _, _, _), total, histogram in zip(query.selectors, totals, histograms):
+            if function == 'avg':
+                lines.append('{} = {:.6f}'.format(name, total / done))
+            elif function == 'count':
+                lines.append('{} = {:.4f}% ({})'.format(name, total / done * 100, int(total)))
+            else:
+                lines.append('{} = {}'.format(name, ','.join(
+                    '[{}:{:.4f}% ({})]'.format(element, counts / done * 100, counts)
+                    for element, counts in sorted(histogram.items(), key=lambda item: Fraction(item[0])))))
+        lines.append('{} trials'.format(done))
+        return '\n'.join(lines) + '\n'
+
+    def compute_equity_auto(self, game: str, board: str, dead: str, syntax: str, hands: list, trials: int,
+                            seconds: int, threads: int = 1) -> str:
+        """ Computes equities of hands, threads are ignored
+
+        Returns:
+            str: result in OddsOracle format or 'Error: ...'
+        """
+        try:
+            if game.lower() != _GAME or syntax.lower() != _SYNTAX:
+                raise SimulationError('Only game={} and syntax={} are supported'.format(_GAME, _SYNTAX))
+            simulation = Simulation([(hand, hand) for hand in hands], board, dead, rng=self._rng())
+            totals = [0.0] * len(hands)
+
+            def on_trial(dealt):
+                for index, equity in enumerate(simulation.river_equities(dealt)):
+                    totals[index] += equity
+
+            done = simulation.run(trials, seconds, on_trial)
+        except SimulationError as error:
+            self.logger.info('Equity error: {}'.format(error))
+            return 'Error: {}\n'.format(error)
+        return ''.join('{} = {:.2f}% ({})\n'.format(hand, total / done * 100, int(round(total)))
+                       for hand, total in zip(hands, totals))
+
+    def start(self) -> 'PPTServer':
+        """ Starts serving in a daemon thread """
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        self.logger.info('Serving on {}'.format(self.url))
+        return self
+
+    def serve_forever(self):
+        """ Serves in the current thread """
+        self.logger.info('Serving on {}'.format(self.url))
+        self._server.serve_forever()
+
+    def stop(self):
+        """ Stops serving and closes the socket """
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+class _RequestHandler(SimpleXMLRPCRequestHandler):
+    rpc_paths = ('/xmlrpc',)
+
+
+class _ThreadingXMLRPCServer(socketserver.ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+
+
+def main(args: list = None):
+    parser = argparse.ArgumentParser(description='Stand-in for OddsOracle xmlrpc server')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=40000)
+    parser.add_argument('--seed', type=int, default=None)
+    options = parser.parse_args(args)
+    server = PPTServer(options.host, options.port, options.seed)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+# ploev
+# Copyright (C) 2017 Alexey Londkevich <vyvojer@gmail.com>
+
+# ploev is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# ploev is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" Statistics of OddsOracle queries
+
+Usage:
+    odds_oracle.query_stats.slow_query_seconds = 1.0
+    odds_oracle.query_stats.track_callers = True
+    tree.calculate()
+    snapshot = odds_oracle.stats()
+    snapshot['by_caller'][('equity', 'GameTree._calculate_equities > Pql.equity')]['server_seconds']
+"""
+
+import logging
+import sys
+import threading
+from collections import deque, namedtuple
+
+SlowQuery = namedtuple('SlowQuery', 'kind caller seconds query')
+
+# Modules of query API, frames of them are skipped while looking for the origin of a query
+_API_MODULES = ('ploev.ppt', 'ploev.async_ppt', 'ploev.calc', 'ploev.stats')
+# Origin isn't searched beyond frames of these modules
+_RUNNER_MODULES = ('asyncio', 'concurrent', 'threading')
+_MAX_DEPTH = 64
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    name = getattr(code, 'co_qualname', None)
+    if name is None:
+        instance = frame.f_locals.get('self')
+        name = code.co_name if instance is None else '{}.{}'.format(type(instance).__name__, code.co_name)
+    return name
+
+
+def find_caller(skip_types: tuple, depth: int = 2) -> str:
+    """ Returns name of the code, which made a query
+
+    The name is 'origin > api', where api is the first function out of skip_types methods (for example
+    Pql.hero_equity) and origin is the first function out of query API modules (for example
+    GameTree._calculate_equities). If they are the same function, the name is just its name.
+
+    Args:
+        skip_types (tuple): types whose methods are skipped (OddsOracle, QueryBatch ...)
+        depth (int): number of frames to skip
+
+    Returns:
+        str: name of caller
+    """
+    try:
+        frame = sys._getframe(depth)
+    except ValueError:
+        return '<unknown>'
+    api = None
+    for _ in range(_MAX_DEPTH):
+        if frame is None:
+            break
+        module = frame.f_globals.get('__name__', '')
+        if api is None:
+            # comprehensions and lambdas are parts of their enclosing function
+            anonymous = frame.f_code.co_name.startswith('<') and frame.f_code.co_name != '<module>'
+            if not (anonymous or isinstance(frame.f_locals.get('self'), skip_types) or module == 'ploev.stats'):
+                api = _frame_name(frame)
+        if api is not None:
+            if module.startswith(_RUNNER_MODULES):
+                break
+            if module not in _API_MODULES:
+                origin = _frame_name(frame)
+                return api if origin == api else '{} > {}'.format(origin, api)
+        frame = frame.f_back
+    return api if api is not None else '<unknown>'
+
+
+class _Entry:
+    def __init__(self, buckets: tuple):
+        self.calls = 0
+        self.hits = 0
+        self.shared = 0
+        self.misses = 0
+        self.errors = 0
+        self.server_seconds = 0.0
+        self.response_bytes = 0
+        self.parse_seconds = 0.0
+        self.latency = [0] * len(buckets)
+
+    def as_dict(self, buckets: tuple) -> dict:
+        return {
+            'calls': self.calls,
+            'hits': self.hits,
+            'shared': self.shared,
+            'misses': self.misses,
+            'errors': self.errors,
+            'server_seconds': self.server_seconds,
+            'response_bytes': self.response_bytes,
+            'parse_seconds': self.parse_seconds,
+            'latency_histogram': dict(zip(buckets, self.latency)),
+        }
+
+
+class QueryStats:
+    """ Statistics of queries per kind ('pql', 'equity') and per caller
+
+    Finding the caller walks the stack, it would cost more than a cache hit, so callers are needed only if
+    statistics per caller are tracked or slow queries are logged (see needs_callers).
+
+    Attributes:
+        slow_query_seconds (float): queries with bigger server latency are logged with their text, None - no log
+        slow_queries (deque): last slow queries (SlowQuery)
+        track_callers (bool): if True, statistics are kept per caller as well
+    """
+    # Upper bounds of latency histogram buckets in seconds
+    LATENCY_BUCKETS = (0.001, 0.01, 0.05, 0.1, 0.5, 1.0, 2.0, 5.0, 10.0, float('inf'))
+    logger = logging.getLogger('ppt.QueryStats')
+
+    def __init__(self, slow_query_seconds: float = None, max_slow_queries: int = 100, track_callers: bool = False):
+        """
+        Args:
+            slow_query_seconds (float): queries with bigger server latency are logged, None - no log
+            max_slow_queries (int): number of kept slow queries
+            track_callers (bool): if True, statistics are kept per caller as well
+        """
+        self.slow_query_seconds = slow_query_seconds
+        self.track_callers = track_callers
+        self.slow_queries = deque(maxlen=max_slow_queries)
+        self._lock = threading.Lock()
+        self._by_kind = {}
+        self._by_caller = {}
+
+    @property
+    def needs_callers(self) -> bool:
+        """ True if record uses caller """
+        return self.track_callers or self.slow_query_seconds is not None
+
+    def record(self, kind: str, caller: str, hit: bool, server_seconds: float = 0.0, response_bytes: int = 0,
+               parse_seconds: float = 0.0, error: bool = False, query: str = None, shared: bool = False):
+        """ Records one query
+
+        Args:
+            kind (str): 'pql' or 'equity'
+            caller (str): caller, see find_caller, None if not needs_callers
+            hit (bool): True if result was taken from the cache
+            server_seconds (float): latency of the server (for misses)
+            response_bytes (int): size of the result
+            parse_seconds (float): time of parsing of the result
+            error (bool): True if query failed
+            query (str): text of query for the slow query log
+            shared (bool): True if result was taken from the identical query sent at the same time (it's a hit too)
+        """
+        with self._lock:
+            groups = [(self._by_kind, kind)]
+            if self.track_callers:
+                groups.append((self._by_caller, (kind, caller)))
+            for entries, key in groups:
+                entry = entries.get(key)
+                if entry is None:
+                    entry = entries[key] = _Entry(self.LATENCY_BUCKETS)
+                entry.calls += 1
+                entry.errors += error
+                entry.response_bytes += response_bytes
+                entry.parse_seconds += parse_seconds
+                if hit:
+                    entry.hits += 1
+                    entry.shared += shared
+                else:
+                    entry.misses += 1
+                    entry.server_seconds += server_seconds
+                    entry.latency[self._bucket(server_seconds)] += 1
+            if not hit and self.slow_query_seconds is not None and server_seconds > self.slow_query_seconds:
+                self.slow_queries.append(SlowQuery(kind, caller, server_seconds, query))
+                self.logger.warning('Slow {} query ({:.2f} s) from {}: {}'.format(kind, server_seconds, caller, query))
+
+    def _bucket(self, seconds: float) -> int:
+        for index, bound in enumerate(self.LATENCY_BUCKETS):
+            if seconds <= bound:
+                return index
+        return len(self.LATENCY_BUCKETS) - 1
+
+    def snapshot(self) -> dict:
+        """ Returns copy of statistics
+
+        Returns:
+            dict: {'by_kind': {kind: entry}, 'by_caller': {(kind, caller): entry} (empty if callers aren't tracked),
+                'slow_queries': [SlowQuery]},
+                entry is a dict with calls, hits, shared (hits waiting for identical queries), misses, errors,
+                server_seconds, response_bytes, parse_seconds and latency_histogram ({upper bound in seconds: number
+                of queries})
+        """
+        with self._lock:
+            return {
+                'by_kind': {kind: entry.as_dict(self.LATENCY_BUCKETS) for kind, entry in self._by_kind.items()},
+                'by_caller': {key: entry.as_dict(self.LATENCY_BUCKETS) for key, entry in self._by_caller.items()},
+                'slow_queries': list(self.slow_queries),
+            }
+
+    def reset(self):
+        """ Removes all statistics """
+        with self._lock:
+            self._by_kind.clear()
+            self._by_caller.clear()
+            self.slow_queries.clear()
@@ -0,0 +1,167 @@
+# ploev
+# Copyright (C) 2017 Alexey Londkevich <vyvojer@gmail.com>
+
+# ploev is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# ploev is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+""" xmlrpc transport of OddsOracle
+
+Connections are kept alive between requests, large request bodies can be gzip-encoded and every request is
+counted in TransportStats.
+
+Usage:
+    stats = TransportStats()
+    client = xmlrpc.client.ServerProxy(url, transport=KeepAliveTransport(timeout=60, gzip_threshold=4096,
+                                                                         stats=stats))
+    stats.snapshot()['bytes_sent']
+"""
+
+import logging
+import threading
+import time
+import xmlrpc.client
+
+
+class TransportStats:
+    """ Counters of HTTP requests, thread-safe """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def record_request(self, bytes_sent: int, bytes_received: int, seconds: float, error: bool = False):
+        """ Records one request
+
+        Args:
+            bytes_sent (int): size of the request body on the wire
+            bytes_received (int): size of the response body on the wire
+            seconds (float): time of the request
+            error (bool): True if the request failed
+        """
+        with self._lock:
+            self._requests += 1
+            self._errors += error
+            self._bytes_sent += bytes_sent
+            self._bytes_received += bytes_received
+            self._seconds += seconds
+
+    def record_connection(self):
+        """ Records a new connection """
+        with self._lock:
+            self._connections += 1
+
+    def snapshot(self) -> dict:
+        """ Returns copy of counters
+
+        Returns:
+            dict: requests, errors, connections (opened connections), bytes_sent, bytes_received, seconds
+        """
+        with self._lock:
+            return {
+                'requests': self._requests,
+                'errors': self._errors,
+                'connections': self._connections,
+                'bytes_sent': self._bytes_sent,
+                'bytes_received': self._bytes_received,
+                'seconds': self._seconds,
+            }
+
+    def reset(self):
+        """ Sets counters to zero """
+        with self._lock:
+            self._requests = 0
+            self._errors = 0
+            self._connections = 0
+            self._bytes_sent = 0
+            self._bytes_received = 0
+            self._seconds = 0.0
+
+
+class KeepAliveTransport(xmlrpc.client.Transport):
+    """ HTTP transport keeping its connection alive, with socket timeout, gzip-encoded requests and counters
+
+    Like xmlrpc.client.Transport, it isn't thread-safe: every thread needs its own ServerProxy and transport.
+    If the server refuses a gzip-encoded request, the request is repeated without encoding and the transport
+    doesn't encode requests any more.
+
+    Attributes:
+        timeout (float): socket timeout in seconds, None - no timeout
+        gzip_threshold (int): request bodies longer than gzip_threshold bytes are gzip-encoded, None - never
+        stats (TransportStats): counters of requests
+    """
+    logger = logging.getLogger('ppt.transport')
+
+    def __init__(self, timeout: float = None, gzip_threshold: int = None, stats: TransportStats = None):
+        """
+        Args:
+            timeout (float): socket timeout in seconds, None - no timeout
+            gzip_threshold (int): request bodies longer than gzip_threshold bytes are gzip-encoded, None - never
+            stats (TransportStats): counters of requests, new counters if not provided
+        """
+        super().__init__()
+        self.timeout = timeout
+        self.gzip_threshold = gzip_threshold
+        self.stats = stats if stats is not None else TransportStats()
+        self._bytes_sent = 0
+        self._bytes_received = 0
+        self._encoded = False
+
+    def make_connection(self, host):
+        if self._connection and host == self._connection[0]:
+            return self._connection[1]
+        connection = super().make_connection(host)
+        if self.timeout is not None:
+            connection.timeout = self.timeout
+        self.stats.record_connection()
+        return connection
+
+    def single_request(self, host, handler, request_body, verbose=False):
+        started = time.perf_counter()
+        self._bytes_sent = self._bytes_received = 0
+        self._encoded = False
+        try:
+            response = super().single_request(host, handler, request_body, verbose)
+        except xmlrpc.client.Fault:
+            self.stats.record_request(self._bytes_sent, self._bytes_received, time.perf_counter() - started)
+            raise
+        except xmlrpc.client.ProtocolError:
+            self.stats.record_request(self._bytes_sent, self._bytes_received, time.perf_counter() - started, True)
+            if not self._encoded:
+                raise
+            self.logger.info('{} refused gzip-encoded request, requests will not be encoded'.format(host))
+            self.gzip_threshold = None
+            return self.single_request(host, handler, request_body, verbose)
+        except Exception:
+            self.stats.record_request(self._bytes_sent, self._bytes_received, time.perf_counter() - started, True)
+            raise
+        self.stats.record_request(self._bytes_sent, self._bytes_received, time.perf_counter() - started)
+        return response
+
+    def send_content(self, connection, request_body):
+        if self.gzip_threshold is not None and len(request_body) > self.gzip_threshold:
+            connection.putheader('Content-Encoding', 'gzip')
+            request_body = xmlrpc.client.gzip_encode(request_body)
+            self._encoded = True
+        self._bytes_sent = len(request_body)
+        connection.putheader('Content-Length', str(len(request_body)))
+        connection.endheaders(request_body)
+
+    def parse_response(self, response):
+        body = response.read()
+        self._bytes_received = len(body)
+        if response.getheader('Content-Encoding', '') == 'gzip':
+            body = xmlrpc.client.gzip_decode(body)
+        parser, unmarshaller = self.getparser()
+        parser.feed(body)
+        parser.close()
+        return unmarshaller.close()
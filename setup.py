@@ -17,5 +17,5 @@ setup(name='ploev',
       package_data={
           'ploev': ['ploev.ini',]
       },
-      install_requires=['pyparsing'],
+      install_requires=['pyparsing', 'numpy'],
       zip_safe=False)
\ No newline at end of file
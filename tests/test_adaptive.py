@@ -0,0 +1,47 @@
+import unittest
+
+from ploev.ppt import Pql, EquityEstimate
+from tests.xmlrpc_fixture import FakeOddsOracle
+
+
+def _fake_odds_oracle(equities, trials=100000):
+    """ Answers with fixed equities and the requested trials """
+
+    def answer(pql, requested_trials):
+        lines = ['EQ{} = {}'.format(number, equity) for number, equity in enumerate(equities, start=1)]
+        lines.append('EQ = {}'.format(equities[0]))
+        return '\n'.join(lines) + '\n{} trials\n'.format(requested_trials)
+
+    return FakeOddsOracle(answer, trials=trials)
+
+
+class AdaptiveEquityTest(unittest.TestCase):
+    def test_converges_without_requery(self):
+        oo = _fake_odds_oracle([0.99, 0.01])
+        estimate = Pql(oo).adaptive_hero_equity('AA', ['KK'], tolerance=0.005, initial_trials=1000)
+        self.assertIsInstance(estimate, EquityEstimate)
+        self.assertEqual(oo.requested_trials, [1000])
+        self.assertAlmostEqual(estimate.equity, 0.99)
+        self.assertLessEqual(estimate.stderr, 0.005)
+        self.assertEqual(estimate.trials, 1000)
+
+    def test_requery_until_tolerance(self):
+        oo = _fake_odds_oracle([0.5, 0.5])
+        estimates = Pql(oo).adaptive_equity(['AA', 'KK'], tolerance=0.005, initial_trials=1000)
+        # 0.25 / 0.005 ** 2 = 10000 trials are needed
+        self.assertEqual(oo.requested_trials, [1000, 9000])
+        self.assertEqual([estimate.trials for estimate in estimates], [10000, 10000])
+        self.assertAlmostEqual(estimates[0].equity, 0.5)
+        self.assertLessEqual(max(estimate.stderr for estimate in estimates), 0.005)
+
+    def test_max_trials(self):
+        oo = _fake_odds_oracle([0.5, 0.5], trials=5000)
+        estimate = Pql(oo).adaptive_hero_equity('AA', ['KK'], tolerance=0.001, initial_trials=1000)
+        self.assertEqual(sum(oo.requested_trials), 5000)
+        self.assertEqual(estimate.trials, 5000)
+        self.assertGreater(estimate.stderr, 0.001)
+
+    def test_rounds_have_different_trials(self):
+        oo = _fake_odds_oracle([0.5, 0.5])
+        Pql(oo).adaptive_hero_equity('AA', ['KK'], tolerance=0.0005, initial_trials=1000)
+        self.assertEqual(len(oo.requested_trials), len(set(oo.requested_trials)))
@@ -0,0 +1,261 @@
+import unittest
+import asyncio
+
+from ploev import exact
+from ploev.async_ppt import AsyncOddsOracle, AsyncPql
+from ploev.calc import AsyncCalc
+from ploev.cache import MemoryCache
+from ploev.ppt import OddsOracle, Pql
+from tests.xmlrpc_fixture import FixedAnswerServer, closed_port
+
+
+class _LaunchingOddsOracle(AsyncOddsOracle):
+    """ Runs FixedAnswerServer instead of OddsOracle server """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.launched = None
+
+    def run_server(self):
+        self.launched = FixedAnswerServer().start()
+        self._port = self.launched.port
+
+
+class _BrokenOddsOracle(AsyncOddsOracle):
+    def run_server(self):
+        raise ConnectionError("Can't start OddsOracle server")
+
+
+class AsyncOddsOracleTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FixedAnswerServer(pql_result='EQ = 0.25\n100 trials\n', delay=0.05).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def _odds_oracle(self, concurrency=8):
+        return AsyncOddsOracle(port=self.server.port, trials=100, seconds=1, cache=MemoryCache(),
+                               concurrency=concurrency)
+
+    def test_pql_and_equity(self):
+        odds_oracle = self._odds_oracle()
+
+        async def run():
+            result = await odds_oracle.pql('select avg(riverEquity(hero)) as EQ from game=omahahi')
+            equities = await odds_oracle.equity(('AA', 'KK'), 'Ks7d2c')
+            await odds_oracle.close()
+            return result, equities
+
+        result, equities = asyncio.run(run())
+        self.assertEqual(result.results_dict['EQ']['percentage'], 0.25)
+        self.assertEqual(equities, [0.5, 0.5])
+
+    def test_concurrency_limit(self):
+        odds_oracle = self._odds_oracle(concurrency=3)
+        pql = AsyncPql(odds_oracle)
+        self.server.max_concurrent = 0
+
+        async def run():
+            equities = await asyncio.gather(*[pql.hero_equity('AA', [str(number) + '%'], 'Ks7d2c')
+                                              for number in range(1, 10)])
+            await odds_oracle.close()
+            return equities
+
+        self.assertEqual(asyncio.run(run()), [0.25] * 9)
+        self.assertEqual(self.server.max_concurrent, 3)
+
+    def test_identical_queries_share_one_request(self):
+        odds_oracle = self._odds_oracle()
+        calls = self.server.calls
+
+        async def run():
+            equities = await asyncio.gather(*[odds_oracle.equity(('AA', 'QQ'), 'Ks7d2c') for _ in range(5)])
+            await odds_oracle.close()
+            return equities
+
+        self.assertEqual(asyncio.run(run()), [[0.5, 0.5]] * 5)
+        self.assertEqual(self.server.calls - calls, 1)
+        self.assertEqual(odds_oracle.stats()['by_kind']['equity']['shared'], 4)
+
+    def test_cancelled_query_does_not_cancel_identical_ones(self):
+        odds_oracle = self._odds_oracle()
+
+        async def run():
+            first = asyncio.ensure_future(odds_oracle.pql('select avg(riverEquity(hero)) as EQ from game=omahahi'))
+            await asyncio.sleep(0)
+            second = asyncio.ensure_future(odds_oracle.pql('select avg(riverEquity(hero)) as EQ from game=omahahi'))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            result = await second
+            await odds_oracle.close()
+            return result
+
+        self.assertEqual(asyncio.run(run()).results_dict['EQ']['percentage'], 0.25)
+
+    def test_cancelled_request_closes_connection(self):
+        server = FixedAnswerServer(delay=0.2, keep_alive=True).start()
+        odds_oracle = AsyncOddsOracle(port=server.port, trials=100, seconds=1, cache=MemoryCache())
+
+        async def run():
+            await odds_oracle.pql('select avg(riverEquity(hero)) as EQ from game=omahahi')
+            connection = odds_oracle._idle_connections[0]
+            query = asyncio.ensure_future(odds_oracle.pql('select avg(riverEquity(hero)) as EQ from hero=AA'))
+            await asyncio.sleep(0.05)
+            query.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await query
+            return connection
+
+        connection = asyncio.run(run())
+        server.stop()
+        self.assertTrue(connection.writer.is_closing())
+        self.assertEqual(odds_oracle._idle_connections, [])
+
+    def test_map(self):
+        odds_oracle = self._odds_oracle()
+
+        async def run():
+            results = await odds_oracle.map_pql(['select avg(riverEquity(hero)) as EQ from board={}'.format(n)
+                                                 for n in range(3)])
+            equities = await odds_oracle.map_equity([(('AA', 'KK'),), (('AA', 'KK', 'QQ', 'JJ'), 'Ks7d2c')])
+            await odds_oracle.close()
+            return results, equities
+
+        results, equities = asyncio.run(run())
+        self.assertEqual([result.values['EQ'] for result in results], [0.25] * 3)
+        self.assertEqual(equities, [[0.5] * 2, [0.25] * 4])
+
+    def test_hero_equity_many(self):
+        odds_oracle = self._odds_oracle()
+        calc = AsyncCalc(odds_oracle)
+        calls = self.server.calls
+
+        async def run():
+            equities = await calc.hero_equity_many(['AA', 'KK'], ['Ks7d2c', 'Ks7d2c5h', 'Ks7d2c5h', ''])
+            await odds_oracle.close()
+            return equities
+
+        self.assertEqual(asyncio.run(run()), [0.25] * 4)
+        self.assertEqual(self.server.calls - calls, 3)
+
+    def test_merge_samples(self):
+        odds_oracle = AsyncOddsOracle(port=self.server.port, trials=100, seconds=1, cache=MemoryCache(),
+                                      merge_samples=True)
+        pql = 'select avg(riverEquity(hero)) as EQ from game=omahahi, board=Kc8d2h'
+
+        async def run():
+            first = await odds_oracle.pql(pql)
+            second = await odds_oracle.pql(pql, trials=400)
+            await odds_oracle.close()
+            return first, second
+
+        requested = len(self.server.requested_trials)
+        first, second = asyncio.run(run())
+        self.assertEqual((first.trials, second.trials), (100, 200))
+        self.assertEqual(self.server.requested_trials[requested:], [100, 300])
+
+    def test_connect(self):
+        odds_oracle = self._odds_oracle()
+        calls = self.server.calls
+        asyncio.run(odds_oracle.connect())
+        self.assertEqual(self.server.calls - calls, 1)
+
+    def test_connect_runs_server(self):
+        odds_oracle = _LaunchingOddsOracle(port=closed_port(), trials=100, seconds=1)
+
+        async def run():
+            await odds_oracle.connect()
+            result = await odds_oracle.pql('select avg(riverEquity(hero)) as EQ from game=omahahi')
+            await odds_oracle.close()
+            return result
+
+        try:
+            self.assertEqual(asyncio.run(run()).values['EQ'], 0.5)
+        finally:
+            odds_oracle.launched.stop()
+        with self.assertRaises(ConnectionError):
+            asyncio.run(_BrokenOddsOracle(port=closed_port()).connect())
+
+    def test_adaptive(self):
+        server = FixedAnswerServer(pql_result=lambda pql: ('EQ1 = 0.2\nEQ2 = 0.8\n100 trials\n' if 'EQ1' in pql
+                                                           else 'EQ = 0.3\n100 trials\n')).start()
+        odds_oracle = AsyncOddsOracle(port=server.port, trials=2000, seconds=1, cache=MemoryCache())
+        pql = AsyncPql(odds_oracle)
+
+        async def run():
+            hero = await pql.adaptive_hero_equity('AA', ['KK'], 'Ks7d2c', tolerance=0.02, initial_trials=100)
+            equities = await pql.adaptive_equity(['AA', 'KK'], 'Ks7d2c', tolerance=0.02, initial_trials=100)
+            await odds_oracle.close()
+            return hero, equities
+
+        try:
+            hero, equities = asyncio.run(run())
+            sync_pql = Pql(OddsOracle(port=server.port, trials=2000, seconds=1, connect=False, cache=MemoryCache()))
+            self.assertEqual(hero, sync_pql.adaptive_hero_equity('AA', ['KK'], 'Ks7d2c', tolerance=0.02,
+                                                                 initial_trials=100))
+            self.assertEqual(equities, sync_pql.adaptive_equity(['AA', 'KK'], 'Ks7d2c', tolerance=0.02,
+                                                                initial_trials=100))
+        finally:
+            server.stop()
+        self.assertEqual(hero.equity, 0.3)
+        self.assertGreater(hero.trials, 100)
+        self.assertEqual([estimate.equity for estimate in equities], [0.2, 0.8])
+
+    def test_planner(self):
+        with self.assertRaises(TypeError):
+            AsyncPql(self._odds_oracle()).planner()
+
+    def test_batch(self):
+        odds_oracle = self._odds_oracle()
+        with self.assertRaises(TypeError):
+            odds_oracle.batch()
+        with self.assertRaises(TypeError):
+            odds_oracle._multicall([('PPTServer.executePQL', ('', 10, 1, 1))])
+
+    def test_calc_prefetch(self):
+        with self.assertRaises(TypeError):
+            AsyncCalc(self._odds_oracle()).prefetch(equities=[(['AA', 'KK'],)])
+
+    def test_calc_local_equities(self):
+        odds_oracle = AsyncOddsOracle(port=self.server.port, trials=20000, seconds=10, cache=MemoryCache())
+        calls = self.server.calls
+
+        async def run(calc):
+            exact_equity = await calc.equity(['AsAhQh8d', 'JJ'], 'Ks7d2cTs', hero_only=True)
+            sampled = await calc.equity(['AA', 'KK'], 'Ks7d2c')
+            estimate = await calc.equity(['AA', 'KK'], 'Ks7d2c', hero_only=True, tolerance=0.02)
+            return exact_equity, sampled, estimate
+
+        exact_equity, sampled, estimate = asyncio.run(run(AsyncCalc(odds_oracle, exact=True, monte_carlo=True)))
+        self.assertEqual(exact_equity, round(exact.hero_equity('AsAhQh8d', ['JJ'], 'Ks7d2cTs'), 3))
+        self.assertLess(sampled[0], 0.5)
+        self.assertLessEqual(estimate.stderr, 0.02)
+        self.assertEqual(self.server.calls, calls)
+
+    def test_calc_tolerance(self):
+        odds_oracle = self._odds_oracle()
+
+        async def run():
+            estimate = await AsyncCalc(odds_oracle).equity(['AA', 'KK'], 'Ks7d2c', hero_only=True, tolerance=0.05)
+            await odds_oracle.close()
+            return estimate
+
+        estimate = asyncio.run(run())
+        self.assertEqual(estimate.equity, 0.25)
+        self.assertLessEqual(estimate.stderr, 0.05)
+
+    def test_calc_range_distribution(self):
+        server = FixedAnswerServer(pql_result='COUNT 1 = 10.0000% (10)\nCOUNT 2 = 90.0000% (90)\n100 trials\n')
+        server.start()
+        odds_oracle = AsyncOddsOracle(port=server.port, trials=100, seconds=1, cache=MemoryCache())
+        calc = AsyncCalc(odds_oracle)
+
+        async def run():
+            return await calc.range_distribution('75%', ['KK', '*'], '7cKh4s', players=['AA'], equity=False)
+
+        distribution = asyncio.run(run())
+        server.stop()
+        self.assertEqual([sub_range.fraction for sub_range in distribution], [0.1, 0.9])
+        self.assertEqual(distribution[1].range, '(*)!(KK)')
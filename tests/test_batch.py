@@ -0,0 +1,336 @@
+import unittest
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ploev.ppt import OddsOracle, OddsOraclePool, Pql, PqlResult, PqlError
+from ploev.calc import Calc
+from ploev.cache import MemoryCache
+from tests.xmlrpc_fixture import FixedAnswerServer, MulticallServer
+
+
+class QueryBatchTest(unittest.TestCase):
+    def _odds_oracle(self, server):
+        return OddsOracle(port=server.port, trials=100, seconds=1, connect=False, cache=MemoryCache())
+
+    def test_multicall(self):
+        server = MulticallServer().start()
+        oo = self._odds_oracle(server)
+        oo.get_client()
+        with oo.batch(max_size=2) as batch:
+            results = [batch.pql('select avg(riverEquity(hero)) as EQ from board={}'.format(n)) for n in range(3)]
+            equity = batch.equity(('AA', 'KK', 'QQ', 'JJ'), 'Ks7d2c')
+            duplicate = batch.equity(('AA', 'KK', 'QQ', 'JJ'), 'Ks7d2c')
+            self.assertEqual(len(batch), 5)
+        server.stop()
+        self.assertEqual([result.result().results_dict['EQ'][PqlResult.PERCENTAGE] for result in results],
+                         [0.5] * 3)
+        self.assertEqual(equity.result(), [0.25] * 4)
+        self.assertEqual(duplicate.result(), [0.25] * 4)
+        self.assertEqual(server.multicalls, 2)
+        self.assertEqual(server.calls, 1 + 4)
+        self.assertTrue(oo._multicall_supported)
+
+    def test_merged_samples(self):
+        server = MulticallServer(pql_result='EQ = 0.5\n50 trials\n').start()
+        oo = OddsOracle(port=server.port, trials=100, seconds=1, connect=False, cache=MemoryCache(),
+                        merge_samples=True)
+        oo.get_client()
+        pql = 'select avg(riverEquity(hero)) as EQ from hero=AA, villain=KK'
+        oo.pql(pql, trials=50)
+        with oo.batch() as batch:
+            result = batch.pql(pql)
+        self.assertEqual(result.result().trials, 100)
+        # Only the missing trials are requested, the merged sample is used by OddsOracle.pql
+        self.assertEqual(server.requested_trials[-2:], [50, 50])
+        self.assertEqual(oo.pql(pql).trials, 100)
+        server.stop()
+        self.assertEqual(server.multicalls, 1)
+
+    def test_fallback_to_single_calls(self):
+        server = FixedAnswerServer().start()
+        oo = self._odds_oracle(server)
+        oo.get_client()
+        batch = oo.batch()
+        results = [batch.pql('select avg(riverEquity(hero)) as EQ from board={}'.format(n)) for n in range(3)]
+        batch.execute()
+        self.assertFalse(oo._multicall_supported)
+        self.assertEqual([result.result().results_dict['EQ'][PqlResult.PERCENTAGE] for result in results],
+                         [0.5] * 3)
+        calls = server.calls
+        batch.pql('select avg(riverEquity(hero)) as EQ from board=0')
+        batch.execute()
+        self.assertEqual(server.calls, calls)
+        server.stop()
+
+    def test_errors_are_set_per_query(self):
+        server = MulticallServer(pql_result='ERROR: la-la').start()
+        oo = self._odds_oracle(server)
+        oo.get_client()
+        batch = oo.batch()
+        result = batch.pql('la-la')
+        equity = batch.equity(('AA', 'KK'))
+        batch.execute()
+        server.stop()
+        self.assertIsInstance(result.exception(), PqlError)
+        self.assertEqual(equity.result(), [0.5, 0.5])
+
+    def test_waits_for_identical_query_in_flight(self):
+        server = FixedAnswerServer(delay=0.3).start()
+        oo = self._odds_oracle(server)
+        oo.get_client()
+        calls = server.calls
+        with ThreadPoolExecutor(1) as executor:
+            single = executor.submit(oo.equity, ('AA', 'KK'), 'Ks7d2c')
+            time.sleep(0.1)
+            with oo.batch() as batch:
+                equity = batch.equity(('AA', 'KK'), 'Ks7d2c')
+        server.stop()
+        self.assertEqual(equity.result(), single.result())
+        self.assertEqual(server.calls - calls, 1)
+        self.assertEqual(oo.stats()['by_kind']['equity']['shared'], 1)
+
+    def test_pool_batch(self):
+        servers = [FixedAnswerServer(delay=0.05).start() for _ in range(2)]
+        pool = OddsOraclePool([('localhost', server.port) for server in servers], trials=100, seconds=1,
+                              cache=MemoryCache())
+        batch = pool.batch()
+        results = [batch.pql('select avg(riverEquity(hero)) as EQ from board={}'.format(n)) for n in range(6)]
+        batch.execute()
+        for server in servers:
+            server.stop()
+        self.assertEqual([result.result().results_dict['EQ'][PqlResult.PERCENTAGE] for result in results],
+                         [0.5] * 6)
+        self.assertTrue(all(server.calls > 1 for server in servers))
+
+    def test_pool_multicall(self):
+        servers = [MulticallServer(delay=0.05).start() for _ in range(2)]
+        pool = OddsOraclePool([('localhost', server.port) for server in servers], trials=100, seconds=1,
+                              cache=MemoryCache())
+        calls = [server.calls for server in servers]
+        with pool.batch() as batch:
+            results = [batch.pql('select avg(riverEquity(hero)) as EQ from board={}'.format(n)) for n in range(6)]
+        for server in servers:
+            server.stop()
+        self.assertEqual([result.result().values['EQ'] for result in results], [0.5] * 6)
+        # One request of a chunk goes to every server at the same time
+        self.assertEqual([server.multicalls for server in servers], [1, 1])
+        self.assertEqual([server.calls - before for server, before in zip(servers, calls)], [3, 3])
+
+
+class MapTest(unittest.TestCase):
+    def setUp(self):
+        self.server = FixedAnswerServer(pql_result=self._answer, delay=0.1).start()
+        self.oo = OddsOracle(port=self.server.port, trials=100, seconds=1, connect=False, cache=MemoryCache())
+        self.oo.query_stats.track_callers = True
+
+    def tearDown(self):
+        self.server.stop()
+
+    @staticmethod
+    def _answer(pql):
+        board = re.search(r'board=(\d+)', pql)
+        return 'EQ = 0.{}\n100 trials\n'.format(board.group(1)) if board else 'ERROR: la-la'
+
+    def test_map_pql(self):
+        pqls = ['select avg(riverEquity(hero)) as EQ from board={}'.format(n) for n in range(1, 9)]
+        results = self.oo.map_pql(pqls, max_workers=4)
+        self.assertEqual([result.values['EQ'] for result in results], [n / 10 for n in range(1, 9)])
+        self.assertEqual(self.server.max_concurrent, 4)
+        by_caller = self.oo.stats()['by_caller']
+        self.assertEqual(list(by_caller), [('pql', 'MapTest.test_map_pql')])
+
+    def test_map_pql_batches(self):
+        pqls = ['select avg(riverEquity(hero)) as EQ from board={}'.format(n) for n in range(1, 6)]
+        results = self.oo.map_pql(pqls, max_workers=2, batch_size=2)
+        self.assertEqual([result.values['EQ'] for result in results], [n / 10 for n in range(1, 6)])
+        self.assertEqual(self.server.max_concurrent, 2)
+        with self.assertRaises(ValueError):
+            self.oo.map_pql(pqls, trials=10, batch_size=2)
+
+    def test_map_equity(self):
+        queries = [(('AA', 'KK'),), (('AA', 'KK', 'QQ'), 'Ks7d2c'), (('AA', 'KK', 'QQ', 'JJ'), 'Ks7d2c', '5h')]
+        self.assertEqual(self.oo.map_equity(queries), [[0.5] * 2, [0.333] * 3, [0.25] * 4])
+
+    def test_map_raises_error(self):
+        with self.assertRaises(PqlError):
+            self.oo.map_pql(['select avg(riverEquity(hero)) as EQ from board=1', 'la-la'])
+
+
+class HeroEquityManyTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MulticallServer(pql_result=self._answer, delay=0.1).start()
+        self.oo = OddsOracle(port=self.server.port, trials=100, seconds=1, connect=False, cache=MemoryCache())
+        self.oo.get_client()
+        self.oo.query_stats.track_callers = True
+
+    def tearDown(self):
+        self.server.stop()
+
+    @staticmethod
+    def _answer(pql):
+        """ Answers number of board characters / 20 """
+        board = re.search(r"board='(\w+)'", pql)
+        return 'EQ = {}\n100 trials\n'.format(len(board.group(1)) / 20 if board else 0.5)
+
+    def test_hero_equity_many(self):
+        boards = ['Ks7d2c', 'Ks7d2c5h', '', 'Ks7d2c5h', 'Ks7d2c5h9s']
+        calls = self.server.calls
+        equities = Pql(self.oo).hero_equity_many('AA', ['75%'], boards, batch_size=2, max_workers=2)
+        self.assertEqual(equities, [0.3, 0.4, 0.5, 0.4, 0.5])
+        self.assertEqual(self.server.calls - calls, 4)
+        self.assertEqual(self.server.multicalls, 3)
+        self.assertEqual(self.server.max_concurrent, 2)
+        pqls = self.server.pqls[-4:]
+        self.assertTrue(all("hero='AA'" in pql and "player_1='75%'" in pql for pql in pqls))
+        self.assertEqual(sum("board=" not in pql for pql in pqls), 1)
+        by_caller = self.oo.stats()['by_caller']
+        self.assertEqual(list(by_caller), [('pql', 'HeroEquityManyTest.test_hero_equity_many > Pql.hero_equity_many')])
+
+    def test_calc_hero_equity_many(self):
+        calc = Calc(self.oo)
+        self.assertEqual(calc.hero_equity_many(['AA', 'KK'], ['Ks7d2c', 'Ks7d2c5h'], dead='3c'), [0.3, 0.4])
+        self.assertIn('dead=', self.server.pqls[-1])
+
+    def test_errors(self):
+        self.server.pql_result = 'ERROR: la-la'
+        with self.assertRaises(PqlError):
+            Pql(self.oo).hero_equity_many('AA', ['KK'], ['Ks7d2c', 'Ks7d2c5h'], batch_size=1)
+
+
+def _aliases_answer(pql):
+    """ Answers 0.5 for avg selectors and 10% for count selectors """
+    lines = []
+    for selector, alias in re.findall(r'(avg|count)\(.*? as (\w+)', pql):
+        if selector == 'avg':
+            lines.append('{} = 0.5'.format(alias))
+        else:
+            lines.append('{} = 10.0000% (10)'.format(alias))
+    return '\n'.join(lines) + '\n100 trials\n'
+
+
+class PqlPlannerTest(unittest.TestCase):
+    def setUp(self):
+        self.server = FixedAnswerServer(pql_result=_aliases_answer).start()
+        odds_oracle = OddsOracle(port=self.server.port, trials=100, seconds=1, connect=False, cache=MemoryCache())
+        odds_oracle.get_client()
+        self.pql = Pql(odds_oracle)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_fusion(self):
+        planner = self.pql.planner()
+        equity = planner.hero_equity('AA', ['75%'], 'Ks7d2c')
+        fractions = planner.count_in_range('75%', ['KK', '77', 'KK'], 'Ks7d2c', players=['AA'])
+        other_board = planner.hero_equity('AA', ['75%'], 'Ks7d3c')
+        self.assertEqual(len(planner), 2)
+        planner.execute()
+        self.assertEqual(equity.result(), 0.5)
+        self.assertEqual(fractions.result(), [0.1, 0.1, 0.1])
+        self.assertEqual(other_board.result(), 0.5)
+        pqls = self.server.pqls[1:]
+        self.assertEqual(len(pqls), 2)
+        self.assertEqual(pqls[0].count(' as S'), 3)
+        self.assertIn("hero='AA'", pqls[0])
+
+    def test_calc_range_distribution(self):
+        calc = Calc(self.pql.odds_oracle)
+        distribution = calc.range_distribution('75%', ['KK', '*'], '7cKh4s', players=['AA'])
+        self.assertEqual([(sub_range.fraction, sub_range.equity) for sub_range in distribution], [(0.1, 0.5)] * 2)
+        self.assertEqual(len(self.server.pqls), 1 + 3)
+
+    def test_count_in_range_fractions(self):
+        planner = self.pql.planner()
+        fractions = planner.count_in_range('75%', ['KK'], 'Ks7d2c', players=['AA', 'QQ'])
+        planner.execute()
+        self.assertEqual(fractions.result(), [0.1])
+        self.assertIn("hero='AA'", self.server.pqls[-1])
+        self.assertIn("player_1='75%'", self.server.pqls[-1])
+        self.assertIn("player_2='QQ'", self.server.pqls[-1])
+
+    def test_merged_samples(self):
+        odds_oracle = OddsOracle(port=self.server.port, trials=100, seconds=1, connect=False, cache=MemoryCache(),
+                                 merge_samples=True)
+        planner = Pql(odds_oracle).planner()
+        equity = planner.hero_equity('AA', ['75%'], 'Ks7d2c')
+        planner.count_in_range('75%', ['KK'], 'Ks7d2c', players=['AA'])
+        fused = planner.fused_pqls()
+        planner.execute()
+        calls = self.server.calls
+        # The fused query is a merged sample shared with OddsOracle.pql
+        self.assertEqual(odds_oracle.pql(fused[0]).values['S0'], equity.result())
+        # And the other way round
+        fractions = planner.count_in_range('75%', ['QQ'], '')
+        odds_oracle.pql(planner.fused_pqls()[0])
+        planner.execute()
+        self.assertEqual(fractions.result(), [0.1])
+        self.assertEqual(self.server.calls, calls + 1)
+        self.assertEqual(odds_oracle.stats()['by_kind']['pql']['misses'], 2)
+
+    def test_calc_prefetch(self):
+        server = MulticallServer(pql_result=_aliases_answer).start()
+        odds_oracle = OddsOracle(port=server.port, trials=100, seconds=1, connect=False, cache=MemoryCache())
+        odds_oracle.get_client()
+        calc = Calc(odds_oracle)
+        distributions = [('75%', ['KK'], 'Ks7d2c', ['AA']), ('75%', ['QQ'], 'Ks7d2c', ['AA'])]
+        calc.prefetch(equities=[(['AA', 'KK'], 'Ks7d2c'), (['AA', 'QQ'],)], distributions=distributions)
+        self.assertEqual(server.multicalls, 1)
+        calls = server.calls
+        for main_range, sub_ranges, board, players in distributions:
+            self.assertEqual(calc.range_distribution(main_range, sub_ranges, board, players=players)[0].fraction, 0.1)
+        self.assertEqual(calc.equity(['AA', 'KK'], 'Ks7d2c'), [0.5, 0.5])
+        self.assertEqual(calc.equity(['AA', 'QQ']), [0.5, 0.5])
+        server.stop()
+        self.assertEqual(server.calls, calls)
+
+    def test_calc_prefetch_merged_samples(self):
+        server = MulticallServer(pql_result=_aliases_answer, equity_result='AA = 50.00% (50)\nKK = 50.00% (50)\n')
+        server.start()
+        odds_oracle = OddsOracle(port=server.port, trials=100, seconds=1, connect=False, cache=MemoryCache(),
+                                 merge_samples=True)
+        odds_oracle.get_client()
+        calc = Calc(odds_oracle)
+        calc.prefetch(equities=[(['AA', 'KK'], 'Ks7d2c')], distributions=[('75%', ['KK'], 'Ks7d2c', ['AA'])])
+        calls = server.calls
+        odds_oracle.reset_stats()
+        self.assertEqual(calc.range_distribution('75%', ['KK'], 'Ks7d2c', players=['AA'])[0].fraction, 0.1)
+        self.assertEqual(calc.equity(['AA', 'KK'], 'Ks7d2c'), [0.5, 0.5])
+        server.stop()
+        self.assertEqual(server.calls, calls)
+        by_kind = odds_oracle.stats()['by_kind']
+        self.assertEqual([by_kind[kind]['misses'] for kind in ('pql', 'equity')], [0, 0])
+        self.assertEqual([by_kind[kind]['hits'] for kind in ('pql', 'equity')], [2, 1])
+
+    def test_calc_prefetch_small_cache(self):
+        server = MulticallServer(pql_result=_aliases_answer).start()
+        odds_oracle = OddsOracle(port=server.port, trials=100, seconds=1, connect=False, cache=MemoryCache(maxsize=2))
+        odds_oracle.get_client()
+        calc = Calc(odds_oracle)
+        equities = [(['AA', hand], 'Ks7d2c') for hand in ('KK', 'QQ', 'JJ', 'TT')]
+        calc.prefetch(equities=equities)
+        self.assertGreaterEqual(odds_oracle.cache.maxsize, len(equities))
+        calls = server.calls
+        for players, board in equities:
+            calc.equity(players, board)
+        server.stop()
+        self.assertEqual(server.calls, calls)
+
+    def test_fewer_requests(self):
+        server = MulticallServer(pql_result=_aliases_answer).start()
+        odds_oracle = OddsOracle(port=server.port, trials=100, seconds=1, connect=False, cache=MemoryCache())
+        odds_oracle.get_client()
+        calls, pqls = server.calls, len(server.pqls)
+        distribution = Calc(odds_oracle).range_distribution('75%', ['KK', '*'], '7cKh4s', players=['AA'])
+        planner = Pql(odds_oracle).planner()
+        for sub_ranges in (['KK'], ['77', 'KK']):
+            planner.count_in_range('75%', sub_ranges, 'Ks7d2c', players=['AA'])
+        planner.hero_equity('AA', ['75%'], 'Ks7d2c')
+        planner.execute()
+        server.stop()
+        self.assertEqual(len(distribution), 2)
+        # The count query and two equity queries of range_distribution in one request, the fused query of the planner
+        self.assertEqual(len(server.pqls) - pqls, 3 + 1)
+        self.assertEqual(server.pqls[-1].count(' as S'), 3)
+        self.assertEqual(server.multicalls, 2)
+        self.assertEqual(server.calls - calls, 4)
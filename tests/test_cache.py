@@ -0,0 +1,250 @@
+import unittest
+import multiprocessing
+import os
+import sqlite3
+import pickle
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from ploev.cache import MemoryCache, MmapCache, SqliteCache, make_key
+from ploev.ppt import OddsOracle, PqlResult, PqlError
+from tests.xmlrpc_fixture import FixedAnswerServer
+
+
+class MakeKeyTest(unittest.TestCase):
+    def test_make_key(self):
+        self.assertEqual(make_key('pql', 'omahahi', 100), make_key('pql', 'omahahi', 100))
+        self.assertNotEqual(make_key('pql', 'omahahi', 100), make_key('pql', 'omahahi', 1000))
+        self.assertNotEqual(make_key('equity', ['AA', 'KK']), make_key('equity', ['KK', 'AA']))
+
+
+class MemoryCacheTest(unittest.TestCase):
+    def test_get_set(self):
+        cache = MemoryCache()
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', 'result')
+        self.assertEqual(cache.get('a'), 'result')
+        self.assertEqual(len(cache), 1)
+        cache.clear()
+        self.assertIsNone(cache.get('a'))
+
+    def test_lru_eviction(self):
+        cache = MemoryCache(maxsize=2)
+        cache.set('a', '1')
+        cache.set('b', '2')
+        cache.get('a')
+        cache.set('c', '3')
+        self.assertEqual(cache.get('a'), '1')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), '3')
+
+    def test_reserve(self):
+        cache = MemoryCache(maxsize=2)
+        cache.reserve(3)
+        for key in 'abc':
+            cache.set(key, key)
+        self.assertEqual([cache.get(key) for key in 'abc'], ['a', 'b', 'c'])
+        cache.reserve(1)
+        self.assertEqual(cache.maxsize, 3)
+
+
+class SqliteCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'cache.sqlite')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_get_set(self):
+        cache = SqliteCache(self.path)
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', 'result')
+        cache.set('a', 'new result')
+        self.assertEqual(cache.get('a'), 'new result')
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.size(), len('new result'))
+        cache.close()
+
+    def test_persistence(self):
+        cache = SqliteCache(self.path)
+        cache.set('a', 'result')
+        cache.close()
+        cache = SqliteCache(self.path)
+        self.assertEqual(cache.get('a'), 'result')
+        cache.close()
+
+    def test_size_eviction(self):
+        cache = SqliteCache(self.path, max_size=100)
+        for index in range(10):
+            cache.set(str(index), 'x' * 20)
+        self.assertLessEqual(cache.size(), 100)
+        self.assertEqual(cache.get('9'), 'x' * 20)
+        self.assertIsNone(cache.get('0'))
+        cache.close()
+
+    def _accessed(self, key):
+        connection = sqlite3.connect(self.path)
+        try:
+            return connection.execute("SELECT accessed FROM results WHERE key = ?", (key,)).fetchone()[0]
+        finally:
+            connection.close()
+
+    def _make_old(self, *keys):
+        connection = sqlite3.connect(self.path)
+        with connection:
+            connection.executemany("UPDATE results SET accessed = ? WHERE key = ?",
+                                   [(number, key) for number, key in enumerate(keys)])
+        connection.close()
+
+    def test_hits_are_written_later(self):
+        cache = SqliteCache(self.path, max_size=70)
+        cache.set('a', 'x' * 20)
+        cache.set('b', 'x' * 20)
+        self._make_old('a', 'b')
+        changes = cache._connection().total_changes
+        self.assertEqual(cache.get('a'), 'x' * 20)
+        self.assertEqual(cache._connection().total_changes, changes)
+        self.assertEqual(self._accessed('a'), 0)
+        # The next set writes access time of 'a', so 'b' is evicted
+        cache.set('c', 'x' * 20)
+        cache.set('d', 'x' * 20)
+        self.assertGreater(self._accessed('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 'x' * 20)
+        cache.close()
+
+    def test_touch_batch(self):
+        cache = SqliteCache(self.path)
+        cache._TOUCH_BATCH = 2
+        cache.set('a', 'result')
+        cache.set('b', 'result')
+        self._make_old('a', 'b')
+        cache.get('a')
+        self.assertEqual(self._accessed('a'), 0)
+        cache.get('b')
+        self.assertGreater(self._accessed('a'), 1)
+        self.assertGreater(self._accessed('b'), 1)
+        cache.set('c', 'result')
+        self._make_old('c')
+        cache.get('c')
+        cache.close()
+        self.assertGreater(self._accessed('c'), 1)
+
+
+def _set_in_worker(cache, number):
+    cache.set(make_key('worker', number), 'result {}'.format(number))
+    return cache.get(make_key('worker', 0)) is not None or number == 0
+
+
+class MmapCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'cache.mmap')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_get_set(self):
+        cache = MmapCache(self.path, slots=64, slot_size=256)
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', 'result')
+        cache.set('a', 'new result')
+        self.assertEqual(cache.get('a'), 'new result')
+        self.assertEqual(len(cache), 1)
+        cache.set('b', 'x' * 1000)
+        self.assertIsNone(cache.get('b'))
+        cache.clear()
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 0)
+        cache.close()
+
+    def test_shared_by_instances(self):
+        cache = MmapCache(self.path, slots=64, slot_size=256)
+        other = MmapCache(self.path, slots=8, slot_size=128)
+        self.assertEqual((other.slots, other.slot_size), (64, 256))
+        cache.set('a', 'result')
+        self.assertEqual(other.get('a'), 'result')
+        other.set('b', 'other result')
+        self.assertEqual(cache.get('b'), 'other result')
+        cache.close()
+        other.close()
+
+    def test_clock_eviction(self):
+        cache = MmapCache(self.path, slots=4, slot_size=128, ways=4)
+        for key in 'abcd':
+            cache.set(key, key)
+        cache.set('e', 'e')
+        self.assertEqual(len(cache), 4)
+        self.assertEqual(sum(cache.get(key) is not None for key in 'abcde'), 4)
+        self.assertEqual(cache.get('e'), 'e')
+        cache.close()
+
+    def test_torn_slot_is_miss(self):
+        cache = MmapCache(self.path, slots=8, slot_size=128, ways=8)
+        cache.set('a', 'result')
+        offset = cache._mmap.find(b'result')
+        cache._mmap[offset] = ord('R')
+        self.assertIsNone(cache.get('a'))
+        cache.close()
+
+    def test_worker_processes(self):
+        cache = MmapCache(self.path, slots=64, slot_size=256)
+        cache.set(make_key('worker', 0), 'result 0')
+        self.assertEqual(pickle.loads(pickle.dumps(cache)).get(make_key('worker', 0)), 'result 0')
+        with multiprocessing.get_context('spawn').Pool(2) as pool:
+            self.assertTrue(all(pool.starmap(_set_in_worker, [(cache, number) for number in range(1, 5)])))
+        self.assertEqual([cache.get(make_key('worker', number)) for number in range(5)],
+                         ['result {}'.format(number) for number in range(5)])
+        cache.close()
+
+
+class OddsOracleCacheTest(unittest.TestCase):
+    def test_pql_hit_without_server(self):
+        oo = OddsOracle(trials=1000, seconds=1, connect=False)
+        pql = "select avg(riverEquity(hero)) as EQ from game='omahahi', syntax='generic', hero='AA', player_1='KK'"
+        oo.cache.set(oo._pql_key(pql), 'EQ = 0.8\n1000 trials\n')
+        result = oo.pql(pql)
+        self.assertEqual(result.results_dict['EQ'][PqlResult.PERCENTAGE], 0.8)
+
+    def test_key_depends_on_trials(self):
+        oo = OddsOracle(trials=1000, seconds=1, connect=False)
+        key = oo._equity_key(('AA', 'KK'), '', '')
+        oo.trials = 2000
+        self.assertNotEqual(oo._equity_key(('AA', 'KK'), '', ''), key)
+
+    def test_equity_hit_without_server(self):
+        oo = OddsOracle(trials=1000, seconds=1, connect=False)
+        hands = ('AA', 'KK')
+        oo.cache.set(oo._equity_key(hands, '', ''), 'AA = 81.50% (815)\nKK = 18.50% (185)\n')
+        self.assertEqual(oo.equity(hands), [0.815, 0.185])
+
+
+class SingleFlightTest(unittest.TestCase):
+    def setUp(self):
+        self.server = FixedAnswerServer(delay=0.2).start()
+        self.oo = OddsOracle(port=self.server.port, trials=100, seconds=1, connect=False, cache=MemoryCache())
+        self.oo.get_client()
+        self.calls = self.server.calls
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_identical_queries_share_one_request(self):
+        with ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(lambda _: self.oo.equity(('AA', 'KK'), 'Ks7d2c'), range(8)))
+        self.assertEqual(results, [[0.5, 0.5]] * 8)
+        self.assertEqual(self.server.calls - self.calls, 1)
+        equity = self.oo.stats()['by_kind']['equity']
+        self.assertEqual((equity['misses'], equity['hits'], equity['shared']), (1, 7, 7))
+        self.assertEqual(self.oo._flights, {})
+
+    def test_exception_is_shared(self):
+        self.server.pql_result = 'ERROR: la-la'
+        with ThreadPoolExecutor(4) as executor:
+            futures = [executor.submit(self.oo.pql, 'la-la') for _ in range(4)]
+        for future in futures:
+            self.assertIsInstance(future.exception(), PqlError)
+        self.assertEqual(self.server.calls - self.calls, 1)
+        self.assertEqual(self.oo.stats()['by_kind']['pql']['errors'], 4)
+        self.assertEqual(self.oo._flights, {})
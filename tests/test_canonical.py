@@ -0,0 +1,76 @@
+import unittest
+import itertools
+
+from ploev.canonical import canonical_equity_query, canonical_pql
+from ploev.ppt import OddsOracle, PqlResult
+
+
+class CanonicalEquityQueryTest(unittest.TestCase):
+    def test_isomorphic_queries(self):
+        self.assertEqual(canonical_equity_query(('AsKs', 'xx'), 'Ac7s2h', 'Qd'),
+                         canonical_equity_query(('AhKh', 'xx'), 'As7h2d', 'Qc'))
+        self.assertEqual(canonical_equity_query(('AA', 'KK'), '7h 2d As', ''),
+                         canonical_equity_query(('AA', 'KK'), 'Ac7s2h', ''))
+
+    def test_not_isomorphic_queries(self):
+        self.assertNotEqual(canonical_equity_query(('AsKs', 'xx'), 'Ac7s2h', ''),
+                            canonical_equity_query(('AsKs', 'xx'), 'Ac7h2s', ''))
+
+    def test_turn_and_river_keep_places(self):
+        hands, board, dead = canonical_equity_query(('AA', 'KK'), 'Ks7d2cAh5h', '')
+        self.assertEqual(board[6::2], 'A5')
+        self.assertEqual(board[7], board[9])
+
+    def test_macros_are_not_permuted(self):
+        hands, board, dead = canonical_equity_query(('$ds', 'AsKs'), 'Ah7h2h', '')
+        self.assertEqual(hands[0], '$ds')
+
+    def test_not_permutable(self):
+        query = (('AA', 'random'), 'Ac7s2h', '')
+        self.assertEqual(canonical_equity_query(*query), query)
+        query = (('AA', 'KK'), 'Ac7s2', '')
+        self.assertEqual(canonical_equity_query(*query), query)
+
+    def test_flops(self):
+        cards = [rank + suit for rank in 'AKQJT98765432' for suit in 'shdc']
+        flops = {canonical_equity_query(('AA', 'KK'), ''.join(flop), '')[1]
+                 for flop in itertools.combinations(cards, 3)}
+        self.assertEqual(len(flops), 1755)
+
+
+class CanonicalPqlTest(unittest.TestCase):
+    PQL = """select avg(riverEquity(hero)) as EQ,
+        count(inRange(player_1, '{sub_range}'))
+    from game='omahahi', syntax='generic',
+        board='{board}',
+        hero='{hero}',
+        player_1='60%!$3b10i'"""
+
+    def test_isomorphic_queries(self):
+        pql1 = self.PQL.format(board='Ac 7s 2h', hero='AsKs', sub_range='hh')
+        pql2 = self.PQL.format(board='Ah 7c 2s', hero='AcKc', sub_range='ss')
+        self.assertEqual(canonical_pql(pql1), canonical_pql(pql2))
+        self.assertIn("player_1='60%!$3b10i'", canonical_pql(pql1))
+
+    def test_not_permutable(self):
+        pql = self.PQL.format(board='Ac7s2h', hero='AsKs', sub_range='ss').replace('generic', 'cactus')
+        self.assertEqual(canonical_pql(pql), pql)
+        pql = "select count(riverCard = As) from game='omahahi', syntax='generic', board='Ac7s2h', hero='AA'"
+        self.assertEqual(canonical_pql(pql), pql)
+        pql = "select avg(riverEquity(hero)) from game='omahahi', syntax='generic', other='As', hero='AA'"
+        self.assertEqual(canonical_pql(pql), pql)
+
+
+class OddsOracleCanonicalizationTest(unittest.TestCase):
+    def test_isomorphic_queries_share_cache(self):
+        oo = OddsOracle(trials=1000, seconds=1, connect=False)
+        hands, board, dead = canonical_equity_query(('AsKs', 'xx'), 'Ac7s2h', '')
+        oo.cache.set(oo._equity_key(hands, board, dead), 'AdKd = 60.00% (6)\nxx = 40.00% (4)\n')
+        self.assertEqual(oo.equity(('AhKh', 'xx'), 'As7h2d'), [0.6, 0.4])
+
+    def test_canonicalization_off(self):
+        oo = OddsOracle(trials=1000, seconds=1, connect=False, canonicalize=False)
+        pql = CanonicalPqlTest.PQL.format(board='Ac 7s 2h', hero='AsKs', sub_range='ss')
+        self.assertEqual(oo._canonical_pql(pql), pql)
+        oo.cache.set(oo._pql_key(pql), 'EQ = 0.7\n1000 trials\n')
+        self.assertEqual(oo.pql(pql).results_dict['EQ'][PqlResult.PERCENTAGE], 0.7)
@@ -1,5 +1,6 @@
 import unittest
-from ploev.cards import CardSet, Board, Deck, Card, card_from_str, card_to_str
+from ploev.cards import CardSet, Board, Deck, Card, card_from_str, card_to_str, card_to_int, card_from_int, \
+    cards_to_ints
 
 
 class CardTest(unittest.TestCase):
@@ -17,6 +18,15 @@ class CardTest(unittest.TestCase):
         self.assertEqual(card_to_str(Card(0, 0)), '*')
 
 
+    def test_card_to_int(self):
+        self.assertEqual(card_to_int(Card(2, 1)), 0)
+        self.assertEqual(card_to_int(Card(14, 4)), 51)
+        self.assertEqual(card_from_int(card_to_int(Card(10, 3))), Card(10, 3))
+        self.assertEqual(cards_to_ints('Ks 2h'), [44, 1])
+        with self.assertRaises(ValueError):
+            card_to_int(Card(14, 0))
+
+
 class DeckTest(unittest.TestCase):
 
     def test_cards(self):
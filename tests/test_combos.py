@@ -0,0 +1,61 @@
+import unittest
+
+from ploev.cards import cards_to_ints
+from ploev.combos import N_HOLDINGS, RangeSyntaxError, conflict_mask, holdings, range_mask, subset_keys
+
+
+class HoldingsTest(unittest.TestCase):
+    def test_holdings(self):
+        self.assertEqual(holdings().shape, (N_HOLDINGS, 4))
+        self.assertTrue((holdings()[:, :-1] < holdings()[:, 1:]).all())
+
+    def test_conflict_mask(self):
+        self.assertEqual(conflict_mask(cards_to_ints('As')).sum(), 20825)
+        self.assertEqual(conflict_mask([]).sum(), 0)
+
+    def test_subset_keys(self):
+        self.assertEqual(subset_keys(2).shape, (N_HOLDINGS, 6))
+        self.assertEqual(len(set(subset_keys(4)[:, 0].tolist())), N_HOLDINGS)
+        # all pairs of cards
+        self.assertEqual(len(set(subset_keys(2).ravel().tolist())), 1326)
+        self.assertTrue((subset_keys(1) == holdings()).all())
+
+
+class RangeMaskTest(unittest.TestCase):
+    def assertCount(self, range_, count):
+        self.assertEqual(range_mask(range_).sum(), count, range_)
+
+    def test_hands(self):
+        self.assertCount('*', N_HOLDINGS)
+        # at least two aces
+        self.assertCount('AA', 6 * 1128 + 4 * 48 + 1)
+        self.assertCount('AsKs', 1225)
+        self.assertCount('KQJT', 256)
+        # the queen of spades and another spade
+        self.assertCount('Qss', 20825 - 9139)
+        self.assertCount('A*', 76145)
+        self.assertEqual((range_mask('Qs Ts Jd 2d, A A') != range_mask('QsTsJd2d,AA')).sum(), 0)
+
+    def test_suit_variables(self):
+        self.assertCount('AxKx', 4 * 1225 - 6)
+        self.assertCount('xxxx', 4 * 715)
+        self.assertEqual((range_mask('xxyy') != range_mask('$ds')).sum(), 0)
+
+    def test_operators(self):
+        self.assertCount('AA,KK', 2 * 6961 - 36)
+        self.assertCount('AA!AAA', 6961 - 193)
+        self.assertCount('*!KK', N_HOLDINGS - 6961)
+        self.assertCount('(77,KK):(ss)', (range_mask('77,KK') & range_mask('ss')).sum())
+        self.assertCount('AA:KK!QQ', (range_mask('AA') & range_mask('KK') & ~range_mask('QQ')).sum())
+        self.assertCount('!AA', N_HOLDINGS - 6961)
+
+    def test_percent_and_macros(self):
+        self.assertCount('10%', round(N_HOLDINGS * 0.1))
+        self.assertTrue(range_mask('10%')[range_mask('AAKK')].all())
+        self.assertCount('$r', 13 ** 4)
+        self.assertCount('$ds', 6 * 78 * 78)
+
+    def test_errors(self):
+        for range_ in ['', 'AAAAA', 'AA,', '(AA', 'AA)', '$foo', 'ZZ']:
+            with self.assertRaises(RangeSyntaxError):
+                range_mask(range_)
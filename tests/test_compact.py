@@ -0,0 +1,66 @@
+import unittest
+
+import numpy as np
+
+from ploev.combos import range_mask
+from ploev.compact import compact_pql, compact_range
+from ploev.easy_range import BoardExplorer
+from ploev.ppt import OddsOracle
+
+
+class CompactRangeTest(unittest.TestCase):
+    def assertCompact(self, range_, expected):
+        compact = compact_range(range_)
+        self.assertEqual(compact, expected)
+        self.assertTrue(np.array_equal(range_mask(range_), range_mask(compact)))
+
+    def test_parentheses(self):
+        self.assertCompact('((KK))', 'KK')
+        self.assertCompact('((AA,(KK)),(QQ,JJ)):TT', '(AA,KK,QQ,JJ):TT')
+        self.assertCompact('(AA:(KK:QQ)):JJ', 'AA:KK:QQ:JJ')
+        self.assertCompact('(AA,KK)!(QQ)', '(AA,KK)!QQ')
+        self.assertCompact('!(KK,QQ):(AA!(KK))', '!(KK,QQ):(AA!KK)')
+
+    def test_lists_in_other_lists_are_kept(self):
+        self.assertEqual(compact_range('AA:(KK,QQ)'), 'AA:(KK,QQ)')
+        self.assertEqual(compact_range('(AA,KK)!QQ'), '(AA,KK)!QQ')
+        self.assertEqual(compact_range('(AA:KK),QQ'), '(AA:KK),QQ')
+
+    def test_contained_hands(self):
+        self.assertCompact('KK,77,66,K7,K6,76,AA,K', '77,66,76,AA,K')
+        self.assertCompact('54,T84,85,58,T8', '54,85,T8')
+        self.assertCompact('K:KK:*', 'KK')
+        self.assertCompact('(AA!KK),*,QQ', '*')
+        self.assertCompact('AA:KK:AA', 'AA:KK')
+
+    def test_suits(self):
+        self.assertCompact('Kss,Khh,Kdd,Kcc,QQ', 'Kxx,QQ')
+        self.assertCompact('AsKs,AhKh,AdKd', 'AsKs,AhKh,AdKd')
+        self.assertEqual(compact_range('Ksxx,Khxx,Kdxx,Kcxx'), 'Ksxx,Khxx,Kdxx,Kcxx')
+
+    def test_unchanged(self):
+        for range_ in ('AA-KK', 'AA,', '', 'AA+', '[A-K]Q'):
+            self.assertEqual(compact_range(range_), range_)
+
+    def test_board_explorer_ranges(self):
+        board_explorer = BoardExplorer.from_str('Ks7d6c')
+        ranges = [board_explorer.ppt(easy_range) for easy_range in ('TP+', '2P+', 'OESD')]
+        player = ':'.join('({})'.format(range_) for range_ in ranges)
+        compact = compact_range(player)
+        self.assertLess(len(compact), len(player))
+        self.assertTrue(np.array_equal(range_mask(player), range_mask(compact)))
+
+
+class CompactPqlTest(unittest.TestCase):
+    def test_compact_pql(self):
+        pql = ("select count(inRange(player_1,'((KK))')) as S0 \n"
+               "from game='omahahi', syntax='generic',\n\tboard='Ks7d2c',\n\tplayer_1='((AA,KK,K))'")
+        self.assertEqual(compact_pql(pql), ("select count(inRange(player_1,'KK')) as S0 \n"
+                                            "from game='omahahi', syntax='generic',\n"
+                                            "\tboard='Ks7d2c',\n\tplayer_1='AA,K'"))
+
+    def test_odds_oracle_compacts_queries(self):
+        oo = OddsOracle(trials=1000, seconds=1, connect=False)
+        self.assertEqual(oo._canonical_equity(('((AA))', 'KK,K'), '', ''), (('AA', 'K'), '', ''))
+        oo.compact = False
+        self.assertEqual(oo._canonical_equity(('((AA))', 'KK,K'), '', ''), (('((AA))', 'KK,K'), '', ''))
@@ -0,0 +1,104 @@
+import itertools
+import random
+import unittest
+
+import numpy as np
+
+from ploev.cards import Board, cards_to_ints
+from ploev.combos import holdings, range_mask
+from ploev.eval import (N_VALUES, FLUSH, FULL_HOUSE, HIGH_CARD, PAIR, QUADS, STRAIGHT, STRAIGHT_FLUSH, TRIPS,
+                        TWO_PAIR, board_ranks, category, omaha_rank, omaha_rank_array, omaha_ranks, rank5, rank5_array)
+
+
+class Rank5Test(unittest.TestCase):
+    def test_order(self):
+        hands = ['AsKsQsJsTs', '5s4s3s2sAs', '2s2h2d2c3s', 'KsKhKd2s2h', 'As9s7s5s3s', 'AsKhQdJsTh', '5s4h3d2cAs',
+                 'AsAhAdKsQh', 'AsAhKdKsQh', 'AsAhKdQsJh', 'AsKhQdJs9h']
+        values = [rank5(cards_to_ints(hand)) for hand in hands]
+        self.assertEqual(values, sorted(values, reverse=True))
+        self.assertEqual(len(set(values)), len(values))
+        self.assertEqual(rank5(cards_to_ints('AsKhQdJs9h')), rank5(cards_to_ints('AhKsQcJh9s')))
+
+    def test_bounds_and_categories(self):
+        self.assertEqual(rank5(cards_to_ints('AsKsQsJsTs')), N_VALUES - 1)
+        self.assertEqual(rank5(cards_to_ints('7s5h4d3c2s')), 0)
+        hands = {'AsKsQsJsTs': STRAIGHT_FLUSH, '2s2h2d2c3s': QUADS, 'KsKhKd2s2h': FULL_HOUSE, 'As9s7s5s3s': FLUSH,
+                 '5s4h3d2cAs': STRAIGHT, 'AsAhAdKsQh': TRIPS, 'AsAhKdKsQh': TWO_PAIR, 'AsAhKdQsJh': PAIR,
+                 'AsKhQdJs9h': HIGH_CARD}
+        for hand, expected in hands.items():
+            self.assertEqual(category(rank5(cards_to_ints(hand))), expected)
+
+    def test_all_values(self):
+        values = {rank5(hand) for hand in itertools.combinations(range(0, 52, 3), 5)}
+        self.assertLessEqual(max(values), N_VALUES - 1)
+        self.assertGreaterEqual(min(values), 0)
+
+    def test_array(self):
+        rng = random.Random(1)
+        hands = np.array([rng.sample(range(52), 5) for _ in range(2000)], dtype=np.uint8)
+        self.assertEqual(rank5_array(hands).tolist(), [rank5(hand) for hand in hands.tolist()])
+        self.assertEqual(rank5_array(hands.reshape(20, 100, 5)).shape, (20, 100))
+
+
+class OmahaRankTest(unittest.TestCase):
+    def test_exactly_two_hole_cards(self):
+        # Four spades in hole and one on board isn't a flush
+        self.assertEqual(category(omaha_rank(cards_to_ints('AsKsQsJs'), cards_to_ints('2s7h8dTc3h'))), HIGH_CARD)
+        # Board straight needs two hole cards
+        self.assertEqual(category(omaha_rank(cards_to_ints('2c2d7h8h'), cards_to_ints('AsKhQdJcTs'))), PAIR)
+        self.assertEqual(category(omaha_rank(cards_to_ints('KhJh2c2d'), cards_to_ints('QhTh9h'))), STRAIGHT_FLUSH)
+
+    def test_best_of_combinations(self):
+        rng = random.Random(2)
+        for _ in range(100):
+            cards = rng.sample(range(52), 9)
+            hole, board = cards[:4], cards[4:4 + rng.choice((3, 4, 5))]
+            expected = max(rank5(list(pair) + list(triple)) for pair in itertools.combinations(hole, 2)
+                           for triple in itertools.combinations(board, 3))
+            self.assertEqual(omaha_rank(hole, board), expected)
+
+    def test_all_holdings(self):
+        board = cards_to_ints('Ks7d2cTs5h')
+        values = omaha_ranks(holdings(), board)
+        self.assertEqual(values.shape, (len(holdings()), ))
+        rng = np.random.default_rng(3)
+        for index in rng.integers(0, len(holdings()), 300):
+            hole = holdings()[index].tolist()
+            if not set(hole) & set(board):
+                self.assertEqual(values[index], omaha_rank(hole, board))
+
+    def test_own_boards(self):
+        rng = np.random.default_rng(4)
+        cards = np.argsort(rng.random((500, 52)), axis=1)[:, :9]
+        values = omaha_rank_array(cards[:, :4], cards[:, 4:])
+        self.assertEqual(values.shape, (500, ))
+        for hole, board, value in zip(cards[:, :4].tolist(), cards[:, 4:].tolist(), values):
+            self.assertEqual(value, omaha_rank(hole, board))
+        self.assertEqual(omaha_rank_array(np.zeros((0, 4), dtype=int), np.zeros((0, 5), dtype=int)).shape, (0, ))
+
+
+class BoardRanksTest(unittest.TestCase):
+    def test_board_ranks(self):
+        values = board_ranks('Ks7d2cTs5h')
+        self.assertIs(values, board_ranks(Board.from_str('5hTsKs2c7d')))
+        self.assertIs(values, board_ranks(cards_to_ints('Ks7d2cTs5h')))
+        self.assertFalse(values.flags.writeable)
+        self.assertEqual(len(values), len(holdings()))
+        # Holdings with board cards
+        self.assertEqual((values == -1).sum(), len(holdings()) - 47 * 46 * 45 * 44 // 24)
+        self.assertTrue((values[range_mask('Ks')] == -1).all())
+        sets = values[range_mask('KK!Ks') & (values >= 0)]
+        self.assertTrue(all(category(value) == TRIPS for value in sets))
+        self.assertEqual(values[range_mask('8s9s6d6c')].max(),
+                         omaha_rank(cards_to_ints('8s9s6d6c'), cards_to_ints('5hTsKs2c7d')))
+
+    def test_turn(self):
+        values = board_ranks('Ks7d6cTs')
+        hole = holdings()[range_mask('Ah9h8h3c')][0].tolist()
+        self.assertEqual(values[range_mask('Ah9h8h3c')][0], omaha_rank(hole, cards_to_ints('Ks7d6cTs')))
+        self.assertEqual(category(values[range_mask('Ah9h8h3c')][0]), STRAIGHT)
+
+    def test_wrong_board(self):
+        for board in ('Ks7d', 'Ks7dKs'):
+            with self.assertRaises(ValueError):
+                board_ranks(board)
@@ -0,0 +1,99 @@
+import itertools
+import unittest
+
+import numpy as np
+
+from ploev import exact
+from ploev.calc import Calc
+from ploev.cards import cards_to_ints
+from ploev.combos import conflict_mask, holdings, range_mask
+from ploev.eval import omaha_rank
+from ploev.ppt import EquityEstimate
+from tests.xmlrpc_fixture import FakeOddsOracle
+
+
+def _brute_force(hero, villain, board, dead=''):
+    """ Outcomes counted by iterating over all deals """
+    board = cards_to_ints(board)
+    dead = cards_to_ints(dead)
+    alive = ~conflict_mask(board + dead)
+    heroes = holdings()[range_mask(hero) & alive].tolist()
+    villains = holdings()[range_mask(villain) & alive].tolist()
+    rivers = [[]] if len(board) == 5 else [[card] for card in range(52) if card not in board + dead]
+    wins = ties = total = 0
+    for river, hero_cards, villain_cards in itertools.product(rivers, heroes, villains):
+        if set(hero_cards) & set(villain_cards) or set(river) & set(hero_cards + villain_cards):
+            continue
+        hero_value = omaha_rank(hero_cards, board + river)
+        villain_value = omaha_rank(villain_cards, board + river)
+        total += 1
+        wins += hero_value > villain_value
+        ties += hero_value == villain_value
+    return exact.Outcomes(wins, ties, total)
+
+
+class OutcomesTest(unittest.TestCase):
+    def test_river(self):
+        self.assertEqual(exact.outcomes('AsKhQQ', ['JJT'], 'Ks7d2cTs5h'), _brute_force('AsKhQQ', 'JJT', 'Ks7d2cTs5h'))
+        self.assertEqual(exact.outcomes('Ks7dA5', ['TsJJ'], '9s8s2c3d4h'), _brute_force('Ks7dA5', 'TsJJ', '9s8s2c3d4h'))
+
+    def test_turn(self):
+        self.assertEqual(exact.outcomes('AsAhQh8d', ['JdJcQ,QdQc7'], 'Ks7d2cTs'),
+                         _brute_force('AsAhQh8d', 'JdJcQ,QdQc7', 'Ks7d2cTs'))
+        self.assertEqual(exact.outcomes('KhKdQhQd', ['7d7sJ'], 'Kc7h2cTs', '3d'),
+                         _brute_force('KhKdQhQd', '7d7sJ', 'Kc7h2cTs', '3d'))
+
+    def test_shared_holdings(self):
+        # Both ranges contain the same holdings
+        self.assertEqual(exact.outcomes('AsAhKK', ['AAKK'], '9s8s2c3d4h'), _brute_force('AsAhKK', 'AAKK', '9s8s2c3d4h'))
+
+    def test_equity(self):
+        self.assertEqual(exact.hero_equity('AsAh', ['AdAc'], 'Ks7d2cTs5h'), 0.5)
+        equities = exact.equity(['AsAhQh8d', 'JJ'], 'Ks7d2cTs')
+        self.assertAlmostEqual(sum(equities), 1)
+        self.assertEqual(equities[0], exact.outcomes('AsAhQh8d', ['JJ'], 'Ks7d2cTs').equity)
+
+    def test_shards(self):
+        heroes, villains, board, runouts = exact.deals('AsAhQh8d', ['JdJcQ,QdQc7'], 'Ks7d2cTs')
+        self.assertEqual(len(runouts), 48)
+        parts = [exact.runout_outcomes(block, villains, board, runout)
+                 for runout in runouts for block in np.array_split(heroes, 3)]
+        self.assertEqual(exact.merge_outcomes(parts), exact.outcomes('AsAhQh8d', ['JdJcQ,QdQc7'], 'Ks7d2cTs'))
+        with self.assertRaises(exact.ExactEquityError):
+            exact.merge_outcomes([exact.Outcomes(0, 0, 0)])
+
+    def test_not_enumerated(self):
+        for args in ((['AA', 'KK', 'QQ'], 'Ks7d2cTs'),
+                     (['AA', 'KK'], 'Ks7d2c'),
+                     (['AA', 'KK'], ''),
+                     (['AA', '30%'], 'Ks7d2cTs'),
+                     (['AA', 'TP'], 'Ks7d2cTs'),
+                     (['KsKh', 'AA'], 'Ks7d2cTs'),
+                     (['AA', 'KK'], 'Ks7d2cTs', 'Ks')):
+            with self.assertRaises(exact.ExactEquityError):
+                exact.equity(*args)
+
+
+class ExactCalcTest(unittest.TestCase):
+    def test_exact(self):
+        oo = FakeOddsOracle()
+        calc = Calc(oo, exact=True)
+        hero = exact.hero_equity('AsAhQh8d', ['JJ'], 'Ks7d2cTs')
+        # Rounded as equities of OddsOracle
+        self.assertEqual(calc.equity(['AsAhQh8d', 'JJ'], 'Ks7d2cTs'), [round(hero, 3), round(1 - hero, 3)])
+        self.assertEqual(calc.equity(['AsAhQh8d', 'JJ'], 'Ks7d2cTs', hero_only=True), round(hero, 3))
+        total = exact.outcomes('AsAhQh8d', ['JJ'], 'Ks7d2cTs').total
+        self.assertEqual(calc.equity(['AsAhQh8d', 'JJ'], 'Ks7d2cTs', hero_only=True, tolerance=0.01),
+                         EquityEstimate(hero, 0.0, total))
+        self.assertEqual(oo.pqls, [])
+
+    def test_fallback(self):
+        oo = FakeOddsOracle()
+        self.assertEqual(Calc(oo, exact=True).equity(['AsAhQh8d', 'JJ'], 'Ks7d2c', hero_only=True), 0.25)
+        self.assertEqual(len(oo.pqls), 1)
+        Calc(oo).equity(['AsAhQh8d', 'JJ'], 'Ks7d2cTs', hero_only=True)
+        self.assertEqual(len(oo.pqls), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,8 @@
 import unittest
 
+from ploev.cache import MemoryCache
 from ploev.game import *
+from tests.xmlrpc_fixture import MulticallServer
 
 odds_oracle = OddsOracle(trials=10000, seconds=1)
 
@@ -1187,6 +1189,30 @@ class GameTreeTest(unittest.TestCase):
         self.assertAlmostEqual(villain_fold.had_equity, 0.5, delta=0.03)
         self.assertAlmostEqual(hero_bet_call.hero_equity, 0.27, delta=0.03)
 
+    def test_calculate_sends_queries_together(self):
+        def answer(pql):
+            return ''.join('S{} = 10.0000% (10)\n'.format(number) for number in range(pql.count(' as S'))) + \
+                '100 trials\n'
+
+        server = MulticallServer(pql_result=answer).start()
+        fixed_oracle = OddsOracle(port=server.port, trials=100, seconds=1, connect=False, cache=MemoryCache())
+        fixed_oracle.get_client()
+        hero = Player(Position.BTN, 100, is_hero=True, name='Hero', ranges=PptRange('9s8c6s5d'))
+        villain = Player(Position.BB, 100, name='Villain', ranges=PptRange('AA,KK'))
+        game = Game([hero, villain], 20, board='Td9h2d')
+        game.make_action(Action(Action.CHECK))
+        root = GameNode(game)
+        game_tree = GameTree(root, fixed_oracle)
+        hero_bet = root.add_line(Action(Action.BET, size=20))
+        root.add_line(Action(Action.CHECK))
+        hero_bet.add_line(Action(Action.CALL), PptRange('AA'))
+        hero_bet.add_line(Action(Action.FOLD), PptRange('KK'))
+        game_tree.calculate()
+        server.stop()
+        # The connection check and one batch of all queries of the tree
+        self.assertEqual(server.multicalls, 1)
+        self.assertEqual(fixed_oracle.transport_stats.snapshot()['requests'], 2)
+
     def test_line_with_zero_frequency(self):
         hero = Player(Position.BTN, stack=10, is_hero=True, name='hero', ranges=PptRange('Ah 6h 5c 8c'))
         villain = Player(Position.UTG, stack=10, is_hero=True, name='villain')
@@ -0,0 +1,53 @@
+import unittest
+
+from ploev.calc import Calc
+from ploev.ppt import Pql, PqlResult
+from tests.xmlrpc_fixture import FakeOddsOracle
+
+
+def _fake_odds_oracle(histogram):
+    """ Answers with fixed histogram """
+    total = sum(histogram.values())
+    elements = ['[{}:{:.4f}% ({})]'.format(element, counts / total * 100, counts)
+                for element, counts in histogram.items()]
+    return FakeOddsOracle('HIST = {}\n{} trials\n'.format(','.join(elements), total))
+
+
+class EquityHistogramTest(unittest.TestCase):
+    def test_percent_buckets(self):
+        oo = _fake_odds_oracle({'0': 10, '9': 10, '10': 20, '55': 40, '99': 20})
+        pql = Pql(oo)
+        self.assertEqual(pql.equity_histogram('AsKsQhJh', ['AA'], 'Ks7d2c'),
+                         [0.2, 0.2, 0.0, 0.0, 0.0, 0.4, 0.0, 0.0, 0.0, 0.2])
+        self.assertEqual(pql.equity_histogram('AsKsQhJh', ['AA'], 'Ks7d2c', buckets=2), [0.4, 0.6])
+        self.assertEqual(len(oo.pqls), 1)
+        self.assertIn('histogram(hero, equity(hero, flop)) as HIST', oo.pqls[0])
+
+    def test_fraction_buckets(self):
+        oo = _fake_odds_oracle({'0': 25, '1/4': 25, '1/2': 25, '1': 25})
+        self.assertEqual(Pql(oo).equity_histogram('AsKsQhJh', ['AA'], 'Ks7d2c5h9s', buckets=4),
+                         [0.25, 0.25, 0.25, 0.25])
+        self.assertIn('histogram(hero, fractionalRiverEquity(hero))', oo.pqls[0])
+
+    def test_streets(self):
+        oo = _fake_odds_oracle({'50': 1})
+        pql = Pql(oo)
+        for board, street in (('', 'preflop'), ('Ks7d2c5h', 'turn')):
+            pql.equity_histogram('AA', ['KK'], board)
+            self.assertIn('equity(hero, {})'.format(street), oo.pqls[-1])
+
+    def test_wrong_board(self):
+        pql = Pql(_fake_odds_oracle({'50': 1}))
+        for board in ('Ks', 'Ks7d', 'Ks7d2c5h9s3h', 'Ks7'):
+            with self.assertRaises(ValueError):
+                pql.equity_histogram('AA', ['KK'], board)
+
+    def test_calc_equity_distribution(self):
+        oo = _fake_odds_oracle({'30': 3, '70': 1})
+        self.assertEqual(Calc(oo).equity_distribution(['AA', 'KK', 'QQ'], 'Ks7d2c', buckets=4),
+                         [0.0, 0.75, 0.25, 0.0])
+        self.assertIn("player_2='QQ'", oo.pqls[0])
+
+    def test_parsed_histogram(self):
+        result = PqlResult('HIST = [0:50.0000% (5)],[1/2:50.0000% (5)]\n10 trials\n')
+        self.assertEqual(Pql._equity_histogram_result(result, 2, fractions=True), [0.5, 0.5])
@@ -0,0 +1,50 @@
+import sys
+import time
+import unittest
+
+from ploev.launcher import ServerLauncher, is_ready, wait_ready
+from ploev.ppt import OddsOracle
+from tests.xmlrpc_fixture import closed_port
+
+_STAND_IN = '"{}" -m ploev.server --port {{port}}'.format(sys.executable)
+
+
+class WaitReadyTest(unittest.TestCase):
+    def test_timeout(self):
+        port = closed_port()
+        self.assertFalse(is_ready('localhost', port))
+        started = time.monotonic()
+        with self.assertRaises(TimeoutError):
+            wait_ready('localhost', port, timeout=0.3)
+        self.assertLess(time.monotonic() - started, 2)
+
+
+class ServerLauncherTest(unittest.TestCase):
+    def test_start(self):
+        port = closed_port()
+        with ServerLauncher(command=_STAND_IN, timeout=30) as launcher:
+            process = launcher.start(port)
+            self.assertIsNone(process.poll())
+            self.assertTrue(is_ready('localhost', port))
+            oo = OddsOracle(port=port, trials=10, seconds=1, connect=False)
+            oo.get_client()
+        self.assertIsNotNone(process.poll())
+        self.assertEqual(launcher.processes, {})
+
+    def test_start_many(self):
+        port = closed_port()
+        with ServerLauncher(command=_STAND_IN, timeout=30) as launcher:
+            processes = launcher.start_many(port, 2)
+            self.assertEqual(len(processes), 2)
+            self.assertTrue(all(is_ready('localhost', port_) for port_ in (port, port + 1)))
+
+    def test_exited_server(self):
+        launcher = ServerLauncher(command='"{}" -c "import sys; sys.exit(3)"'.format(sys.executable), timeout=30)
+        with self.assertRaises(ConnectionError):
+            launcher.start(closed_port())
+        self.assertEqual(launcher.processes, {})
+
+    def test_missing_command(self):
+        launcher = ServerLauncher(command='ploev-no-such-command {port}', timeout=1)
+        with self.assertRaises(OSError):
+            launcher.start(closed_port())
@@ -0,0 +1,91 @@
+import unittest
+
+import numpy as np
+
+from ploev import exact, montecarlo
+from ploev.calc import Calc
+from tests.xmlrpc_fixture import FakeOddsOracle
+
+
+class EquityTest(unittest.TestCase):
+    def test_exact_equity(self):
+        expected = exact.hero_equity('AsAhQh8d', ['JJ'], 'Ks7d2cTs')
+        estimate = montecarlo.hero_equity('AsAhQh8d', ['JJ'], 'Ks7d2cTs', trials=50000, seed=1)
+        self.assertEqual(estimate.trials, 50000)
+        self.assertAlmostEqual(estimate.equity, expected, delta=4 * estimate.stderr)
+        self.assertLess(estimate.stderr, 0.003)
+
+    def test_flop_and_preflop(self):
+        for players, board in ((['AA', 'KK'], ''), (['AsAhQh8d', 'JJ', '$ds'], 'Ks7d2c')):
+            estimates = montecarlo.equity(players, board, trials=20000, seed=2)
+            self.assertEqual(len(estimates), len(players))
+            self.assertAlmostEqual(sum(estimate.equity for estimate in estimates), 1)
+        aces, kings = montecarlo.equity(['AA', 'KK'], trials=20000, seed=2)
+        self.assertGreater(aces.equity, kings.equity)
+
+    def test_split_pot(self):
+        # Both players have the same straight
+        estimates = montecarlo.equity(['AhTd5c4c', 'AcTh5d4h'], 'KsQsJs2h3d', trials=1000, seed=3)
+        self.assertEqual([estimate.equity for estimate in estimates], [0.5, 0.5])
+        self.assertEqual(estimates[0].stderr, 0)
+
+    def test_seed(self):
+        first = montecarlo.equity(['AA', 'KK'], 'Ks7d2c', trials=5000, seed=4)
+        self.assertEqual(montecarlo.equity(['AA', 'KK'], 'Ks7d2c', trials=5000, seed=4), first)
+
+    def test_tolerance(self):
+        estimate = montecarlo.hero_equity('AA', ['KK'], 'Ks7d2c', trials=10 ** 6, tolerance=0.01,
+                                          batch_size=1000, seed=5)
+        self.assertLessEqual(estimate.stderr, 0.01)
+        self.assertLess(estimate.trials, 10 ** 6)
+
+    def test_shards(self):
+        deals = montecarlo.Deals.from_query(['AA', 'KK'], 'Ks7d2c')
+        first = deals.sums(3000, 1000, np.random.default_rng(1))
+        second = deals.sums(2000, 1000, np.random.default_rng(2))
+        sums = first + second
+        self.assertEqual(sums.trials, 5000)
+        self.assertEqual(sums.shares.tolist(), (first.shares + second.shares).tolist())
+        estimates = sums.estimates()
+        self.assertAlmostEqual(sum(estimate.equity for estimate in estimates), 1)
+        self.assertEqual(estimates[0].trials, 5000)
+
+    def test_not_sampled(self):
+        for args in ((['AA'], ''),
+                     (['AA', '30%'], 'Ks7d2c'),
+                     (['AA', 'TP'], 'Ks7d2c'),
+                     (['AA', 'KK'], 'Ks7d'),
+                     (['KsKh', 'AA'], 'Ks7d2c'),
+                     (['AsAhKsKh', 'AsAdKdKc'], ''),
+                     (['AA', 'KK'], 'Ks7d2c', 'Ks')):
+            with self.assertRaises(montecarlo.MonteCarloError):
+                montecarlo.equity(*args, trials=1000)
+
+
+class MonteCarloCalcTest(unittest.TestCase):
+    def test_monte_carlo(self):
+        oo = FakeOddsOracle(trials=20000, seconds=10)
+        calc = Calc(oo, monte_carlo=True)
+        equities = calc.equity(['AA', 'KK'], 'Ks7d2c')
+        self.assertEqual(len(equities), 2)
+        self.assertEqual(equities, [round(equity, 3) for equity in equities])
+        self.assertLess(equities[0], 0.5)
+        estimate = calc.equity(['AA', 'KK'], 'Ks7d2c', hero_only=True, tolerance=0.01)
+        self.assertLessEqual(estimate.stderr, 0.01)
+        self.assertLessEqual(estimate.trials, oo.trials)
+        self.assertEqual(oo.pqls, [])
+
+    def test_fallback(self):
+        oo = FakeOddsOracle(trials=20000, seconds=10)
+        self.assertEqual(Calc(oo, monte_carlo=True).equity(['AA', '30%'], 'Ks7d2c', hero_only=True), 0.25)
+        self.assertEqual(len(oo.pqls), 1)
+
+    def test_exact_first(self):
+        oo = FakeOddsOracle(trials=20000, seconds=10)
+        calc = Calc(oo, exact=True, monte_carlo=True)
+        self.assertEqual(calc.equity(['AsAhQh8d', 'JJ'], 'Ks7d2cTs', hero_only=True),
+                         round(exact.hero_equity('AsAhQh8d', ['JJ'], 'Ks7d2cTs'), 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import os
+import unittest
+
+import numpy as np
+
+from ploev import exact, montecarlo
+from ploev.calc import Calc
+from ploev.parallel import ShardedExecutor, _SharedArray, _attached, _detach, _view
+from tests.xmlrpc_fixture import FakeOddsOracle
+
+
+class ShardedExecutorTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.executor = ShardedExecutor(workers=2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.executor.shutdown()
+
+    def test_exact_outcomes(self):
+        for args in (('AsKhQQ', ['JJT'], 'Ks7d2cTs5h'),
+                     ('AsAhQh8d', ['JdJcQ,QdQc7'], 'Ks7d2cTs'),
+                     ('KhKdQhQd', ['7d7sJ'], 'Kc7h2cTs', '3d')):
+            self.assertEqual(self.executor.exact_outcomes(*args), exact.outcomes(*args))
+
+    def test_exact_not_enumerated(self):
+        for args in (('AA', ['KK'], 'Ks7d2c'), ('KsKh', ['AA'], 'Ks7d2cTs')):
+            with self.assertRaises(exact.ExactEquityError):
+                self.executor.exact_outcomes(*args)
+
+    def test_monte_carlo_equity(self):
+        expected = exact.hero_equity('AsAhQh8d', ['JJ'], 'Ks7d2cTs')
+        estimates = self.executor.monte_carlo_equity(['AsAhQh8d', 'JJ'], 'Ks7d2cTs', trials=30001, batch_size=5000,
+                                                     seed=1)
+        self.assertEqual([estimate.trials for estimate in estimates], [30001, 30001])
+        self.assertAlmostEqual(estimates[0].equity, expected, delta=4 * estimates[0].stderr)
+        self.assertAlmostEqual(sum(estimate.equity for estimate in estimates), 1)
+
+    def test_seed(self):
+        first = self.executor.monte_carlo_equity(['AA', 'KK'], 'Ks7d2c', trials=5000, seed=4)
+        self.assertEqual(self.executor.monte_carlo_equity(['AA', 'KK'], 'Ks7d2c', trials=5000, seed=4), first)
+        # Shards have different random streams
+        with ShardedExecutor(workers=1) as executor:
+            self.assertNotEqual(executor.monte_carlo_equity(['AA', 'KK'], 'Ks7d2c', trials=5000, seed=4), first)
+
+    def test_tolerance(self):
+        estimates = self.executor.monte_carlo_equity(['AA', 'KK'], 'Ks7d2c', trials=10 ** 6, tolerance=0.01,
+                                                     batch_size=1000, seed=5)
+        self.assertLessEqual(estimates[0].stderr, 0.01)
+        self.assertLess(estimates[0].trials, 10 ** 6)
+
+    def test_not_sampled(self):
+        for args in ((['AA'], ''), (['KsKh', 'AA'], 'Ks7d2c'), (['AsAhKsKh', 'AsAdKdKc'], '')):
+            with self.assertRaises(montecarlo.MonteCarloError):
+                self.executor.monte_carlo_equity(*args, trials=1000)
+
+    def test_shared_memory_released(self):
+        before = set(os.listdir('/dev/shm')) if os.path.isdir('/dev/shm') else set()
+        self.executor.monte_carlo_equity(['AA', 'KK'], 'Ks7d2c', trials=1000)
+        with self.assertRaises(montecarlo.MonteCarloError):
+            self.executor.monte_carlo_equity(['AsAhKsKh', 'AsAdKdKc'], '', trials=1000)
+        self.executor.exact_outcomes('AsKhQQ', ['JJT'], 'Ks7d2cTs5h')
+        after = set(os.listdir('/dev/shm')) if os.path.isdir('/dev/shm') else set()
+        self.assertEqual(after - before, set())
+
+
+class SharedArrayTest(unittest.TestCase):
+    def test_view(self):
+        array = _SharedArray(np.arange(10, dtype=np.int64))
+        name = array.descriptor[0]
+        try:
+            view = _view(array.descriptor)
+            self.assertEqual(view.tolist(), list(range(10)))
+            self.assertFalse(view.flags.writeable)
+            self.assertFalse(view.flags.owndata)
+            _detach([])
+            # Still viewed
+            self.assertIn(name, _attached)
+            part = view[3:]
+            del view
+            _detach([])
+            self.assertIn(name, _attached)
+            del part
+            _detach([array.descriptor])
+            self.assertIn(name, _attached)
+            _detach([])
+            self.assertNotIn(name, _attached)
+        finally:
+            array.release()
+
+
+class ParallelCalcTest(unittest.TestCase):
+    def test_workers(self):
+        oo = FakeOddsOracle(trials=20000, seconds=10)
+        with Calc(oo, exact=True, monte_carlo=True, workers=2) as calc:
+            self.assertEqual(calc.equity(['AsAhQh8d', 'JJ'], 'Ks7d2cTs', hero_only=True),
+                             round(exact.hero_equity('AsAhQh8d', ['JJ'], 'Ks7d2cTs'), 3))
+            estimate = calc.equity(['AA', 'KK'], 'Ks7d2c', hero_only=True, tolerance=0.01)
+            self.assertLessEqual(estimate.stderr, 0.01)
+            self.assertEqual(oo.pqls, [])
+            self.assertEqual(calc.equity(['AA', '30%'], 'Ks7d2c', hero_only=True), 0.25)
+            processes = list(calc.executor.pool._processes.values())
+        self.assertTrue(processes)
+        self.assertFalse(any(process.is_alive() for process in processes))
+
+    def test_close(self):
+        calc = Calc(FakeOddsOracle(trials=20000, seconds=10), monte_carlo=True, workers=2)
+        first = calc.equity(['AA', 'KK'], 'Ks7d2c')
+        processes = list(calc.executor.pool._processes.values())
+        calc.close()
+        self.assertFalse(any(process.is_alive() for process in processes))
+        # Processes are started again
+        self.assertEqual(len(calc.equity(['AA', 'KK'], 'Ks7d2c')), len(first))
+        calc.close()
+        calc.close()
+
+    def test_no_workers(self):
+        with Calc(FakeOddsOracle(trials=20000, seconds=10), monte_carlo=True) as calc:
+            self.assertIsNone(calc.executor)
+
+
+if __name__ == '__main__':
+    unittest.main()
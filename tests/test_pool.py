@@ -0,0 +1,61 @@
+import unittest
+
+from ploev.ppt import OddsOraclePool, PqlResult
+from tests.xmlrpc_fixture import FixedAnswerServer, closed_port
+
+
+class OddsOraclePoolTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FixedAnswerServer().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def test_endpoints(self):
+        pool = OddsOraclePool(['localhost:40000', ('otherhost', 40001)], connect=False)
+        self.assertEqual([(e.host, e.port) for e in pool.endpoints], [('localhost', '40000'), ('otherhost', '40001')])
+        self.assertRaises(ValueError, OddsOraclePool, [], connect=False)
+
+    def test_merge_samples(self):
+        pool = OddsOraclePool([('localhost', self.server.port)], trials=1000, seconds=1, merge_samples=True)
+        self.server.requested_trials.clear()
+        pql = "select avg(riverEquity(hero)) as EQ from game='omahahi', syntax='generic', hero='AA', villain='KK'"
+        pool.pql(pql)
+        self.assertEqual(pool.pql(pql, trials=3000).values['EQ'], 0.5)
+        # The server answers with 100 trials, so only the missing 2900 trials are requested
+        self.assertEqual(self.server.requested_trials, [1000, 2900])
+
+    def test_compact(self):
+        pql = "select avg(riverEquity(hero)) as EQ from game='omahahi', syntax='generic', hero='((AA))'"
+        for compact, sent in ((True, "hero='AA'"), (False, "hero='((AA))'")):
+            pool = OddsOraclePool([('localhost', self.server.port)], trials=100, seconds=1, compact=compact)
+            self.assertEqual(pool.compact, compact)
+            pool.pql(pql)
+            self.assertIn(sent, self.server.pqls[-1])
+
+    def test_least_loaded(self):
+        pool = OddsOraclePool(['localhost:1', 'localhost:2'], connect=False)
+        pool.endpoints[0].in_flight = 2
+        self.assertIs(pool._choose_endpoint([]), pool.endpoints[1])
+        self.assertIs(pool._choose_endpoint([pool.endpoints[1]]), pool.endpoints[0])
+
+    def test_failed_endpoint_out_of_rotation(self):
+        pool = OddsOraclePool([('localhost', closed_port()), ('localhost', self.server.port)], trials=100, seconds=1)
+        self.assertEqual(len(pool.healthy_endpoints()), 1)
+        calls = self.server.calls
+        result = pool.pql('select avg(riverEquity(hero)) as EQ from hero=AA')
+        self.assertEqual(result.results_dict['EQ'][PqlResult.PERCENTAGE], 0.5)
+        self.assertEqual(pool.equity(('AA', 'KK')), [0.5, 0.5])
+        self.assertEqual(self.server.calls, calls + 2)
+
+    def test_all_failed(self):
+        pool = OddsOraclePool([('localhost', closed_port())], connect=False)
+        self.assertRaises(ConnectionError, pool.pql, 'select avg(riverEquity(hero)) as EQ')
+        self.assertEqual(pool.healthy_endpoints(), [])
+
+    def test_run_server(self):
+        pool = OddsOraclePool([('localhost', closed_port())], connect=False)
+        self.assertRaises(ConnectionError, pool.run_server)
+        self.assertRaises(ConnectionError, pool.get_client)
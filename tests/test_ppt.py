@@ -118,6 +118,20 @@ class PqlResultTest(unittest.TestCase):
         self.assertEqual(pql_result.results_dict['ACES_EQUITY'],
                          {'name': 'ACES_EQUITY', 'percentage': 0.847, })
 
+    def test_mixed_result(self):
+        result = """
+        S0 = 0.5123
+        S1 = 10.0000% (10)
+        S2 = [0:50.0000% (50)],[1:50.0000% (50)]
+        100 trials
+        """
+        pql_result = PqlResult(result)
+        self.assertEqual(pql_result.trials, 100)
+        self.assertEqual([r[PqlResult.NAME] for r in pql_result.results_list], ['S0', 'S1', 'S2'])
+        self.assertEqual(pql_result.results_dict['S0'][PqlResult.PERCENTAGE], 0.512)
+        self.assertEqual(pql_result.results_dict['S1'][PqlResult.COUNTS], 10)
+        self.assertEqual(pql_result.results_dict['S2'][PqlResult.HISTOGRAM]['1'][PqlResult.COUNTS], 50)
+
     def test_histogram_fraction_result(self):
         result = """
         EQUITY_FRACTION = [0:32.2367% (9671)],[1/4:0.0133% (4)],[1/2:38.0700% (11421)],[3/4:0.0033% (1)],[1:29.6767% (8903)]
@@ -0,0 +1,103 @@
+import os
+import tempfile
+import time
+import unittest
+
+from ploev.cache import MemoryCache
+from ploev.calc import Calc
+from ploev.ppt import OddsOracle, Pql, PqlError, ReplayError, ReplayOddsOracle
+from ploev.recording import Recorder, read_recording
+from tests.xmlrpc_fixture import FixedAnswerServer, MulticallServer
+
+_ANSWER = 'S0 = 10.0000% (10)\nS1 = 20.0000% (20)\nEQ = 0.5\n100 trials\n'
+
+
+class RecorderTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'traffic.jsonl.gz')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_record_and_read(self):
+        with Recorder(self.path) as recorder:
+            recorder.record('PPTServer.executePQL', ('la-la', 100, 1, 1), 'EQ = 0.5\n', 0.25)
+            recorder.record('system.multicall', ([],), fault=(1, 'la-la'))
+        with Recorder(self.path) as recorder:
+            recorder.record('PPTServer.executePQL', ('la-la', 100, 1, 1), 'EQ = 0.6\n', 0.5)
+        calls = read_recording(self.path)
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(calls[0].params, ('la-la', 100, 1, 1))
+        self.assertEqual(calls[0].response, 'EQ = 0.5\n')
+        self.assertEqual(calls[1].fault, (1, 'la-la'))
+        self.assertEqual(calls[2].seconds, 0.5)
+
+
+class RecordAndReplayTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'traffic.jsonl.gz')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _record(self, server):
+        oo = OddsOracle(port=server.port, trials=100, seconds=1, threads=1, connect=False, cache=MemoryCache())
+        with oo.recording(self.path) as recorder:
+            results = self._run(oo)
+        server.stop()
+        self.assertIsNone(oo.recorder)
+        return results, recorder
+
+    @staticmethod
+    def _run(odds_oracle):
+        calc = Calc(odds_oracle)
+        pql = Pql(odds_oracle)
+        return (pql.hero_equity('AA', ['KK'], 'Ks7d2c'),
+                calc.equity(['AA', 'KK', 'QQ']),
+                calc.range_distribution('AA,KK', ['AA', 'KK'], 'Ks7d2c', equity=False))
+
+    def _replay(self, **kwargs):
+        return ReplayOddsOracle(self.path, trials=100, seconds=1, threads=1, cache=MemoryCache(), **kwargs)
+
+    def test_replay(self):
+        results, recorder = self._record(FixedAnswerServer(pql_result=_ANSWER).start())
+        self.assertEqual(recorder.calls, len(read_recording(self.path)))
+        replay = self._replay()
+        self.assertEqual(self._run(replay), results)
+        self.assertEqual(replay.missed, 0)
+
+    def test_replay_of_multicall(self):
+        results, _ = self._record(MulticallServer(pql_result=_ANSWER).start())
+        self.assertNotIn('system.multicall', [call.method for call in read_recording(self.path)])
+        self.assertEqual(self._run(self._replay()), results)
+
+    def test_missed_call_and_errors(self):
+        server = FixedAnswerServer(pql_result='ERROR: la-la').start()
+        oo = OddsOracle(port=server.port, trials=100, seconds=1, threads=1, connect=False, cache=MemoryCache())
+        with oo.recording(self.path):
+            with self.assertRaises(PqlError):
+                oo.pql('la-la')
+        server.stop()
+        replay = self._replay()
+        with self.assertRaises(PqlError):
+            replay.pql('la-la')
+        with self.assertRaises(ReplayError):
+            replay.pql('bla-bla')
+        self.assertEqual(replay.missed, 1)
+
+    def test_no_server(self):
+        with Recorder(self.path):
+            pass
+        replay = self._replay()
+        self.assertIsNone(replay.get_client())
+        self.assertRaises(TypeError, replay.run_server)
+
+    def test_latency(self):
+        with Recorder(self.path) as recorder:
+            recorder.record('PPTServer.executePQL', ('la-la', 100, 1, 1), 'EQ = 0.5\n100 trials\n', 0.2)
+        replay = self._replay(latency_scale=0.5)
+        started = time.perf_counter()
+        replay.pql('la-la')
+        self.assertGreaterEqual(time.perf_counter() - started, 0.1)
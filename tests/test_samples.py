@@ -0,0 +1,80 @@
+import unittest
+
+from ploev.cache import MemoryCache
+from ploev.ppt import OddsOracle, Pql, PqlResult, merge_pql_results
+from ploev.samples import is_mergeable_pql, merge_equity_results, sample_trials
+from tests.xmlrpc_fixture import FixedAnswerServer
+
+
+class SamplesTest(unittest.TestCase):
+    def test_is_mergeable_pql(self):
+        self.assertTrue(is_mergeable_pql("select avg(riverEquity(hero)) as EQ, count(inRange(villain, 'AA,KK')) "
+                                         "as S0 from game='omahahi', hero='AA'"))
+        self.assertFalse(is_mergeable_pql("select histogram(hero, handType(hero, flop)) from game='omahahi'"))
+        self.assertFalse(is_mergeable_pql('la-la'))
+
+    def test_sample_trials(self):
+        self.assertEqual(sample_trials('EQ = 0.5\n1000 trials\n'), 1000)
+        self.assertEqual(sample_trials('AA = 81.50% (815)\nKK = 18.50% (185)\n'), 1000)
+        self.assertIsNone(sample_trials('la-la'))
+
+    def test_merge_pql_results(self):
+        merged = merge_pql_results('EQ = 0.6\nS0 = 10.0000% (100)\n1000 trials\n',
+                                   'EQ = 0.4\nS0 = 30.0000% (900)\n3000 trials\n')
+        result = PqlResult(merged)
+        self.assertEqual(result.trials, 4000)
+        self.assertAlmostEqual(result.values['EQ'], 0.45)
+        self.assertAlmostEqual(result.values['S0'], 0.25)
+        self.assertEqual(result.results_dict['S0'][PqlResult.COUNTS], 1000)
+        with self.assertRaises(ValueError):
+            merge_pql_results('EQ = 0.6\n1000 trials\n', 'EV = 0.4\n3000 trials\n')
+        with self.assertRaises(ValueError):
+            merge_pql_results(None, 'HIST = [0:50.0000% (5)],[1:50.0000% (5)]\n10 trials\n')
+
+    def test_merge_equity_results(self):
+        first = merge_equity_results(None, 'AA = 80.00% (800)\nKK = 20.00% (200)\n')
+        self.assertEqual(sample_trials(first), 1000)
+        merged = merge_equity_results(first, 'AA = 84.00% (840)\nKK = 16.00% (160)\n')
+        self.assertEqual(OddsOracle._parse_equity_result(merged), [0.82, 0.18])
+        self.assertEqual(sample_trials(merged), 2000)
+
+
+class MergeSamplesTest(unittest.TestCase):
+    def setUp(self):
+        self.server = FixedAnswerServer(pql_result=self._pql_answer).start()
+        self.oo = OddsOracle(port=self.server.port, trials=1000, seconds=1, connect=False, cache=MemoryCache(),
+                             merge_samples=True)
+        self.server.requested_trials.clear()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def _pql_answer(self, pql):
+        trials = self.server.requested_trials[-1]
+        # The first 1000 trials give 0.6, later trials give 0.4
+        return 'EQ = {}\n{} trials\n'.format(0.6 if trials == 1000 else 0.4, trials)
+
+    def test_pql_is_refined(self):
+        pql = "select avg(riverEquity(hero)) as EQ from game='omahahi', syntax='generic', hero='AA', villain='KK'"
+        self.assertAlmostEqual(self.oo.pql(pql).values['EQ'], 0.6)
+        result = self.oo.pql(pql, trials=4000)
+        self.assertEqual(result.trials, 4000)
+        self.assertAlmostEqual(result.values['EQ'], 0.45)
+        self.assertAlmostEqual(self.oo.pql(pql, trials=2000).values['EQ'], 0.45)
+        self.assertEqual(self.server.requested_trials, [1000, 3000])
+
+    def test_equity_is_refined(self):
+        self.server.equity_result = 'AA = 80.00% (800)\nKK = 20.00% (200)\n'
+        self.assertEqual(self.oo.equity(('AA', 'KK')), [0.8, 0.2])
+        self.server.equity_result = 'AA = 84.00% (840)\nKK = 16.00% (160)\n'
+        self.oo.trials = 2000
+        self.assertEqual(self.oo.equity(('AA', 'KK')), [0.82, 0.18])
+        self.assertEqual(self.server.requested_trials, [1000, 1000])
+
+    def test_adaptive(self):
+        estimate = Pql(self.oo).adaptive_hero_equity('AA', ['KK'], tolerance=0.01, initial_trials=1000,
+                                                     max_trials=100000)
+        # 0.6 * 0.4 / 0.01 ** 2 = 2400 trials are needed after the first run, then total trials are doubled
+        self.assertEqual(estimate.trials, 4800)
+        self.assertLessEqual(estimate.stderr, 0.01)
+        self.assertEqual(self.server.requested_trials, [1000, 1400, 2400])
@@ -0,0 +1,105 @@
+import unittest
+
+from ploev.calc import Calc
+from ploev.ppt import OddsOracle, Pql, PqlError, PqlCardInMoreThanOnePlaceError, \
+    ComputeEquityCardInMoreThanOnePlaceError
+from ploev.server import PPTServer, PqlQuery, SimulationError
+
+
+class PqlQueryTest(unittest.TestCase):
+    def test_parse(self):
+        query = PqlQuery("select avg(riverEquity(hero)) as EQ,\n\tcount(inRange(player_1,'AA,(KK)')) \n"
+                         "from game='omahahi', syntax='generic',\n\tboard='Js7s2c',\n\thero='AA',\n\tplayer_1='*'")
+        self.assertEqual(query.players, [('hero', 'AA'), ('player_1', '*')])
+        self.assertEqual(query.clauses['board'], 'Js7s2c')
+        self.assertEqual(query.selectors, [('EQ', 'avg', 'riverequity', 'hero', None),
+                                           ('COUNT 2', 'count', 'inrange', 'player_1', 'AA,(KK)')])
+
+    def test_parse_histogram(self):
+        query = PqlQuery("select histogram(hero, equity(hero, Flop)) as HIST, "
+                         "histogram(player_1, fractionalRiverEquity(player_1)) from hero='AA', player_1='KK'")
+        self.assertEqual(query.selectors, [('HIST', 'histogram', 'equity', 'hero', 'flop'),
+                                           ('HISTOGRAM 2', 'histogram', 'fractionalriverequity', 'player_1', None)])
+
+    def test_case_insensitive(self):
+        query = PqlQuery("select count(inRange(PLAYER_1,'AA')) from game='OmahaHi', syntax='Generic', "
+                         "PLAYER_1='10%', Player_2='Qs Ts Jd 2d'")
+        self.assertEqual(query.players, [('player_1', '10%'), ('player_2', 'Qs Ts Jd 2d')])
+        self.assertEqual(query.selectors, [('COUNT 1', 'count', 'inrange', 'player_1', 'AA')])
+
+    def test_not_supported(self):
+        for pql in ["select max(riverEquity(hero)) from hero='AA'",
+                    "select histogram(hero, equity(player_1, flop)) from hero='AA', player_1='KK'",
+                    "select histogram(hero, equity(hero, street)) from hero='AA'",
+                    "select avg(riverEquity(hero)) from game='holdem', hero='AA'",
+                    "la-la"]:
+            with self.assertRaises(SimulationError):
+                PqlQuery(pql)
+
+
+class PPTServerTest(unittest.TestCase):
+    def setUp(self):
+        self.server = PPTServer(seed=1).start()
+        self.oo = OddsOracle(port=self.server.port, trials=300, seconds=10, connect=False)
+        self.oo.get_client()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_equity(self):
+        equities = self.oo.equity(('AsAh', 'KsKh'), 'Ad7c2h')
+        self.assertEqual(len(equities), 2)
+        self.assertAlmostEqual(sum(equities), 1, places=2)
+        self.assertGreater(equities[0], 0.8)
+
+    def test_generated_queries(self):
+        # As in tests of OddsOracle: spaces in hands, syntax 'Generic' and upper case players
+        oo = OddsOracle(port=self.server.port, trials=300, seconds=10, syntax='Generic', connect=False)
+        self.assertGreater(Pql(oo).hero_equity('Qs Ts Jd 2d', ['AA'], 'Ad Ks 3s'), 0.2)
+        self.assertEqual(len(oo.equity(('Qs Ts Jd 2d', 'AA'), 'Ad Ks 3s')), 2)
+        result = oo.pql("select count(inRange(PLAYER_1,'AA')) from game='omahahi', syntax='Generic', "
+                        "board='Ad Ks 3s', PLAYER_1='10%', PLAYER_2='Qs Ts Jd 2d'")
+        self.assertGreater(result.results_list[0]['percentage'], 0)
+
+    def test_river_is_exact(self):
+        pql = Pql(self.oo)
+        self.assertEqual(pql.hero_equity('AsAh2c3d', ['KsKh4c5d'], board='Ad7c2hTs9s'), 1)
+        self.assertEqual(pql.hero_equity('AsAh2c3d', ['AcAd4c5h'], board='Kd7c2hTs9s'), 0.5)
+
+    def test_count_in_range(self):
+        pql = Pql(self.oo)
+        fractions = pql.count_in_range('AA,KK', ['AA', '*'], board='Js7s2c')
+        self.assertEqual(fractions[1], 1)
+        self.assertGreater(fractions[0], 0.3)
+
+    def test_equity_histogram(self):
+        pql = Pql(self.oo)
+        self.assertEqual(pql.equity_histogram('AsAh2c3d', ['AcAd4c5h'], 'Kd7c2hTs9s', buckets=4), [0, 0, 1, 0])
+        # 80% on the turn, all runouts are enumerated
+        self.assertEqual(pql.equity_histogram('AsAh2c3d', ['KsKh8c9d'], 'Ad7c2hTs')[8], 1)
+        with self.assertRaises(PqlError):
+            pql.equity_histogram('AsAh2c3d', ['KK'])
+        with self.assertRaises(ValueError):
+            pql.equity_histogram('AsAh2c3d', ['KK'], 'Ad7c')
+
+    def test_errors(self):
+        with self.assertRaises(PqlCardInMoreThanOnePlaceError):
+            Pql(self.oo).hero_equity('AsAh', ['KK'], board='As7c2h')
+        with self.assertRaises(PqlError):
+            Pql(self.oo).hero_equity('ZZ', ['KK'])
+        with self.assertRaises(ComputeEquityCardInMoreThanOnePlaceError):
+            self.oo.equity(('AsAh', 'AsKh'))
+
+    def test_batch(self):
+        with self.oo.batch() as batch:
+            first = batch.equity(('AA', 'KK'), 'Js7s2c')
+            second = batch.equity(('QQ', 'KK'), 'Js7s2c')
+        self.assertTrue(self.oo._multicall_supported)
+        self.assertEqual(len(first.result()), 2)
+        self.assertEqual(len(second.result()), 2)
+
+    def test_calc(self):
+        calc = Calc(self.oo)
+        distribution = calc.range_distribution('*', ['AA', '*'], 'Js7s2c', players=['KK'])
+        self.assertEqual(len(distribution), 2)
+        self.assertAlmostEqual(sum(sub_range.fraction for sub_range in distribution), 1, places=2)
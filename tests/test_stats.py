@@ -0,0 +1,99 @@
+import unittest
+from unittest import mock
+
+from ploev.cache import MemoryCache
+from ploev.calc import Calc
+from ploev.ppt import OddsOracle, Pql, PqlError
+from ploev.stats import QueryStats, find_caller
+from tests.xmlrpc_fixture import FixedAnswerServer
+
+
+class QueryStatsTest(unittest.TestCase):
+    def test_record(self):
+        stats = QueryStats(track_callers=True)
+        stats.record('pql', 'a', hit=False, server_seconds=0.2, response_bytes=10, parse_seconds=0.001)
+        stats.record('pql', 'a', hit=True, response_bytes=10)
+        stats.record('pql', 'b', hit=False, server_seconds=3, error=True)
+        snapshot = stats.snapshot()
+        pql = snapshot['by_kind']['pql']
+        self.assertEqual((pql['calls'], pql['hits'], pql['misses'], pql['errors']), (3, 1, 2, 1))
+        self.assertEqual(pql['response_bytes'], 20)
+        self.assertAlmostEqual(pql['server_seconds'], 3.2)
+        self.assertEqual(pql['latency_histogram'][0.5], 1)
+        self.assertEqual(pql['latency_histogram'][5.0], 1)
+        self.assertEqual(snapshot['by_caller'][('pql', 'a')]['calls'], 2)
+        stats.reset()
+        self.assertEqual(stats.snapshot()['by_kind'], {})
+
+    def test_slow_queries(self):
+        stats = QueryStats(slow_query_seconds=1)
+        stats.record('pql', 'a', hit=False, server_seconds=0.5, query='fast')
+        with self.assertLogs('ppt.QueryStats', 'WARNING'):
+            stats.record('pql', 'a', hit=False, server_seconds=1.5, query='slow')
+        self.assertEqual([query.query for query in stats.snapshot()['slow_queries']], ['slow'])
+
+    def test_find_caller(self):
+        class Plumbing:
+            def query(self):
+                return find_caller((Plumbing,), depth=1)
+
+        def api():
+            return Plumbing().query()
+
+        self.assertEqual(api(), 'QueryStatsTest.test_find_caller.<locals>.api')
+
+
+class OddsOracleStatsTest(unittest.TestCase):
+    def setUp(self):
+        self.server = FixedAnswerServer().start()
+        self.oo = OddsOracle(port=self.server.port, trials=100, seconds=1, connect=False, cache=MemoryCache())
+        self.oo.get_client()
+        self.oo.query_stats.track_callers = True
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_callers(self):
+        pql = Pql(self.oo)
+        pql.hero_equity('AA', ['KK'])
+        pql.hero_equity('AA', ['KK'])
+        Calc(self.oo).equity(['AA', 'KK'])
+        by_caller = self.oo.stats()['by_caller']
+        hero_equity = by_caller[('pql', 'OddsOracleStatsTest.test_callers > Pql.hero_equity')]
+        self.assertEqual((hero_equity['calls'], hero_equity['hits'], hero_equity['misses']), (2, 1, 1))
+        self.assertGreater(hero_equity['response_bytes'], 0)
+        self.assertEqual(by_caller[('equity', 'OddsOracleStatsTest.test_callers > Pql.equity')]['misses'], 1)
+        self.oo.reset_stats()
+        self.assertEqual(self.oo.stats()['by_caller'], {})
+
+    def test_batch(self):
+        self.server.pql_result = 'S0 = 10.0000% (10)\n100 trials\n'
+        Calc(self.oo).range_distribution('AA,KK', ['AA'], 'Ks7d2c', equity=False)
+        by_caller = self.oo.stats()['by_caller']
+        self.assertEqual(list(by_caller), [('pql', 'OddsOracleStatsTest.test_batch > Calc.range_distribution')])
+
+    def test_callers_not_tracked(self):
+        self.oo.query_stats.track_callers = False
+        pql = Pql(self.oo)
+        with mock.patch('ploev.ppt.find_caller') as find_caller_:
+            pql.hero_equity('AA', ['KK'])
+            pql.hero_equity('AA', ['KK'])
+        find_caller_.assert_not_called()
+        stats = self.oo.stats()
+        self.assertEqual(stats['by_caller'], {})
+        self.assertEqual(stats['by_kind']['pql']['hits'], 1)
+        self.oo.query_stats.slow_query_seconds = 0
+        with self.assertLogs('ppt.QueryStats', 'WARNING'):
+            pql.hero_equity('AA', ['QQ'])
+        self.assertEqual(self.oo.stats()['slow_queries'][0].caller,
+                         'OddsOracleStatsTest.test_callers_not_tracked > Pql.hero_equity')
+
+    def test_errors_and_slow_queries(self):
+        self.server.pql_result = 'ERROR: la-la'
+        self.oo.query_stats.slow_query_seconds = 0
+        with self.assertLogs('ppt.QueryStats', 'WARNING'):
+            with self.assertRaises(PqlError):
+                self.oo.pql('la-la')
+        stats = self.oo.stats()
+        self.assertEqual(stats['by_kind']['pql']['errors'], 1)
+        self.assertEqual(stats['slow_queries'][0].query, 'la-la')
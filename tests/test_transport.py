@@ -0,0 +1,146 @@
+import asyncio
+import unittest
+import xmlrpc.client
+from xmlrpc.server import SimpleXMLRPCRequestHandler
+
+from ploev.async_ppt import AsyncOddsOracle
+from ploev.cache import MemoryCache
+from ploev.ppt import OddsOracle, OddsOraclePool
+from ploev.transport import KeepAliveTransport, TransportStats
+from tests.xmlrpc_fixture import FixedAnswerServer
+
+_RANGE = ','.join('{}{}{}{}'.format(first, second, third, suit)
+                  for first in 'AKQJT' for second in '98765' for third in '432' for suit in 'shd')
+_LONG_RESULT = 'EQ = 0.5\n' * 500 + '100 trials\n'
+
+
+class KeepAliveTransportTest(unittest.TestCase):
+    def test_connection_is_reused(self):
+        server = FixedAnswerServer(keep_alive=True).start()
+        stats = TransportStats()
+        client = xmlrpc.client.ServerProxy('http://localhost:{}/xmlrpc'.format(server.port),
+                                           transport=KeepAliveTransport(timeout=5, stats=stats))
+        for _ in range(3):
+            self.assertEqual(client.PPTServer.executePQL('', 10, 1, 1), 'EQ = 0.5\n100 trials\n')
+        client('close')()
+        server.stop()
+        snapshot = stats.snapshot()
+        self.assertEqual((snapshot['requests'], snapshot['connections'], snapshot['errors']), (3, 1, 0))
+        self.assertGreater(snapshot['bytes_sent'], 0)
+        self.assertGreater(snapshot['bytes_received'], 0)
+
+    def test_gzip(self):
+        server = FixedAnswerServer(pql_result=_LONG_RESULT).start()
+        url = 'http://localhost:{}/xmlrpc'.format(server.port)
+        plain, encoded = TransportStats(), TransportStats()
+        for threshold, stats in ((None, plain), (1000, encoded)):
+            client = xmlrpc.client.ServerProxy(url, transport=KeepAliveTransport(gzip_threshold=threshold,
+                                                                                 stats=stats))
+            self.assertEqual(client.PPTServer.executePQL("player_1='{}'".format(_RANGE), 10, 1, 1), _LONG_RESULT)
+        server.stop()
+        self.assertEqual(server.pqls[0], server.pqls[1])
+        self.assertLess(encoded.snapshot()['bytes_sent'] * 2, plain.snapshot()['bytes_sent'])
+        # Long responses are encoded by the server
+        self.assertLess(plain.snapshot()['bytes_received'] * 3, len(_LONG_RESULT))
+
+    def test_refused_gzip(self):
+        server = FixedAnswerServer()
+        server._server.RequestHandlerClass = type('NoGzipHandler', (SimpleXMLRPCRequestHandler,),
+                                                  {'rpc_paths': ('/xmlrpc',),
+                                                   'decode_request_content': self._refuse_gzip})
+        server.start()
+        transport = KeepAliveTransport(gzip_threshold=10)
+        client = xmlrpc.client.ServerProxy('http://localhost:{}/xmlrpc'.format(server.port), transport=transport)
+        self.assertEqual(client.PPTServer.executePQL(_RANGE, 10, 1, 1), 'EQ = 0.5\n100 trials\n')
+        server.stop()
+        self.assertIsNone(transport.gzip_threshold)
+        self.assertEqual((transport.stats.snapshot()['requests'], transport.stats.snapshot()['errors']), (2, 1))
+
+    @staticmethod
+    def _refuse_gzip(handler, data):
+        if handler.headers.get('content-encoding', 'identity').lower() != 'identity':
+            handler.send_response(415, 'Unsupported Content-Encoding')
+            handler.send_header('Content-length', '0')
+            handler.end_headers()
+            return None
+        return data
+
+    def test_timeout(self):
+        server = FixedAnswerServer(delay=1).start()
+        client = xmlrpc.client.ServerProxy('http://localhost:{}/xmlrpc'.format(server.port),
+                                           transport=KeepAliveTransport(timeout=0.1))
+        with self.assertRaises(TimeoutError):
+            client.PPTServer.executePQL('', 10, 1, 1)
+        server.stop()
+
+
+class OddsOracleTransportTest(unittest.TestCase):
+    def test_stats(self):
+        server = FixedAnswerServer(keep_alive=True).start()
+        oo = OddsOracle(port=server.port, trials=100, seconds=1, connect=False, cache=MemoryCache(), timeout=5,
+                        gzip_threshold=1000)
+        oo.pql("select avg(riverEquity(hero)) as EQ from game='omahahi', player_1='{}'".format(_RANGE))
+        oo.pql('select avg(riverEquity(hero)) as EQ from board=Ks7d2c')
+        transport = oo.stats()['transport']
+        self.assertEqual((transport['requests'], transport['connections']), (2, 1))
+        oo.reset_stats()
+        self.assertEqual(oo.stats()['transport']['requests'], 0)
+        server.stop()
+
+    def test_pool(self):
+        server = FixedAnswerServer().start()
+        pool = OddsOraclePool(['localhost:{}'.format(server.port)], trials=100, seconds=1, connect=False,
+                              cache=MemoryCache(), timeout=5)
+        pool.pql('select avg(riverEquity(hero)) as EQ from board=Ks7d2c')
+        server.stop()
+        self.assertEqual(pool.stats()['transport']['requests'], 1)
+
+
+class AsyncOddsOracleTransportTest(unittest.TestCase):
+    @staticmethod
+    def _run(odds_oracle, *pqls):
+        async def run():
+            try:
+                return [await odds_oracle.pql(pql) for pql in pqls]
+            finally:
+                await odds_oracle.close()
+
+        return asyncio.run(run())
+
+    def test_stats_and_gzip(self):
+        server = FixedAnswerServer(pql_result=_LONG_RESULT, keep_alive=True).start()
+        pql = "select avg(riverEquity(hero)) as EQ from game='omahahi', player_1='{}'".format(_RANGE)
+        sent = []
+        for threshold in (None, 1000):
+            oo = AsyncOddsOracle(port=server.port, trials=100, seconds=1, cache=MemoryCache(),
+                                 gzip_threshold=threshold)
+            results = self._run(oo, pql, pql.replace('player_1', 'player_2'))
+            self.assertEqual([result.values['EQ'] for result in results], [0.5, 0.5])
+            transport = oo.stats()['transport']
+            self.assertEqual((transport['requests'], transport['connections'], transport['errors']), (2, 1, 0))
+            # Long responses are encoded by the server
+            self.assertLess(transport['bytes_received'] * 3, len(_LONG_RESULT) * 2)
+            sent.append(transport['bytes_sent'])
+        server.stop()
+        self.assertEqual(server.pqls[0], server.pqls[2])
+        self.assertLess(sent[1] * 2, sent[0])
+
+    def test_refused_gzip(self):
+        server = FixedAnswerServer()
+        server._server.RequestHandlerClass = type('NoGzipHandler', (SimpleXMLRPCRequestHandler,),
+                                                  {'rpc_paths': ('/xmlrpc',),
+                                                   'decode_request_content': KeepAliveTransportTest._refuse_gzip})
+        server.start()
+        oo = AsyncOddsOracle(port=server.port, trials=100, seconds=1, cache=MemoryCache(), gzip_threshold=10)
+        self.assertEqual(self._run(oo, _RANGE)[0].values['EQ'], 0.5)
+        server.stop()
+        self.assertIsNone(oo.gzip_threshold)
+        self.assertEqual((oo.stats()['transport']['requests'], oo.stats()['transport']['errors']), (2, 1))
+
+    def test_timeout(self):
+        server = FixedAnswerServer(delay=1).start()
+        oo = AsyncOddsOracle(port=server.port, trials=100, seconds=1, cache=MemoryCache(), timeout=0.1)
+        with self.assertRaises(TimeoutError):
+            self._run(oo, 'select avg(riverEquity(hero)) as EQ from board=Ks7d2c')
+        server.stop()
+        self.assertEqual(oo.stats()['transport']['errors'], 1)
@@ -0,0 +1,124 @@
+""" Simple xmlrpc server with PPTServer interface answering fixed results, and OddsOracle doing the same without it """
+
+import socketserver
+import threading
+import time
+from xmlrpc.server import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+
+from ploev.ppt import OddsOracle
+
+
+class _RequestHandler(SimpleXMLRPCRequestHandler):
+    rpc_paths = ('/xmlrpc',)
+
+
+class _KeepAliveRequestHandler(_RequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+
+class _ThreadingXMLRPCServer(socketserver.ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+
+
+class FixedAnswerServer:
+    """ Answers every executePQL with pql_result and every computeEquityAuto with equity_result
+
+    pql_result can be a function returning result for a query. With keep_alive connections aren't closed after
+    responses (HTTP/1.1).
+    """
+
+    def __init__(self, pql_result='EQ = 0.5\n100 trials\n', equity_result=None, delay=0.0, keep_alive=False):
+        self.pql_result = pql_result
+        self.equity_result = equity_result
+        self.delay = delay
+        self.calls = 0
+        self.pqls = []
+        self.requested_trials = []
+        self.max_concurrent = 0
+        self._concurrent = 0
+        self._lock = threading.Lock()
+        handler = _KeepAliveRequestHandler if keep_alive else _RequestHandler
+        self._server = _ThreadingXMLRPCServer(('localhost', 0), requestHandler=handler, logRequests=False)
+        self._server.register_function(self.execute_pql, 'PPTServer.executePQL')
+        self._server.register_function(self.compute_equity_auto, 'PPTServer.computeEquityAuto')
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def _answer(self, answer):
+        with self._lock:
+            self.calls += 1
+            self._concurrent += 1
+            self.max_concurrent = max(self.max_concurrent, self._concurrent)
+        time.sleep(self.delay)
+        with self._lock:
+            self._concurrent -= 1
+        return answer
+
+    def execute_pql(self, pql, trials, seconds, threads):
+        self.pqls.append(pql)
+        self.requested_trials.append(trials)
+        if callable(self.pql_result):
+            return self._answer(self.pql_result(pql))
+        return self._answer(self.pql_result)
+
+    def compute_equity_auto(self, game, board, dead, syntax, hands, trials, seconds, threads):
+        self.requested_trials.append(trials)
+        if self.equity_result is None:
+            equity_result = ''.join('{} = {:.2f}% (1)\n'.format(hand, 100 / len(hands)) for hand in hands)
+        else:
+            equity_result = self.equity_result
+        return self._answer(equity_result)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def closed_port():
+    """ Returns port nobody listens """
+    server = SimpleXMLRPCServer(('localhost', 0), logRequests=False)
+    port = server.server_address[1]
+    server.server_close()
+    return port
+
+
+class MulticallServer(FixedAnswerServer):
+    """ FixedAnswerServer supporting system.multicall """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._server.register_multicall_functions()
+        self.multicalls = 0
+        self._server.register_function(self._count_multicall, 'system.multicall')
+
+    def _count_multicall(self, calls):
+        self.multicalls += 1
+        return self._server.system_multicall(calls)
+
+
+class FakeOddsOracle(OddsOracle):
+    """ Answers every PQL query with pql_result without a server and remembers queries
+
+    pql_result can be a function returning result for a query and its trials.
+    """
+
+    def __init__(self, pql_result='EQ = 0.25\n1000 trials\n', trials=1000, seconds=1):
+        super().__init__(trials=trials, seconds=seconds, connect=False)
+        self.pql_result = pql_result
+        self.pqls = []
+        self.requested_trials = []
+
+    def _execute_pql(self, pql, trials=None, seconds=None):
+        self.pqls.append(pql)
+        self.requested_trials.append(trials)
+        if callable(self.pql_result):
+            return self.pql_result(pql, trials)
+        return self.pql_result